@@ -13,7 +13,8 @@ import sys
 
 from backend.core.config import get_settings
 from backend.models.schemas import HealthResponse
-from backend.api.routes import chat, predictions, data
+from backend.api.routes import chat, predictions, data, metrics
+from backend.services.openai_client import close_openai_clients
 
 # Configure logging
 logger.remove()
@@ -103,6 +104,13 @@ async def log_requests(request: Request, call_next):
 app.include_router(chat.router)
 app.include_router(predictions.router)
 app.include_router(data.router)
+app.include_router(metrics.router)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled OpenAI connections"""
+    await close_openai_clients()
 
 
 # Root endpoint
@@ -1,17 +1,28 @@
 """
 Chat endpoints for RAG queries
 """
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+from functools import partial
 from loguru import logger
+import json
+import time
 
 from backend.models.schemas import ChatRequest, ChatResponse
+from backend.core.config import get_settings
 from backend.core.rag_engine import RAGEngine
+from backend.services.accounting import get_usage_ledger
+from backend.services.session_store import ConversationSessions, create_session_store
+from backend.utils.metadata import build_where_filter
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 # Initialize RAG engine (will be initialized once)
 rag_engine = None
+conversation_sessions = None
 
 
 def get_rag_engine():
@@ -22,45 +33,110 @@ def get_rag_engine():
     return rag_engine
 
 
+def get_conversation_sessions():
+    """Get or initialize the conversation session store"""
+    global conversation_sessions
+    if conversation_sessions is None:
+        settings = get_settings()
+        conversation_sessions = ConversationSessions(
+            store=create_session_store(),
+            summarize=partial(
+                get_rag_engine().llm_client.summarize_conversation,
+                max_tokens=settings.session_summary_max_tokens
+            ),
+            max_history_tokens=settings.session_history_max_tokens,
+            max_recent_messages=settings.session_recent_messages,
+            max_summary_tokens=settings.session_summary_max_tokens
+        )
+    return conversation_sessions
+
+
+def compact_session(sessions: ConversationSessions, session_id: str, endpoint: str, user_id: str):
+    """
+    Roll a session's older turns into its summary, charging the summary
+    completion to the user whose turn triggered it
+
+    Skipped while the user is over budget; history() still caps the session.
+    """
+    ledger = get_usage_ledger()
+    allowed, _ = ledger.check_budget(user_id)
+    if not allowed:
+        logger.info(f"Deferring compaction of session {session_id}: token budget exhausted")
+        return
+    
+    started = time.time()
+    usage = sessions.compact(session_id)
+    if usage:
+        ledger.record(
+            endpoint, user_id, get_settings().openai_model,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+            latency_seconds=time.time() - started
+        )
+
+
 @router.post("", response_model=ChatResponse)
-async def chat(request: ChatRequest, http_request: Request):
+async def chat(request: ChatRequest, http_request: Request, background_tasks: BackgroundTasks):
     """
     Chat with Sephira using RAG
     
     Process user queries about sentiment data with context-aware responses.
+    With a session_id, earlier turns of the conversation are kept server-side.
     """
     try:
         # Get user ID from request (could be from auth token, session, etc.)
         user_id = http_request.client.host  # Use IP as simple user ID
         
+        ledger = get_usage_ledger()
+        allowed, message = ledger.check_budget(user_id)
+        if not allowed:
+            raise HTTPException(status_code=429, detail=message)
+        
         # Get RAG engine
         engine = get_rag_engine()
         
-        # Build filters if provided
-        filters = None
-        if request.countries or request.start_date or request.end_date:
-            filters = {}
-            # Note: ChromaDB filtering would need proper metadata structure
-            # For now, we'll handle filtering in post-processing
+        # Push country/date filters down into the vector search
+        filters = build_where_filter(
+            countries=request.countries,
+            start_date=request.start_date,
+            end_date=request.end_date
+        )
+        
+        # Token-capped history and running summary of the session
+        history, summary = None, None
+        if request.session_id:
+            sessions = get_conversation_sessions()
+            history, summary = await run_in_threadpool(sessions.history, request.session_id)
         
-        # Query RAG engine
-        result = engine.query(
+        # Query RAG engine without blocking the event loop
+        result = await engine.aquery(
             user_query=request.query,
             user_id=user_id,
             filters=filters,
-            conversation_history=None  # Could store session history
+            conversation_history=history,
+            conversation_summary=summary
         )
         
+        ledger.record_result("/api/chat", user_id, get_settings().openai_model, result, result['processing_time'])
+        
         # Check if blocked
         if result.get('blocked', False):
             raise HTTPException(status_code=403, detail=result['response'])
         
+        if request.session_id:
+            await run_in_threadpool(sessions.append_turn, request.session_id, request.query, result['response'])
+            # Roll older turns into the summary after the response is sent
+            background_tasks.add_task(compact_session, sessions, request.session_id, "/api/chat", user_id)
+        
         return ChatResponse(
             response=result['response'],
             sources=result['sources'],
             query_type=result['query_type'],
             processing_time=result['processing_time'],
-            warning=result.get('warning')
+            warning=result.get('warning'),
+            cached=result.get('cached', False),
+            usage=result.get('usage', {}),
+            timings=result.get('timings')
         )
         
     except HTTPException:
@@ -70,6 +146,84 @@ async def chat(request: ChatRequest, http_request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Streaming chat over Server-Sent Events
+    
+    Each event is a JSON object: the retrieved sources first ("sources"),
+    then the answer as it is generated ("token", with "tool" events while
+    tools run), then a final "done" event with usage and timings. Rejected
+    queries produce a single "error" event.
+    """
+    user_id = http_request.client.host
+    ledger = get_usage_ledger()
+    allowed, message = ledger.check_budget(user_id)
+    if not allowed:
+        raise HTTPException(status_code=429, detail=message)
+    
+    engine = get_rag_engine()
+    filters = build_where_filter(
+        countries=request.countries,
+        start_date=request.start_date,
+        end_date=request.end_date
+    )
+    
+    sessions, history, summary = None, None, None
+    if request.session_id:
+        sessions = get_conversation_sessions()
+        history, summary = await run_in_threadpool(sessions.history, request.session_id)
+    
+    async def events():
+        parts = []
+        started = time.time()
+        # Filled in as the LLM streams, so truncated and aborted answers are charged too
+        usage: dict = {}
+        tool_calls = 0
+        try:
+            async for event in engine.astream_query(
+                user_query=request.query,
+                user_id=user_id,
+                filters=filters,
+                conversation_history=history,
+                conversation_summary=summary,
+                usage=usage
+            ):
+                if event['type'] == 'token':
+                    parts.append(event['content'])
+                elif event['type'] == 'tool':
+                    tool_calls += 1
+                elif event['type'] == 'done' and sessions is not None:
+                    await run_in_threadpool(sessions.append_turn, request.session_id, request.query, "".join(parts))
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {e}")
+            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+        finally:
+            # Also runs when the client disconnects mid-stream; no awaits here
+            ledger.record(
+                "/api/chat/stream", user_id, get_settings().openai_model,
+                prompt_tokens=usage.get('prompt_tokens', 0),
+                completion_tokens=usage.get('completion_tokens', 0),
+                latency_seconds=time.time() - started,
+                tool_calls=tool_calls
+            )
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+        # Roll older turns into the session summary once the stream is done
+        background=BackgroundTask(
+            compact_session, sessions, request.session_id, "/api/chat/stream", user_id
+        ) if sessions is not None else None
+    )
+
+
 @router.get("/stats")
 async def get_stats():
     """Get RAG engine statistics"""
@@ -80,3 +234,10 @@ async def get_stats():
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/sessions/{session_id}")
+async def clear_session(session_id: str):
+    """Forget a conversation session"""
+    await run_in_threadpool(get_conversation_sessions().clear, session_id)
+    return {"session_id": session_id, "cleared": True}
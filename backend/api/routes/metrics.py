@@ -0,0 +1,44 @@
+"""
+Metrics endpoints
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from backend.core.metrics import get_metrics
+from backend.services.accounting import get_usage_ledger
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    RAG query metrics in the Prometheus text format
+    
+    Histograms of per-stage latency, end-to-end query time, token counts and
+    tool calls per query.
+    """
+    return PlainTextResponse(
+        get_metrics().render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.get("/summary")
+async def metrics_summary():
+    """Query counts and mean values per metric, as JSON"""
+    return get_metrics().summary()
+
+
+@router.get("/usage")
+async def usage_summary(window_seconds: int = 3600, group_by: str = "endpoint"):
+    """
+    Tokens, estimated cost, tool calls and latency of LLM-backed requests
+    
+    Aggregated over the last window_seconds, grouped by endpoint, user
+    (hashed) or model.
+    """
+    try:
+        return get_usage_ledger().summary(window_seconds=window_seconds, group_by=group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
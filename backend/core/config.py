@@ -13,6 +13,39 @@ class Settings(BaseSettings):
     openai_api_key: str
     openai_model: str = "gpt-5.1"
     openai_embedding_model: str = "text-embedding-3-large"
+    # Shared OpenAI HTTP connection pool (HTTP/2 when the h2 package is installed)
+    openai_http2: bool = True
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry_seconds: float = 30.0
+    openai_timeout_seconds: float = 60.0
+    openai_connect_timeout_seconds: float = 5.0
+    openai_max_retries: int = 2
+    # LLM tool calls (web search, news, market data) run concurrently; a tool
+    # still running after the timeout is reported to the model as failed
+    tool_timeout_seconds: float = 20.0
+    tool_max_workers: int = 8
+    # Successful tool results are cached per tool name + normalized arguments;
+    # backend "memory" (per process) or "disk" (SQLite shared by workers).
+    # A TTL of 0 disables caching for that tool
+    tool_cache_enabled: bool = True
+    tool_cache_backend: str = "memory"
+    tool_cache_path: str = "./data/tool_cache.sqlite3"
+    tool_cache_max_entries: int = 1000
+    tool_cache_ttl_search_web: int = 1800
+    tool_cache_ttl_news: int = 600
+    tool_cache_ttl_financial_data: int = 86400
+    
+    # Embedding backend: "openai", "hashing" (offline, deterministic) or "onnx"
+    embedding_provider: str = "openai"
+    hash_embedding_dimensions: int = 384
+    onnx_model_path: Optional[str] = None
+    
+    # Shortened embedding size for text-embedding-3 models (None = native size)
+    embedding_dimensions: Optional[int] = None
+    # Compact vector snapshot written after ingestion: float32, float16 or int8
+    vector_storage_dtype: str = "float32"
+    vector_snapshot_path: str = "./data/vectors"
     
     # External API Keys
     news_api_key: Optional[str] = None
@@ -22,6 +55,13 @@ class Settings(BaseSettings):
     
     # Database Configuration
     chromadb_path: str = "./data/chroma"
+    # Vector search backend: "chroma" (HNSW) or "numpy" (exact, in-process snapshot)
+    vector_backend: str = "chroma"
+    # Hybrid search: fuse vector results with a BM25 keyword index (built at
+    # ingestion, memory-mapped at startup) by reciprocal rank fusion
+    hybrid_search_enabled: bool = True
+    bm25_index_path: str = "./data/bm25"
+    rrf_k: int = 60
     
     # Security Settings
     max_queries_per_minute: int = 10
@@ -40,6 +80,48 @@ class Settings(BaseSettings):
     retrieval_top_k: int = 10
     chunk_size: int = 500
     chunk_overlap: int = 50
+    # Answer date/country-specific questions from chunks fetched by ID
+    structured_lookup_enabled: bool = True
+    # Answer forecast/trend/correlation/anomaly questions from numeric snapshots
+    quant_routing_enabled: bool = True
+    # "flat" searches every chunk type at once; "tiered" searches country
+    # summaries/monthly chunks first, then weekly/daily chunks within the
+    # months and countries they selected
+    retrieval_mode: str = "flat"
+    tiered_coarse_top_k: int = 4
+    # Worker threads for blocking vector store calls from async chat requests
+    rag_executor_workers: int = 8
+    # Identical concurrent queries share one retrieval + LLM pass
+    single_flight_enabled: bool = True
+    # Prompt context: token budget, per-chunk cap, and MMR trade-off between
+    # relevance (1.0) and novelty (0.0); near-duplicates above the threshold are dropped
+    context_token_budget: int = 3000
+    context_chunk_max_tokens: int = 600
+    context_mmr_lambda: float = 0.7
+    context_duplicate_threshold: float = 0.9
+    # Rerank with MMR over chunk embeddings: fetch top_k * multiplier candidates
+    # and keep the top_k that best trade relevance (1.0) against redundancy (0.0)
+    rerank_mmr_enabled: bool = True
+    rerank_mmr_lambda: float = 0.7
+    rerank_mmr_fetch_multiplier: int = 2
+    
+    # Semantic answer cache: reuse answers to near-identical questions
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = 0.95
+    answer_cache_ttl_seconds: int = 3600
+    answer_cache_max_entries: int = 1000
+    
+    # Include per-stage timings (ms) in chat responses, for debugging
+    include_timings_in_response: bool = False
+    
+    # Conversation sessions (Redis when redis_url is set, in-memory otherwise):
+    # recent turns are kept verbatim within the token cap, older turns are
+    # rolled into a running summary
+    session_ttl_seconds: int = 86400
+    session_max_sessions: int = 10000
+    session_history_max_tokens: int = 1000
+    session_recent_messages: int = 4
+    session_summary_max_tokens: int = 300
     
     # Redis (optional)
     redis_url: Optional[str] = None
@@ -48,6 +130,13 @@ class Settings(BaseSettings):
     # Rate limiting
     rate_limit_enabled: bool = True
     
+    # Usage accounting (tokens, cost, latency per request) and per-user token
+    # budgets over rolling windows; a budget of 0 is unlimited
+    accounting_retention_seconds: int = 86400
+    accounting_max_records: int = 100000
+    token_budget_per_user_hour: int = 200000
+    token_budget_per_user_day: int = 1000000
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,140 @@
+"""
+Token-budgeted context packing
+
+Chunks are taken in rerank order with maximal marginal relevance (MMR), so a
+chunk that repeats one already packed (adjacent days with the same readings,
+a weekly chunk restating its days) loses to a slightly less relevant but new
+one, and near-duplicates are dropped outright. Each chunk is narrowed to the
+countries the question asks about and truncated to a per-chunk cap, and
+packing stops at a token budget so prompt size no longer depends on how large
+the retrieved chunks happen to be.
+"""
+from typing import List, Dict, Any, Optional
+import re
+from backend.utils.chunking import filter_chunk_text
+from backend.utils.tokens import count_tokens, truncate_to_tokens
+
+
+WORD = re.compile(r"[\w.\-]+")
+TRUNCATION_MARKER = " [...]"
+# Don't bother packing a chunk truncated below this many tokens
+MIN_CHUNK_TOKENS = 32
+
+
+def _terms(text: str) -> frozenset:
+    return frozenset(WORD.findall(text.lower()))
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two term sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    """Pack reranked chunks into a prompt context under a token budget"""
+
+    def __init__(
+        self,
+        budget_tokens: int = 3000,
+        max_chunk_tokens: int = 600,
+        mmr_lambda: float = 0.7,
+        duplicate_threshold: float = 0.9
+    ):
+        self.budget_tokens = budget_tokens
+        self.max_chunk_tokens = max_chunk_tokens
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+
+    def pack(self, chunks: List[Dict[str, Any]], countries: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Select, compress and format chunks
+
+        Args:
+            chunks: Reranked chunks (text, metadata, rerank_score, id)
+            countries: Countries named in the question; multi-country chunks
+                are narrowed to these
+
+        Returns:
+            Dict with context (string), chunks (those packed, in context
+            order), tokens (context size), duplicates_dropped and truncated
+        """
+        texts = [filter_chunk_text(c['text'], countries) if countries else c['text'] for c in chunks]
+        terms = [_terms(text) for text in texts]
+        relevance = self._normalized_relevance(chunks)
+
+        remaining = list(range(len(chunks)))
+        selected: List[int] = []
+        context = ""
+        used = 0
+        duplicates = truncated = 0
+
+        while remaining and self.budget_tokens - used >= MIN_CHUNK_TOKENS:
+            # MMR: trade relevance against overlap with what is already packed
+            best, best_score, best_overlap = None, float('-inf'), 0.0
+            for i in remaining:
+                overlap = max((_similarity(terms[i], terms[j]) for j in selected), default=0.0)
+                score = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * overlap
+                if score > best_score:
+                    best, best_score, best_overlap = i, score, overlap
+            remaining.remove(best)
+
+            if best_overlap >= self.duplicate_threshold:
+                duplicates += 1
+                continue
+
+            header = f"[Source {len(selected) + 1} - {chunks[best]['metadata'].get('type', 'unknown')}]\n"
+            limit = min(
+                self.max_chunk_tokens,
+                self.budget_tokens - used - count_tokens(header) - count_tokens(TRUNCATION_MARKER)
+            )
+            candidate, was_truncated = self._fit(context, header, texts[best], limit)
+            if candidate is None:
+                continue
+
+            context = candidate
+            used = count_tokens(context)
+            selected.append(best)
+            truncated += was_truncated
+
+        return {
+            'context': context,
+            'chunks': [chunks[i] for i in selected],
+            'tokens': used,
+            'duplicates_dropped': duplicates,
+            'truncated': truncated
+        }
+
+    def _fit(self, context: str, header: str, text: str, limit: int) -> tuple:
+        """
+        Append a chunk to the context, truncating it until the whole context fits
+
+        Token counts of separately counted pieces don't add up exactly, so the
+        budget is checked against the combined context.
+
+        Returns:
+            (new context or None if the chunk can't usefully fit, whether it was truncated)
+        """
+        separator = "\n" if context else ""
+        length = count_tokens(text)
+        while limit >= MIN_CHUNK_TOKENS:
+            was_truncated = length > limit
+            body = truncate_to_tokens(text, limit).rstrip() + TRUNCATION_MARKER if was_truncated else text
+            candidate = f"{context}{separator}{header}{body}\n"
+            overshoot = count_tokens(candidate) - self.budget_tokens
+            if overshoot <= 0:
+                return candidate, was_truncated
+            limit = min(limit, length) - overshoot
+        return None, False
+
+    @staticmethod
+    def _normalized_relevance(chunks: List[Dict[str, Any]]) -> List[float]:
+        # Chunks already diversified by the reranker carry their MMR score
+        scores = [float(c.get('mmr_score', c.get('rerank_score', 0.0))) for c in chunks]
+        if not scores:
+            return []
+        low, high = min(scores), max(scores)
+        if high == low:
+            return [1.0] * len(scores)
+        return [(s - low) / (high - low) for s in scores]
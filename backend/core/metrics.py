@@ -0,0 +1,164 @@
+"""
+Request metrics
+
+Per-query stage timings (validation, embedding, vector search, rerank, LLM,
+tool calls, ...) are collected in a StageTimings object and folded into
+process-wide histograms, exported in the Prometheus text format by the
+/metrics endpoint.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+
+# Seconds; chat stages range from sub-millisecond lookups to multi-second completions
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+
+class StageTimings:
+    """Wall-clock time spent in each stage of one request"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; repeated stages accumulate"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self._start
+
+    def as_dict(self) -> Dict[str, float]:
+        """Milliseconds per stage plus the total, for API responses"""
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        timings['total'] = round(self.total() * 1000, 2)
+        return timings
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set"""
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+
+    def observe(self, value: float, labels: Dict[str, str]):
+        key = tuple(sorted(labels.items()))
+        series = self._series.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series['counts'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(key, le=_number(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {series['count']}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(series['sum'])}")
+            lines.append(f"{self.name}_count{_labels(key)} {series['count']}")
+        return lines
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count and mean per label set"""
+        return {
+            ",".join(f"{k}={v}" for k, v in key) or "all": {
+                'count': series['count'],
+                'mean': round(series['sum'] / series['count'], 6) if series['count'] else 0.0
+            }
+            for key, series in sorted(self._series.items())
+        }
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _labels(key: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Process-wide RAG metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram('rag_stage_seconds', 'Time spent per RAG query stage', LATENCY_BUCKETS)
+        self.query_seconds = Histogram('rag_query_seconds', 'End-to-end RAG query time', LATENCY_BUCKETS)
+        self.tokens = Histogram('rag_tokens', 'Tokens per RAG query', TOKEN_BUCKETS)
+        self.tool_calls = Histogram('rag_tool_calls', 'LLM tool calls per RAG query', COUNT_BUCKETS)
+        self._histograms = [self.stage_seconds, self.query_seconds, self.tokens, self.tool_calls]
+
+    def record_query(
+        self,
+        timings: StageTimings,
+        outcome: str,
+        usage: Optional[Dict[str, int]] = None,
+        tool_calls: int = 0
+    ):
+        """
+        Record one finished query
+
+        Args:
+            timings: Stage timings of the query
+            outcome: answered, cached or blocked
+            usage: Token usage (prompt_tokens, completion_tokens, context_tokens)
+            tool_calls: Number of tool calls the LLM made
+        """
+        usage = usage or {}
+        with self._lock:
+            for stage, seconds in timings.stages.items():
+                self.stage_seconds.observe(seconds, {'stage': stage})
+            self.query_seconds.observe(timings.total(), {'outcome': outcome})
+            if outcome == 'answered':
+                for kind in ('prompt_tokens', 'completion_tokens', 'context_tokens'):
+                    if kind in usage:
+                        self.tokens.observe(usage[kind], {'kind': kind.replace('_tokens', '')})
+                self.tool_calls.observe(tool_calls, {})
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [line for histogram in self._histograms for line in histogram.render()]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts and means, for quick inspection as JSON"""
+        with self._lock:
+            return {histogram.name: histogram.summary() for histogram in self._histograms}
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
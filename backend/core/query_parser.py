@@ -0,0 +1,140 @@
+"""
+Structured query parsing
+
+Extracts countries, exact dates, months and years from chat questions so that
+questions like "What was Japan's sentiment on 2020-03-15?" can be answered from
+chunks with deterministic IDs (daily_{date}, monthly_{month},
+country_summary_{country}) instead of an embedding + vector search round trip.
+"""
+from typing import List, Dict, Any, Optional
+from pathlib import Path
+from datetime import date
+import calendar
+import json
+import re
+from loguru import logger
+from backend.core.config import get_settings
+
+
+MONTH_NUMBERS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTH_NUMBERS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+MONTH_NUMBERS['sept'] = 9
+MONTH_PATTERN = "|".join(sorted(MONTH_NUMBERS, key=len, reverse=True))
+
+# Common short forms, matched case-sensitively ("US" but not "us")
+COUNTRY_ALIASES = {
+    "US": "United States",
+    "USA": "United States",
+    "U.S.": "United States",
+    "U.S.A.": "United States",
+    "UK": "United Kingdom",
+    "U.K.": "United Kingdom",
+    "Britain": "United Kingdom",
+    "UAE": "United Arab Emirates",
+}
+
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+NAMED_DATE = re.compile(
+    rf"\b(?P<month>{MONTH_PATTERN})\.?\s+(?P<day>\d{{1,2}})(?:st|nd|rd|th)?,?\s+(?P<year>\d{{4}})\b",
+    re.IGNORECASE
+)
+DAY_FIRST_DATE = re.compile(
+    rf"\b(?P<day>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month>{MONTH_PATTERN})\.?,?\s+(?P<year>\d{{4}})\b",
+    re.IGNORECASE
+)
+ISO_MONTH = re.compile(r"\b(\d{4})-(\d{2})\b")
+NAMED_MONTH = re.compile(rf"\b(?P<month>{MONTH_PATTERN})\.?,?\s+(?P<year>\d{{4}})\b", re.IGNORECASE)
+YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+
+
+def load_known_countries(processed_data_path: Optional[str] = None) -> List[str]:
+    """Country names from the dataset metadata written by the data loader"""
+    path = Path(processed_data_path or get_settings().processed_data_path) / "metadata.json"
+    try:
+        with open(path) as f:
+            return list(json.load(f).get('countries', []))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not load country list from {path}: {e}")
+        return []
+
+
+class QueryParser:
+    """Extract countries, dates, months and years from natural-language queries"""
+
+    def __init__(self, known_countries: Optional[List[str]] = None):
+        self.known_countries = list(known_countries or [])
+
+        # Longest names first so "United States" wins over a shorter overlap
+        names = sorted(self.known_countries, key=len, reverse=True)
+        self._country_pattern = re.compile(
+            r"(?<!\w)(" + "|".join(re.escape(n) for n in names) + r")(?!\w)",
+            re.IGNORECASE
+        ) if names else None
+        self._canonical = {n.lower(): n for n in self.known_countries}
+
+        aliases = {a: c for a, c in COUNTRY_ALIASES.items() if c in self.known_countries}
+        self._alias_pattern = re.compile(
+            r"(?<!\w)(" + "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True)) + r")(?!\w)"
+        ) if aliases else None
+        self._aliases = aliases
+
+    def parse(self, query: str) -> Dict[str, Any]:
+        """
+        Parse a query
+
+        Returns:
+            Dict with countries (canonical names), dates ('YYYY-MM-DD'),
+            months ('YYYY-MM') and years ('YYYY', including those of the dates
+            and months), each de-duplicated in order of appearance
+        """
+        dates, remainder = self._extract_dates(query)
+        months = self._extract_months(remainder)
+        return {
+            'countries': self._extract_countries(query),
+            'dates': list(dict.fromkeys(dates)),
+            'months': list(dict.fromkeys(months)),
+            'years': list(dict.fromkeys(YEAR.findall(query)))
+        }
+
+    def _extract_countries(self, query: str) -> List[str]:
+        found = []
+        if self._country_pattern is not None:
+            for match in self._country_pattern.finditer(query):
+                found.append((match.start(), self._canonical[match.group(1).lower()]))
+        if self._alias_pattern is not None:
+            for match in self._alias_pattern.finditer(query):
+                found.append((match.start(), self._aliases[match.group(1)]))
+        return list(dict.fromkeys(country for _, country in sorted(found)))
+
+    @staticmethod
+    def _extract_dates(query: str) -> tuple:
+        """Full dates, plus the query with them blanked out so they are not re-read as months"""
+        found = []
+
+        def collect(pattern, to_parts):
+            nonlocal query
+            for match in pattern.finditer(query):
+                try:
+                    found.append((match.start(), date(*to_parts(match)).isoformat()))
+                except ValueError:
+                    continue
+            query = pattern.sub(lambda m: " " * len(m.group(0)), query)
+
+        collect(ISO_DATE, lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3))))
+        for pattern in (NAMED_DATE, DAY_FIRST_DATE):
+            collect(pattern, lambda m: (
+                int(m.group('year')), MONTH_NUMBERS[m.group('month').lower()], int(m.group('day'))
+            ))
+
+        return [d for _, d in sorted(found)], query
+
+    @staticmethod
+    def _extract_months(query: str) -> List[str]:
+        found = []
+        for match in ISO_MONTH.finditer(query):
+            if 1 <= int(match.group(2)) <= 12:
+                found.append((match.start(), f"{match.group(1)}-{match.group(2)}"))
+        for match in NAMED_MONTH.finditer(query):
+            month = MONTH_NUMBERS[match.group('month').lower()]
+            found.append((match.start(), f"{match.group('year')}-{month:02d}"))
+        return [m for _, m in sorted(found)]
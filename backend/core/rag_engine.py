@@ -1,13 +1,36 @@
 """
 RAG (Retrieval-Augmented Generation) Engine
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from loguru import logger
+import asyncio
 import time
+import numpy as np
 from backend.services.embeddings import EmbeddingService
 from backend.services.llm_client import LLMClient
+from backend.services.answer_cache import SemanticAnswerCache
+from backend.services.vector_index import MetadataFilter
+from backend.models.quant_snapshot import get_quant_snapshot
 from backend.core.security import get_security_guard
 from backend.core.config import get_settings
+from backend.core.query_parser import QueryParser, load_known_countries
+from backend.core.context_packer import ContextPacker
+from backend.core.metrics import StageTimings, get_metrics
+from backend.utils.singleflight import SingleFlight, flight_key, normalize_text
+from backend.utils.chunking import filter_chunk_text
+from backend.utils.metadata import (
+    combine_filters, any_of, countries_filter, period_filter, chunk_types_filter
+)
+
+
+# Tiered retrieval: small coarse tier searched first, fine tier narrowed by it
+COARSE_CHUNK_TYPES = ['country_summary', 'monthly']
+FINE_CHUNK_TYPES = ['weekly', 'daily', 'anomaly']
+
+# Query types answered from numeric snapshots instead of vector search
+QUANT_QUERY_TYPES = ('forecast', 'trend', 'correlation', 'anomaly')
 
 
 class RAGEngine:
@@ -18,6 +41,28 @@ class RAGEngine:
         self.embedding_service = EmbeddingService()
         self.llm_client = LLMClient()
         self.security_guard = get_security_guard()
+        self.query_parser = QueryParser(load_known_countries())
+        self.context_packer = ContextPacker(
+            budget_tokens=self.settings.context_token_budget,
+            max_chunk_tokens=self.settings.context_chunk_max_tokens,
+            mmr_lambda=self.settings.context_mmr_lambda,
+            duplicate_threshold=self.settings.context_duplicate_threshold
+        )
+        
+        self.answer_cache = SemanticAnswerCache(
+            threshold=self.settings.answer_cache_threshold,
+            ttl_seconds=self.settings.answer_cache_ttl_seconds,
+            max_entries=self.settings.answer_cache_max_entries
+        ) if self.settings.answer_cache_enabled else None
+        
+        # Coalesces identical in-flight queries
+        self._flight = SingleFlight()
+        
+        # Bounded pool for blocking vector store calls made from aquery
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.settings.rag_executor_workers,
+            thread_name_prefix="rag-retrieval"
+        )
         
         # Initialize ChromaDB
         self.embedding_service.initialize_chromadb()
@@ -28,7 +73,8 @@ class RAGEngine:
         user_id: str = "anonymous",
         top_k: int = None,
         filters: Optional[Dict[str, Any]] = None,
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        conversation_summary: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Process a user query using RAG
@@ -39,13 +85,482 @@ class RAGEngine:
             top_k: Number of chunks to retrieve
             filters: Metadata filters for retrieval
             conversation_history: Previous conversation
+            conversation_summary: Summary of turns older than conversation_history
             
         Returns:
             Dict with response, sources, and metadata
         """
         start_time = time.time()
+        timings = StageTimings()
+        
+        with timings.stage('validation'):
+            blocked, warning = self._validate_query(user_query, user_id, start_time)
+        if blocked:
+            return self._record(blocked, timings, 'blocked')
+        
+        top_k = top_k or self.settings.retrieval_top_k
+        answer = partial(self._answer, user_query, top_k, filters, conversation_history, conversation_summary, timings)
+        
+        # Identical concurrent queries share one embedding/retrieval/LLM pass
+        if self.settings.single_flight_enabled:
+            key = self._flight_key(user_query, top_k, filters, conversation_history, conversation_summary)
+            (result, outcome), leader = self._flight.call(key, answer)
+        else:
+            (result, outcome), leader = answer(), True
+        
+        return self._caller_result(result, outcome, leader, warning, start_time, timings)
+    
+    async def aquery(
+        self,
+        user_query: str,
+        user_id: str = "anonymous",
+        top_k: int = None,
+        filters: Optional[Dict[str, Any]] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        conversation_summary: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of query for use from async routes
+        
+        The query embedding and chat completion use AsyncOpenAI; blocking
+        vector store calls run in a bounded thread pool, so one worker can
+        serve many concurrent chats.
+        
+        Args and return value are the same as query().
+        """
+        start_time = time.time()
+        timings = StageTimings()
+        
+        with timings.stage('validation'):
+            blocked, warning = self._validate_query(user_query, user_id, start_time)
+        if blocked:
+            return self._record(blocked, timings, 'blocked')
+        
+        top_k = top_k or self.settings.retrieval_top_k
+        answer = partial(self._aanswer, user_query, top_k, filters, conversation_history, conversation_summary, timings)
+        
+        if self.settings.single_flight_enabled:
+            key = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                partial(self._flight_key, user_query, top_k, filters, conversation_history, conversation_summary)
+            )
+            (result, outcome), leader = await self._flight.do(key, answer)
+        else:
+            (result, outcome), leader = await answer(), True
+        
+        return self._caller_result(result, outcome, leader, warning, start_time, timings)
+    
+    def _answer(
+        self,
+        user_query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+        conversation_history: Optional[List[Dict[str, str]]],
+        conversation_summary: Optional[str],
+        timings: StageTimings
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        Answer a validated query
+        
+        Returns:
+            (result, outcome) with outcome 'answered' or 'cached'. The result
+            may be shared by coalesced callers and must not be modified.
+        """
+        # Routed lookups need no embedding; their answers are cached by exact key
+        with timings.stage('routing'):
+            retrieved_data = self._try_route(user_query, top_k, filters)
+        
+        # Answer cache: embed once, reuse the embedding for retrieval on a miss
+        query_embedding, cache_scope, routed_key = None, None, None
+        if self._cache_applicable(conversation_history, conversation_summary):
+            try:
+                if retrieved_data is not None:
+                    routed_key = self._routed_cache_key(user_query, filters, top_k, retrieved_data)
+                else:
+                    with timings.stage('embedding'):
+                        query_embedding = self.embedding_service.generate_embedding(user_query)
+                    cache_scope = self._cache_scope(user_query, filters, top_k)
+            except Exception as e:
+                logger.error(f"Answer cache unavailable for this query: {e}")
+            with timings.stage('cache'):
+                cached = self._cache_lookup(query_embedding, cache_scope, routed_key)
+            if cached is not None:
+                return self._cached_result(cached), 'cached'
+        
+        if retrieved_data is None:
+            retrieved_data = self._retrieve(user_query, top_k, filters, query_embedding, timings)
+        
+        # Rerank results
+        with timings.stage('rerank'):
+            reranked_data = self._rerank_chunks(user_query, retrieved_data)
+        
+        # Build context within the token budget
+        with timings.stage('packing'):
+            packed = self._pack_context(user_query, reranked_data)
+        
+        # Generate response
+        with timings.stage('llm'):
+            llm_response = self.llm_client.generate_response(
+                query=user_query,
+                context=packed['context'],
+                conversation_history=conversation_history,
+                conversation_summary=conversation_summary
+            )
+        self._split_tool_time(timings, llm_response)
+        
+        result = self._finalize(user_query, packed, llm_response)
+        self._cache_store(query_embedding, cache_scope, result, routed_key)
+        return result, 'answered'
+    
+    async def _aanswer(
+        self,
+        user_query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+        conversation_history: Optional[List[Dict[str, str]]],
+        conversation_summary: Optional[str],
+        timings: StageTimings
+    ) -> Tuple[Dict[str, Any], str]:
+        """Async variant of _answer"""
+        with timings.stage('routing'):
+            retrieved_data = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._try_route, user_query, top_k, filters
+            )
+        
+        query_embedding, cache_scope, routed_key = None, None, None
+        if self._cache_applicable(conversation_history, conversation_summary):
+            try:
+                if retrieved_data is not None:
+                    routed_key = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self._routed_cache_key, user_query, filters, top_k, retrieved_data
+                    )
+                else:
+                    with timings.stage('embedding'):
+                        query_embedding = await self.embedding_service.agenerate_embedding(user_query)
+                    cache_scope = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self._cache_scope, user_query, filters, top_k
+                    )
+            except Exception as e:
+                logger.error(f"Answer cache unavailable for this query: {e}")
+            with timings.stage('cache'):
+                cached = self._cache_lookup(query_embedding, cache_scope, routed_key)
+            if cached is not None:
+                return self._cached_result(cached), 'cached'
+        
+        if retrieved_data is None:
+            retrieved_data = await self._aretrieve(user_query, top_k, filters, query_embedding, timings)
+        
+        with timings.stage('rerank'):
+            reranked_data = self._rerank_chunks(user_query, retrieved_data)
+        with timings.stage('packing'):
+            packed = self._pack_context(user_query, reranked_data)
+        
+        with timings.stage('llm'):
+            llm_response = await self.llm_client.agenerate_response(
+                query=user_query,
+                context=packed['context'],
+                conversation_history=conversation_history,
+                conversation_summary=conversation_summary
+            )
+        self._split_tool_time(timings, llm_response)
+        
+        result = self._finalize(user_query, packed, llm_response)
+        self._cache_store(query_embedding, cache_scope, result, routed_key)
+        return result, 'answered'
+    
+    async def astream_query(
+        self,
+        user_query: str,
+        user_id: str = "anonymous",
+        top_k: int = None,
+        filters: Optional[Dict[str, Any]] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        conversation_summary: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of aquery
+        
+        Sources are sent as soon as retrieval finishes, so the first bytes
+        arrive after roughly retrieval latency instead of the full generation
+        time. Args are the same as query(), plus usage: a dict kept up to date
+        with the LLM tokens spent, for callers that account for streams which
+        end early (truncated or disconnected).
+        
+        Yields:
+            {'type': 'sources', 'sources', 'query_type'}, then {'type': 'token',
+            'content'} and {'type': 'tool', 'name'} events, then {'type': 'done',
+            'usage', 'tool_calls', 'processing_time', 'time_to_first_token',
+            'warning', 'cached'} (plus 'timings' when enabled); or a single
+            {'type': 'error', 'error', 'blocked'} for rejected queries
+        """
+        start_time = time.time()
+        timings = StageTimings()
+        
+        with timings.stage('validation'):
+            blocked, warning = self._validate_query(user_query, user_id, start_time)
+        if blocked:
+            self._record(blocked, timings, 'blocked')
+            yield {'type': 'error', 'error': blocked['response'], 'blocked': True}
+            return
+        
+        top_k = top_k or self.settings.retrieval_top_k
+        
+        with timings.stage('routing'):
+            retrieved_data = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._try_route, user_query, top_k, filters
+            )
+        
+        query_embedding, cache_scope, routed_key = None, None, None
+        if self._cache_applicable(conversation_history, conversation_summary):
+            try:
+                if retrieved_data is not None:
+                    routed_key = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self._routed_cache_key, user_query, filters, top_k, retrieved_data
+                    )
+                else:
+                    with timings.stage('embedding'):
+                        query_embedding = await self.embedding_service.agenerate_embedding(user_query)
+                    cache_scope = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self._cache_scope, user_query, filters, top_k
+                    )
+            except Exception as e:
+                logger.error(f"Answer cache unavailable for this query: {e}")
+            with timings.stage('cache'):
+                cached = self._cache_lookup(query_embedding, cache_scope, routed_key)
+            if cached is not None:
+                result = self._caller_result(self._cached_result(cached), 'cached', True, warning, start_time, timings)
+                yield {'type': 'sources', 'sources': result['sources'], 'query_type': result['query_type']}
+                yield {'type': 'token', 'content': result['response']}
+                yield self._done_event(result, time.time() - start_time)
+                return
+        
+        if retrieved_data is None:
+            retrieved_data = await self._aretrieve(user_query, top_k, filters, query_embedding, timings)
+        with timings.stage('rerank'):
+            reranked_data = self._rerank_chunks(user_query, retrieved_data)
+        with timings.stage('packing'):
+            packed = self._pack_context(user_query, reranked_data)
+        
+        yield {
+            'type': 'sources',
+            'sources': self._format_sources(packed['chunks']),
+            'query_type': self._classify_query(user_query)
+        }
+        
+        # Same size limit as the non-streaming path, enforced as tokens arrive
+        max_chars = self.settings.max_response_tokens * 4
+        parts: List[str] = []
+        length = 0
+        first_token_at = None
+        llm_done: Dict[str, Any] = {}
+        # Still filled in when the size limit stops the stream before 'done'
+        llm_usage = usage if usage is not None else {}
+        stream = self.llm_client.astream_response(
+            query=user_query,
+            context=packed['context'],
+            conversation_history=conversation_history,
+            conversation_summary=conversation_summary,
+            usage=llm_usage
+        )
+        try:
+            with timings.stage('llm'):
+                async for event in stream:
+                    if event['type'] == 'done':
+                        llm_done = event
+                    elif event['type'] == 'token':
+                        if first_token_at is None:
+                            first_token_at = time.time()
+                        content = event['content'][:max_chars - length]
+                        parts.append(content)
+                        length += len(content)
+                        if content:
+                            yield {'type': 'token', 'content': content}
+                        if length >= max_chars:
+                            logger.warning("Streamed response hit the size limit")
+                            notice = "\n\n[Response truncated due to size limits]"
+                            parts.append(notice)
+                            yield {'type': 'token', 'content': notice}
+                            break
+                    else:
+                        yield event
+        finally:
+            await stream.aclose()
+        
+        llm_response = {
+            'response': "".join(parts),
+            'usage': dict(llm_usage),
+            **{k: v for k, v in llm_done.items() if k != 'type'}
+        }
+        self._split_tool_time(timings, llm_response)
+        
+        result = self._finalize(user_query, packed, llm_response)
+        self._cache_store(query_embedding, cache_scope, result, routed_key)
+        result = self._caller_result(result, 'answered', True, warning, start_time, timings)
+        yield self._done_event(result, (first_token_at or time.time()) - start_time)
+    
+    @staticmethod
+    def _done_event(result: Dict[str, Any], time_to_first_token: float) -> Dict[str, Any]:
+        event = {
+            'type': 'done',
+            'usage': result['usage'],
+            'tool_calls': result.get('tool_calls', 0),
+            'processing_time': result['processing_time'],
+            'time_to_first_token': time_to_first_token,
+            'warning': result['warning'],
+            'cached': result['cached']
+        }
+        if 'timings' in result:
+            event['timings'] = result['timings']
+        return event
+    
+    def _flight_key(
+        self,
+        user_query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+        conversation_history: Optional[List[Dict[str, str]]],
+        conversation_summary: Optional[str]
+    ) -> str:
+        """Coalescing key: normalized inputs plus the dataset version"""
+        return flight_key(
+            query=normalize_text(user_query),
+            top_k=top_k,
+            filters=filters,
+            history=conversation_history,
+            summary=conversation_summary,
+            dataset=self.embedding_service.dataset_version()
+        )
+    
+    def _caller_result(
+        self,
+        shared: Dict[str, Any],
+        outcome: str,
+        leader: bool,
+        warning: Optional[str],
+        start_time: float,
+        timings: StageTimings
+    ) -> Dict[str, Any]:
+        """Per-caller copy of a (possibly shared) result"""
+        result = dict(shared)
+        result['warning'] = warning
+        result['processing_time'] = time.time() - start_time
+        if not leader:
+            timings.add('coalesced', timings.total() - sum(timings.stages.values()))
+            outcome = 'coalesced'
+            # Tokens were spent (and accounted) by the leader
+            result['coalesced'] = True
+        return self._record(result, timings, outcome)
+    
+    @staticmethod
+    def _split_tool_time(timings: StageTimings, llm_response: Dict[str, Any]):
+        """Report tool execution separately from model time"""
+        tool_seconds = llm_response.get('tool_seconds', 0.0)
+        if tool_seconds:
+            timings.add('llm', -tool_seconds)
+            timings.add('tools', tool_seconds)
+    
+    def _record(self, result: Dict[str, Any], timings: StageTimings, outcome: str) -> Dict[str, Any]:
+        """Export the query's timings, token counts and tool calls as metrics"""
+        get_metrics().record_query(timings, outcome, result.get('usage'), result.get('tool_calls', 0))
+        if self.settings.include_timings_in_response:
+            result['timings'] = timings.as_dict()
+        return result
+    
+    def _cache_applicable(
+        self,
+        conversation_history: Optional[List[Dict[str, str]]],
+        conversation_summary: Optional[str] = None
+    ) -> bool:
+        """Answers that depend on earlier turns are never cached"""
+        return self.answer_cache is not None and not conversation_history and not conversation_summary
+    
+    def _cache_scope(self, user_query: str, filters: Optional[Dict[str, Any]], top_k: int) -> str:
+        """
+        Cache partition of a query
         
-        # Security validation
+        Questions differing only in a date, month, year or country embed almost
+        identically, so the entities they name are part of the scope.
+        """
+        parsed = self.query_parser.parse(user_query)
+        return SemanticAnswerCache.scope_key(
+            self.embedding_service.dataset_version(),
+            filters,
+            top_k=top_k,
+            countries=sorted(parsed['countries']),
+            dates=sorted(parsed['dates']),
+            months=sorted(parsed['months']),
+            years=sorted(parsed['years']),
+            query_type=self._classify_query(user_query)
+        )
+    
+    def _routed_cache_key(
+        self,
+        user_query: str,
+        filters: Optional[Dict[str, Any]],
+        top_k: int,
+        retrieved_data: Dict[str, Any]
+    ) -> str:
+        """Exact cache key of a routed query: its wording, scope and the chunks it was routed to"""
+        return flight_key(
+            query=normalize_text(user_query),
+            scope=self._cache_scope(user_query, filters, top_k),
+            routed=retrieved_data['ids']
+        )
+    
+    def _cache_lookup(
+        self,
+        query_embedding: Optional[List[float]],
+        scope: Optional[str],
+        routed_key: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            if routed_key is not None:
+                return self.answer_cache.get_exact(routed_key)
+            if query_embedding is None or scope is None:
+                return None
+            return self.answer_cache.get(query_embedding, scope)
+        except Exception as e:
+            logger.error(f"Answer cache lookup failed: {e}")
+            return None
+    
+    def _cache_store(
+        self,
+        query_embedding: Optional[List[float]],
+        scope: Optional[str],
+        result: Dict[str, Any],
+        routed_key: Optional[str] = None
+    ):
+        try:
+            if routed_key is not None:
+                self.answer_cache.put_exact(routed_key, result)
+            elif query_embedding is not None and scope is not None:
+                self.answer_cache.put(query_embedding, scope, result)
+        except Exception as e:
+            logger.error(f"Answer cache store failed: {e}")
+    
+    def _cached_result(self, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """Serve a cached (already sanitized) answer"""
+        logger.info(f"Answer cache hit (similarity {cached.pop('similarity'):.3f})")
+        cached.update({
+            'usage': {},
+            'tool_calls': 0,
+            'cached': True
+        })
+        return cached
+    
+    def _validate_query(
+        self,
+        user_query: str,
+        user_id: str,
+        start_time: float
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Security validation
+        
+        Returns:
+            (blocked response or None, warning)
+        """
         is_valid, reason, warning = self.security_guard.validate_query(user_query, user_id)
         if not is_valid:
             logger.warning(f"Query blocked: {reason}")
@@ -56,25 +571,161 @@ class RAGEngine:
                 'processing_time': time.time() - start_time,
                 'warning': None,
                 'blocked': True
-            }
+            }, None
+        return None, warning
+    
+    def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+        timings: Optional[StageTimings] = None
+    ) -> Dict[str, Any]:
+        """Retrieve relevant chunks by vector search (after _try_route declined)"""
+        timings = timings or StageTimings()
         
-        # Retrieve relevant chunks
-        top_k = top_k or self.settings.retrieval_top_k
-        retrieved_data = self._retrieve_chunks(user_query, top_k, filters)
+        if query_embedding is None:
+            try:
+                with timings.stage('embedding'):
+                    query_embedding = self.embedding_service.generate_embedding(query)
+            except Exception as e:
+                logger.error(f"Error embedding query: {e}")
+                return {'documents': [], 'metadatas': [], 'distances': [], 'ids': []}
         
-        # Rerank results
-        reranked_data = self._rerank_chunks(user_query, retrieved_data)
+        with timings.stage('search'):
+            return self._vector_retrieve(query, top_k, filters, query_embedding)
+    
+    async def _aretrieve(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+        timings: Optional[StageTimings] = None
+    ) -> Dict[str, Any]:
+        """Async retrieval: embed with the async provider, search in the executor"""
+        loop = asyncio.get_running_loop()
+        timings = timings or StageTimings()
         
-        # Build context
-        context = self._build_context(reranked_data)
+        if query_embedding is None:
+            try:
+                with timings.stage('embedding'):
+                    query_embedding = await self.embedding_service.agenerate_embedding(query)
+            except Exception as e:
+                logger.error(f"Error embedding query: {e}")
+                return {'documents': [], 'metadatas': [], 'distances': [], 'ids': []}
         
-        # Generate response
-        llm_response = self.llm_client.generate_response(
-            query=user_query,
-            context=context,
-            conversation_history=conversation_history
+        with timings.stage('search'):
+            return await loop.run_in_executor(
+                self._executor,
+                partial(self._vector_retrieve, query, top_k, filters, query_embedding)
+            )
+    
+    def _try_route(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Routed retrieval for queries that qualify, or None for vector search"""
+        parsed = self.query_parser.parse(query)
+        if not self._may_route(query, parsed):
+            return None
+        return self._route(query, parsed, top_k, filters)
+    
+    def _may_route(self, query: str, parsed: Dict[str, Any]) -> bool:
+        """Cheap check whether _route could answer the query"""
+        return (
+            (self.settings.structured_lookup_enabled and bool(parsed['dates'] or parsed['months']))
+            or self._quant_routable(query, parsed)
+        )
+    
+    def _quant_routable(self, query: str, parsed: Dict[str, Any]) -> bool:
+        """
+        Whether the quant snapshot can answer the query
+        
+        Snapshots describe recent data only (current trend, last year's
+        anomalies, ...), so questions naming a year, month or date go to
+        vector search even when they mention a trend or a drop.
+        """
+        return (
+            self.settings.quant_routing_enabled
+            and not (parsed['years'] or parsed['months'] or parsed['dates'])
+            and self._classify_query(query) in QUANT_QUERY_TYPES
         )
+    
+    def _route(
+        self,
+        query: str,
+        parsed: Dict[str, Any],
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Answer without embedding or vector search where possible
+        
+        Questions naming dates/months get their chunks by ID; forecast,
+        trend, correlation and anomaly questions about the present get exact
+        numeric context.
+        Request filters apply as in vector search: looked-up chunks failing
+        them are dropped, and quant snapshots (which carry no chunk metadata)
+        are only used for unfiltered requests.
+        
+        Returns:
+            Retrieved chunks, or None to fall back to vector search
+        """
+        if self.settings.structured_lookup_enabled:
+            retrieved_data = self._structured_lookup(parsed, top_k, filters)
+            if retrieved_data is not None:
+                return retrieved_data
+        
+        if not filters and self._quant_routable(query, parsed):
+            return self._quant_lookup(self._classify_query(query), parsed['countries'])
+        
+        return None
+    
+    def _quant_lookup(self, query_type: str, countries: List[str]) -> Optional[Dict[str, Any]]:
+        """Numeric context from the quant snapshot, shaped like retrieved chunks"""
+        snapshot = get_quant_snapshot()
+        if snapshot is None:
+            return None
         
+        try:
+            sections = snapshot.build_context(query_type, countries)
+        except Exception as e:
+            logger.error(f"Error building quant context: {e}")
+            return None
+        if not sections:
+            return None
+        
+        logger.info(f"Routed {query_type} query to quant snapshot ({len(sections)} sections)")
+        return {
+            'documents': [text for _, text in sections],
+            'metadatas': [{'type': 'quant', 'intent': query_type, 'subject': subject} for subject, _ in sections],
+            'distances': [0.0] * len(sections),
+            'ids': [f"quant_{query_type}_{subject}" for subject, _ in sections]
+        }
+    
+    def _vector_retrieve(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """Vector search in the configured retrieval mode"""
+        if self.settings.retrieval_mode == "tiered":
+            return self._retrieve_tiered(query, top_k, filters, query_embedding)
+        return self._retrieve_chunks(query, top_k, filters, query_embedding)
+    
+    def _finalize(
+        self,
+        user_query: str,
+        packed: Dict[str, Any],
+        llm_response: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Sanitize the LLM response and assemble the result (caller fills in warning and processing_time)"""
         # Sanitize response
         sanitized_response = self.security_guard.sanitize_response(llm_response['response'])
         
@@ -84,34 +735,47 @@ class RAGEngine:
             logger.warning(f"Response too large: {size_msg}")
             sanitized_response = sanitized_response[:self.settings.max_response_tokens * 4] + "\n\n[Response truncated due to size limits]"
         
-        # Prepare sources
-        sources = self._format_sources(reranked_data)
-        
-        processing_time = time.time() - start_time
+        # Prepare sources (only chunks that made it into the context)
+        sources = self._format_sources(packed['chunks'])
         
         return {
             'response': sanitized_response,
             'sources': sources,
             'query_type': self._classify_query(user_query),
-            'processing_time': processing_time,
-            'warning': warning,
             'blocked': False,
-            'usage': llm_response.get('usage', {})
+            'usage': {
+                **llm_response.get('usage', {}),
+                'context_tokens': packed['tokens'],
+                'context_chunks': len(packed['chunks'])
+            },
+            'tool_calls': llm_response.get('tool_calls', 0),
+            'cached': False
         }
     
     def _retrieve_chunks(
         self,
         query: str,
         top_k: int,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
-        """Retrieve relevant chunks from vector database"""
+        """
+        Retrieve relevant chunks from vector database
+        
+        With MMR reranking, extra candidates are fetched (with their
+        embeddings) and 'mmr_keep' tells the reranker how many to keep.
+        """
+        mmr = self.settings.rerank_mmr_enabled
         try:
             results = self.embedding_service.query_similar_chunks(
                 query=query,
-                top_k=top_k,
-                filter_dict=filters
+                top_k=top_k * self.settings.rerank_mmr_fetch_multiplier if mmr else top_k,
+                filter_dict=filters,
+                query_embedding=query_embedding,
+                include_embeddings=mmr
             )
+            if mmr:
+                results['mmr_keep'] = top_k
             
             logger.info(f"Retrieved {len(results['documents'])} chunks")
             return results
@@ -125,6 +789,109 @@ class RAGEngine:
                 'ids': []
             }
     
+    def _retrieve_tiered(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """
+        Coarse-to-fine retrieval
+        
+        Searches the country_summary/monthly tier first, then weekly, daily
+        and anomaly chunks restricted to the countries and months that tier
+        selected. The query is embedded once for both searches.
+        """
+        empty = {'documents': [], 'metadatas': [], 'distances': [], 'ids': []}
+        mmr = self.settings.rerank_mmr_enabled
+        try:
+            if query_embedding is None:
+                query_embedding = self.embedding_service.generate_embedding(query)
+            coarse = self.embedding_service.query_similar_chunks(
+                query=query,
+                top_k=self.settings.tiered_coarse_top_k,
+                filter_dict=combine_filters(filters, chunk_types_filter(COARSE_CHUNK_TYPES)),
+                query_embedding=query_embedding,
+                include_embeddings=mmr
+            )
+            
+            countries = [m['country'] for m in coarse['metadatas'] if m.get('country')]
+            months = [
+                period_filter(m['start_ord'], m['end_ord'])
+                for m in coarse['metadatas']
+                if m.get('type') == 'monthly' and 'start_ord' in m
+            ]
+            
+            fine = self.embedding_service.query_similar_chunks(
+                query=query,
+                top_k=top_k * self.settings.rerank_mmr_fetch_multiplier if mmr else top_k,
+                filter_dict=combine_filters(
+                    filters,
+                    chunk_types_filter(FINE_CHUNK_TYPES),
+                    countries_filter(countries),
+                    any_of(months)
+                ),
+                query_embedding=query_embedding,
+                include_embeddings=mmr
+            )
+        except Exception as e:
+            logger.error(f"Error in tiered retrieval: {e}")
+            return empty
+        
+        results = {key: coarse[key] + fine[key] for key in empty}
+        if 'embeddings' in coarse and 'embeddings' in fine:
+            results['embeddings'] = coarse['embeddings'] + fine['embeddings']
+            results['mmr_keep'] = len(coarse['ids']) + top_k
+        logger.info(
+            f"Tiered retrieval: {len(coarse['ids'])} coarse, {len(fine['ids'])} fine chunks "
+            f"({len(countries)} countries, {len(months)} months selected)"
+        )
+        return results
+    
+    def _structured_lookup(
+        self,
+        parsed: Dict[str, Any],
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch chunks for the dates, months and countries named in a query by ID
+        
+        Returns:
+            Retrieved chunks passing the request filters, or None when the
+            query names no date/month or none of the corresponding chunks
+            exist or pass them (e.g. forecast questions)
+        """
+        if not parsed['dates'] and not parsed['months']:
+            return None
+        
+        period_ids = [f"daily_{d}" for d in parsed['dates']] + [f"monthly_{m}" for m in parsed['months']]
+        summary_ids = [f"country_summary_{c}" for c in parsed['countries']]
+        
+        try:
+            results = self.embedding_service.get_chunks_by_ids((period_ids + summary_ids)[:top_k])
+        except Exception as e:
+            logger.error(f"Error in structured lookup: {e}")
+            return None
+        
+        mask = MetadataFilter(results['metadatas']).filter_mask(filters)
+        if mask is not None:
+            keep = np.flatnonzero(mask)
+            results = {key: [results[key][i] for i in keep] for key in ('ids', 'documents', 'metadatas', 'distances')}
+        
+        if not any(chunk_id in period_ids for chunk_id in results['ids']):
+            return None
+        
+        # Multi-country period chunks are narrowed to the countries asked about
+        results['documents'] = [
+            filter_chunk_text(document, parsed['countries'])
+            for document in results['documents']
+        ]
+        
+        logger.info(f"Structured lookup returned {len(results['ids'])} chunks: {results['ids']}")
+        return results
+    
     def _rerank_chunks(self, query: str, retrieved_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Rerank retrieved chunks based on relevance
@@ -133,6 +900,10 @@ class RAGEngine:
         1. Similarity score (distance)
         2. Chunk type priority (country_summary > monthly > weekly > daily)
         3. Recency (more recent data slightly preferred)
+        
+        When the retrieval carries chunk embeddings, chunks are then ordered
+        by maximal marginal relevance, so consecutive days with near-identical
+        text don't crowd out the rest.
         """
         chunks = []
         
@@ -154,7 +925,8 @@ class RAGEngine:
                 'monthly': 1.1,
                 'weekly': 1.05,
                 'daily': 1.0,
-                'anomaly': 1.15
+                'anomaly': 1.15,
+                'quant': 1.3
             }.get(chunk_type, 1.0)
             
             score *= type_boost
@@ -162,22 +934,63 @@ class RAGEngine:
             chunk['rerank_score'] = score
             chunks.append(chunk)
         
+        embeddings = retrieved_data.get('embeddings')
+        if self.settings.rerank_mmr_enabled and embeddings is not None and len(embeddings) == len(chunks) and chunks:
+            return self._mmr_order(chunks, embeddings, retrieved_data.get('mmr_keep', len(chunks)))
+        
         # Sort by reranking score
         chunks.sort(key=lambda x: x['rerank_score'], reverse=True)
         
         return chunks
     
-    def _build_context(self, chunks: List[Dict[str, Any]], max_chunks: int = 8) -> str:
-        """Build context string from chunks"""
-        context_parts = []
+    def _mmr_order(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        keep: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Greedy MMR selection over chunk embeddings
         
-        for i, chunk in enumerate(chunks[:max_chunks]):
-            chunk_type = chunk['metadata'].get('type', 'unknown')
-            context_parts.append(f"[Source {i+1} - {chunk_type}]")
-            context_parts.append(chunk['text'])
-            context_parts.append("")  # Empty line between chunks
+        Each step picks the chunk maximising
+        lambda * rerank_score - (1 - lambda) * max cosine similarity to the
+        chunks already picked. The marginal score is kept as 'mmr_score'.
+        
+        Returns:
+            Up to keep chunks in selection order
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        similarity = vectors @ vectors.T
+        relevance = np.array([c['rerank_score'] for c in chunks], dtype=np.float32)
+        mmr_lambda = self.settings.rerank_mmr_lambda
         
-        return "\n".join(context_parts)
+        selected: List[int] = []
+        redundancy = np.zeros(len(chunks), dtype=np.float32)
+        available = np.ones(len(chunks), dtype=bool)
+        for _ in range(min(keep, len(chunks))):
+            scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+            best = int(np.argmax(np.where(available, scores, -np.inf)))
+            chunks[best]['mmr_score'] = float(scores[best])
+            selected.append(best)
+            available[best] = False
+            redundancy = np.maximum(redundancy, similarity[best])
+        
+        logger.info(f"MMR kept {len(selected)}/{len(chunks)} chunks")
+        return [chunks[i] for i in selected]
+    
+    def _pack_context(self, query: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Pack chunks within the token budget, narrowed to the countries the query names"""
+        packed = self.context_packer.pack(chunks, self.query_parser.parse(query)['countries'])
+        logger.info(
+            f"Packed {len(packed['chunks'])}/{len(chunks)} chunks into {packed['tokens']} tokens "
+            f"({packed['duplicates_dropped']} duplicates dropped, {packed['truncated']} truncated)"
+        )
+        return packed
+    
+    def _build_context(self, chunks: List[Dict[str, Any]], countries: Optional[List[str]] = None) -> str:
+        """Build context string from chunks"""
+        return self.context_packer.pack(chunks, countries)['context']
     
     def _format_sources(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Format sources for response"""
@@ -0,0 +1,263 @@
+"""
+Fast numeric snapshots of the sentiment dataset for chat context
+
+Forecast, trend, correlation and anomaly questions are answered better by a few
+exact numbers than by retrieved text chunks. QuantSnapshot keeps the wide
+dataset in memory and computes compact, per-intent summaries in milliseconds
+(linear trend + exponential smoothing rather than Prophet, which is far too slow
+for an interactive chat request).
+"""
+from typing import List, Dict, Any, Optional, Tuple
+import threading
+import numpy as np
+import pandas as pd
+from loguru import logger
+from backend.services.data_loader import SentimentDataLoader
+
+
+class QuantSnapshot:
+    """In-memory numeric views over the wide sentiment dataset"""
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.copy()
+        df['date'] = pd.to_datetime(df['date'])
+        self.df = df.sort_values('date').reset_index(drop=True)
+        self.countries = [c for c in self.df.columns if c != 'date']
+        # Pre-computed once; ~50ms for a few dozen countries
+        self._corr = self.df[self.countries].corr()
+        self._forecasts: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+    @classmethod
+    def from_csv(cls, csv_path: Optional[str] = None) -> "QuantSnapshot":
+        """Load the dataset configured in settings (or csv_path)"""
+        loader = SentimentDataLoader(csv_path)
+        return cls(loader.load_csv())
+
+    def _series(self, country: str) -> Optional[pd.Series]:
+        if country not in self.df.columns:
+            return None
+        series = self.df.set_index('date')[country].dropna()
+        return series if len(series) else None
+
+    # -- per-country views -----------------------------------------------------
+
+    def snapshot(self, country: str) -> Optional[Dict[str, Any]]:
+        """Current level, moving averages, momentum, percentile and volatility"""
+        series = self._series(country)
+        if series is None or len(series) < 30:
+            return None
+
+        values = series.values
+        current = float(values[-1])
+        momentum_30 = float(values[-1] - values[-30])
+        momentum_90 = float(values[-1] - values[-90]) if len(values) >= 90 else None
+
+        if momentum_30 > 0.05:
+            trend = "rising"
+        elif momentum_30 < -0.05:
+            trend = "falling"
+        else:
+            trend = "flat"
+
+        return {
+            'country': country,
+            'latest_date': series.index[-1].strftime('%Y-%m-%d'),
+            'current_value': round(current, 4),
+            'ma_30': round(float(values[-30:].mean()), 4),
+            'ma_90': round(float(values[-90:].mean()), 4),
+            'momentum_30d': round(momentum_30, 4),
+            'momentum_90d': round(momentum_90, 4) if momentum_90 is not None else None,
+            'trend': trend,
+            'percentile': round(float((values < current).mean() * 100), 1),
+            'volatility_30d': round(float(np.diff(values[-31:]).std()), 4),
+            'all_time_mean': round(float(values.mean()), 4),
+            'all_time_std': round(float(values.std()), 4)
+        }
+
+    def forecast(self, country: str, days: int = 30) -> Optional[Dict[str, Any]]:
+        """Linear trend over the last ~6 months projected from the smoothed level"""
+        key = (country, days)
+        if key in self._forecasts:
+            return self._forecasts[key]
+
+        series = self._series(country)
+        if series is None or len(series) < 90:
+            return None
+
+        recent = series.values[-180:]
+        x = np.arange(len(recent))
+        slope, intercept = np.polyfit(x, recent, 1)
+        level = float(pd.Series(recent).ewm(span=30).mean().iloc[-1])
+        residual_std = float(np.std(recent - (intercept + slope * x)))
+
+        result = {
+            'country': country,
+            'horizon_days': days,
+            'direction': "up" if slope > 0 else "down",
+            'daily_slope': round(float(slope), 6),
+            'projected_value': round(level + float(slope) * days, 4),
+            'projected_change': round(float(slope) * days, 4),
+            'confidence_95_half_width': round(1.96 * residual_std, 4)
+        }
+        self._forecasts[key] = result
+        return result
+
+    def anomalies(
+        self,
+        country: str,
+        lookback: int = 365,
+        threshold: float = 2.5,
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Largest z-score deviations (against the full history) in the last lookback observations"""
+        series = self._series(country)
+        if series is None or len(series) < 100:
+            return []
+
+        std = float(series.std())
+        if std == 0:
+            return []
+        z = (series.tail(lookback) - float(series.mean())) / std
+        flagged = z[z.abs() > threshold]
+
+        anomalies = [
+            {
+                'country': country,
+                'date': day.strftime('%Y-%m-%d'),
+                'value': round(float(series.loc[day]), 4),
+                'z_score': round(float(score), 2)
+            }
+            for day, score in flagged.items()
+        ]
+        anomalies.sort(key=lambda a: abs(a['z_score']), reverse=True)
+        return anomalies[:limit]
+
+    def correlations(self, country: str, top_n: int = 5) -> List[Dict[str, Any]]:
+        """Most correlated other countries"""
+        if country not in self._corr:
+            return []
+        row = self._corr[country].drop(country).dropna()
+        top = row.reindex(row.abs().sort_values(ascending=False).index)[:top_n]
+        return [{'country': other, 'correlation': round(float(r), 3)} for other, r in top.items()]
+
+    # -- dataset-wide views ----------------------------------------------------
+
+    def top_movers(self, n: int = 5) -> List[Dict[str, Any]]:
+        """Countries with the largest absolute 30-day momentum"""
+        snapshots = [s for s in (self.snapshot(c) for c in self.countries) if s]
+        snapshots.sort(key=lambda s: abs(s['momentum_30d']), reverse=True)
+        return snapshots[:n]
+
+    def strongest_pairs(self, n: int = 5) -> List[Dict[str, Any]]:
+        """Most strongly correlated country pairs"""
+        upper = self._corr.where(np.triu(np.ones(self._corr.shape, dtype=bool), k=1)).stack()
+        top = upper.reindex(upper.abs().sort_values(ascending=False).index)[:n]
+        return [
+            {'country1': a, 'country2': b, 'correlation': round(float(r), 3)}
+            for (a, b), r in top.items()
+        ]
+
+    # -- chat context ----------------------------------------------------------
+
+    def build_context(self, intent: str, countries: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """
+        Compact numeric context for a routed chat intent
+
+        Args:
+            intent: forecast, trend, correlation or anomaly
+            countries: Countries named in the question (may be empty)
+
+        Returns:
+            List of (subject, text) sections; empty when the data cannot
+            answer the intent (e.g. a forecast without a country)
+        """
+        countries = [c for c in countries or [] if c in self.df.columns]
+        sections = []
+
+        if intent == 'trend':
+            if countries:
+                for c in countries:
+                    s = self.snapshot(c)
+                    if s:
+                        sections.append((c, self._format_snapshot(s)))
+            else:
+                movers = self.top_movers()
+                if movers:
+                    lines = [f"Largest 30-day moves (as of {movers[0]['latest_date']}):"]
+                    lines += [
+                        f"{s['country']}: {s['current_value']} ({s['momentum_30d']:+.4f} over 30d, {s['trend']})"
+                        for s in movers
+                    ]
+                    sections.append(('all', "\n".join(lines)))
+
+        elif intent == 'forecast':
+            for c in countries:
+                s, f = self.snapshot(c), self.forecast(c)
+                if s and f:
+                    sections.append((c, self._format_snapshot(s) + "\n" + (
+                        f"Forecast ({f['horizon_days']}d, linear trend + smoothing): {f['direction']}, "
+                        f"projected {f['projected_value']} ({f['projected_change']:+.4f}), "
+                        f"95% band +/-{f['confidence_95_half_width']}"
+                    )))
+
+        elif intent == 'correlation':
+            for c in countries:
+                corrs = self.correlations(c)
+                if corrs:
+                    sections.append((c, f"Most correlated with {c}: " + ", ".join(
+                        f"{x['country']} (r={x['correlation']:+.3f})" for x in corrs
+                    )))
+            pairs = [
+                (a, b) for i, a in enumerate(countries) for b in countries[i + 1:]
+                if a in self._corr and b in self._corr
+            ]
+            if pairs:
+                sections.append(('pairs', "Pairwise correlations: " + ", ".join(
+                    f"{a} vs {b} r={self._corr.loc[a, b]:+.3f}" for a, b in pairs
+                )))
+            if not countries:
+                sections.append(('all', "Strongest correlated pairs: " + ", ".join(
+                    f"{p['country1']} & {p['country2']} (r={p['correlation']:+.3f})"
+                    for p in self.strongest_pairs()
+                )))
+
+        elif intent == 'anomaly':
+            targets = countries or self.countries
+            found = [a for c in targets for a in self.anomalies(c)]
+            found.sort(key=lambda a: abs(a['z_score']), reverse=True)
+            if found:
+                sections.append((", ".join(countries) or 'all', "Anomalies in the last 12 months (|z| > 2.5):\n" + "\n".join(
+                    f"{a['date']} {a['country']}: {a['value']} (z={a['z_score']:+.2f})" for a in found[:10]
+                )))
+
+        return sections
+
+    @staticmethod
+    def _format_snapshot(s: Dict[str, Any]) -> str:
+        momentum_90 = f", 90d {s['momentum_90d']:+.4f}" if s['momentum_90d'] is not None else ""
+        return (
+            f"{s['country']} sentiment index as of {s['latest_date']}: {s['current_value']} "
+            f"({s['percentile']}th percentile of its history; mean {s['all_time_mean']}, std {s['all_time_std']}). "
+            f"MA30 {s['ma_30']}, MA90 {s['ma_90']}. Momentum 30d {s['momentum_30d']:+.4f}{momentum_90} "
+            f"(trend: {s['trend']}). 30-day volatility {s['volatility_30d']}."
+        )
+
+
+_quant_snapshot: Optional[QuantSnapshot] = None
+_quant_snapshot_failed = False
+_quant_snapshot_lock = threading.Lock()
+
+
+def get_quant_snapshot() -> Optional[QuantSnapshot]:
+    """Get the shared QuantSnapshot, loading the dataset on first use (None if unavailable)"""
+    global _quant_snapshot, _quant_snapshot_failed
+    if _quant_snapshot is None and not _quant_snapshot_failed:
+        with _quant_snapshot_lock:
+            if _quant_snapshot is None and not _quant_snapshot_failed:
+                try:
+                    _quant_snapshot = QuantSnapshot.from_csv()
+                except Exception as e:
+                    # Don't retry on every chat request; routing falls back to vector search
+                    logger.warning(f"Quant snapshot unavailable, quant routing disabled: {e}")
+                    _quant_snapshot_failed = True
+    return _quant_snapshot
@@ -32,6 +32,9 @@ class ChatResponse(BaseModel):
     query_type: str
     processing_time: float
     warning: Optional[str] = None
+    cached: bool = False
+    usage: Dict[str, int] = {}
+    timings: Optional[Dict[str, float]] = None
 
 
 class ForecastRequest(BaseModel):
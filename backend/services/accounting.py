@@ -0,0 +1,246 @@
+"""
+Token, cost and latency accounting
+
+Every LLM-backed request (RAG chat, streaming chat, dashboard endpoints)
+records its prompt/completion tokens, model, estimated cost, latency and tool
+calls in a process-wide ledger. The ledger answers two questions: where the
+tokens and time go (aggregated by endpoint, user or model over a time window,
+served by /metrics/usage) and whether a user is within their token budget.
+Budgets are rolling per-hour and per-day token caps checked before a request
+does any work, so one runaway client can't starve everyone else.
+
+Users are identified as elsewhere in the API (client address) and stored
+hashed, like in SecurityGuard.
+"""
+from typing import List, Dict, Any, Optional, Tuple
+from collections import defaultdict, deque
+import hashlib
+import threading
+import time
+from loguru import logger
+from backend.core.config import get_settings
+
+
+# USD per million (prompt, completion) tokens; models are matched by longest
+# prefix, unknown models are costed at zero
+MODEL_PRICES = {
+    'gpt-5.2': (1.75, 14.0),
+    'gpt-5.1': (1.25, 10.0),
+    'gpt-5-mini': (0.25, 2.0),
+    'gpt-5-nano': (0.05, 0.4),
+    'gpt-5': (1.25, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-4o': (2.5, 10.0),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+
+GROUP_FIELDS = ('endpoint', 'user', 'model')
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call"""
+    matches = [name for name in MODEL_PRICES if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def billable_usage(result: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Tokens a RAG result actually consumed
+
+    Cached answers and results shared with a coalesced in-flight query cost
+    the caller nothing; their usage belongs to the original request.
+    """
+    if result.get('cached') or result.get('coalesced'):
+        return {}
+    return result.get('usage') or {}
+
+
+def hash_user_id(user_id: str) -> str:
+    return hashlib.sha256(user_id.encode()).hexdigest()[:16]
+
+
+class UsageLedger:
+    """Per-request usage records over a rolling retention window"""
+
+    def __init__(
+        self,
+        retention_seconds: int = 86400,
+        max_records: int = 100000,
+        budget_per_hour: int = 0,
+        budget_per_day: int = 0
+    ):
+        """
+        Args:
+            retention_seconds: How long records are kept (and the longest
+                window summaries and budgets can cover)
+            max_records: Cap on retained records; the oldest are dropped first
+            budget_per_hour: Tokens a user may consume per rolling hour (0 = unlimited)
+            budget_per_day: Tokens a user may consume per rolling day (0 = unlimited)
+        """
+        self.retention_seconds = retention_seconds
+        self.max_records = max_records
+        self.budget_per_hour = budget_per_hour
+        self.budget_per_day = budget_per_day
+        self._records: deque = deque()
+        # (timestamp, tokens) per user, for budget checks without a full scan
+        self._user_tokens: Dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        endpoint: str,
+        user_id: str,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency_seconds: float = 0.0,
+        tool_calls: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Record one finished request
+
+        Returns:
+            The stored record
+        """
+        now = time.time()
+        user = hash_user_id(user_id)
+        record = {
+            'timestamp': now,
+            'endpoint': endpoint,
+            'user': user,
+            'model': model,
+            'prompt_tokens': int(prompt_tokens),
+            'completion_tokens': int(completion_tokens),
+            'total_tokens': int(prompt_tokens) + int(completion_tokens),
+            'cost_usd': estimate_cost(model, prompt_tokens, completion_tokens),
+            'latency_seconds': latency_seconds,
+            'tool_calls': tool_calls
+        }
+        with self._lock:
+            self._records.append(record)
+            if record['total_tokens']:
+                self._user_tokens[user].append((now, record['total_tokens']))
+            self._prune(now)
+        return record
+
+    def record_result(
+        self,
+        endpoint: str,
+        user_id: str,
+        model: str,
+        result: Dict[str, Any],
+        latency_seconds: float
+    ) -> Dict[str, Any]:
+        """Record a RAG result or 'done' stream event"""
+        usage = billable_usage(result)
+        return self.record(
+            endpoint, user_id, model,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+            latency_seconds=latency_seconds,
+            tool_calls=result.get('tool_calls', 0) if usage else 0
+        )
+
+    def _prune(self, now: float):
+        cutoff = now - self.retention_seconds
+        while self._records and (self._records[0]['timestamp'] < cutoff or len(self._records) > self.max_records):
+            self._records.popleft()
+        for user in list(self._user_tokens):
+            entries = self._user_tokens[user]
+            while entries and entries[0][0] < cutoff:
+                entries.popleft()
+            if not entries:
+                del self._user_tokens[user]
+
+    def tokens_used(self, user_id: str, window_seconds: float) -> int:
+        """Tokens a user consumed in the last window_seconds"""
+        cutoff = time.time() - window_seconds
+        with self._lock:
+            entries = self._user_tokens.get(hash_user_id(user_id), ())
+            return sum(tokens for timestamp, tokens in entries if timestamp >= cutoff)
+
+    def check_budget(self, user_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check a user's token budgets before serving a request
+
+        Returns:
+            (allowed, message) where message explains a refusal
+        """
+        for budget, window, label in (
+            (self.budget_per_hour, 3600, "hourly"),
+            (self.budget_per_day, 86400, "daily")
+        ):
+            if budget and self.tokens_used(user_id, window) >= budget:
+                logger.warning(f"User {hash_user_id(user_id)} exceeded the {label} token budget")
+                return False, f"Token budget exceeded ({label} limit of {budget} tokens). Please try again later."
+        return True, None
+
+    def summary(self, window_seconds: float = 3600, group_by: str = 'endpoint') -> Dict[str, Any]:
+        """
+        Aggregate recent records
+
+        Args:
+            window_seconds: Only records newer than this are included
+            group_by: 'endpoint', 'user' or 'model'
+
+        Returns:
+            Dict with the window and, per group, request count, token totals,
+            estimated cost, tool calls and mean/p95/max latency
+        """
+        if group_by not in GROUP_FIELDS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_FIELDS)}")
+
+        cutoff = time.time() - window_seconds
+        with self._lock:
+            records = [r for r in self._records if r['timestamp'] >= cutoff]
+
+        groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for record in records:
+            groups[record[group_by]].append(record)
+
+        return {
+            'window_seconds': window_seconds,
+            'group_by': group_by,
+            'groups': {name: self._aggregate(group) for name, group in sorted(groups.items())},
+            'total': self._aggregate(records)
+        }
+
+    @staticmethod
+    def _aggregate(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        latencies = sorted(r['latency_seconds'] for r in records)
+        count = len(records)
+        return {
+            'requests': count,
+            'prompt_tokens': sum(r['prompt_tokens'] for r in records),
+            'completion_tokens': sum(r['completion_tokens'] for r in records),
+            'total_tokens': sum(r['total_tokens'] for r in records),
+            'cost_usd': round(sum(r['cost_usd'] for r in records), 6),
+            'tool_calls': sum(r['tool_calls'] for r in records),
+            'latency_mean_seconds': round(sum(latencies) / count, 4) if count else 0.0,
+            'latency_p95_seconds': round(latencies[min(count - 1, int(0.95 * count))], 4) if count else 0.0,
+            'latency_max_seconds': round(latencies[-1], 4) if count else 0.0
+        }
+
+
+_usage_ledger: Optional[UsageLedger] = None
+_usage_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Get the process-wide usage ledger"""
+    global _usage_ledger
+    if _usage_ledger is None:
+        with _usage_ledger_lock:
+            if _usage_ledger is None:
+                settings = get_settings()
+                _usage_ledger = UsageLedger(
+                    retention_seconds=settings.accounting_retention_seconds,
+                    max_records=settings.accounting_max_records,
+                    budget_per_hour=settings.token_budget_per_user_hour,
+                    budget_per_day=settings.token_budget_per_user_day
+                )
+    return _usage_ledger
@@ -0,0 +1,148 @@
+"""
+Semantic answer cache for RAG responses
+
+Near-identical questions ("How is US sentiment trending?" / "how's US sentiment
+trending") map to almost the same query embedding, so a finished answer can be
+reused when a new query embedding is within a cosine-similarity threshold of a
+cached one. Entries are scoped by dataset version, retrieval filters and the
+dates, months, years and countries a question names (which barely move its
+embedding), expire after a TTL and are evicted least-recently-used beyond a size bound.
+Answers that were produced without a query embedding (routed lookups) are
+stored under exact keys in the same bounded, expiring cache.
+"""
+from typing import List, Dict, Any, Optional, Union
+from collections import OrderedDict
+import copy
+import json
+import threading
+import time
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """In-process cache of answers keyed by query-embedding similarity"""
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: int = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Union[int, str], Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope_key(dataset_version: str, filters: Optional[Dict[str, Any]] = None, **extra: Any) -> str:
+        """Key of the partition an answer is valid in"""
+        return json.dumps(
+            {'dataset': dataset_version, 'filters': filters or None, **extra},
+            sort_keys=True,
+            default=str
+        )
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _expire(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e['created_at'] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, embedding: List[float], scope: str) -> Optional[Dict[str, Any]]:
+        """
+        Most similar cached answer in scope, if above the threshold
+
+        Returns:
+            Copy of the cached result with a 'similarity' entry, or None
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire(time.time())
+            candidates = [(k, e) for k, e in self._entries.items() if e['scope'] == scope]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([e['embedding'] for _, e in candidates])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = copy.deepcopy(entry['result'])
+
+        result['similarity'] = float(scores[best])
+        return result
+
+    def put(self, embedding: List[float], scope: str, result: Dict[str, Any]):
+        """Store an answer, evicting the least recently used entries beyond max_entries"""
+        entry = {
+            'embedding': self._normalize(embedding),
+            'scope': scope,
+            'result': copy.deepcopy(result),
+            'created_at': time.time()
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_exact(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer stored under an exact key
+
+        Returns:
+            Copy of the cached result with 'similarity' 1.0, or None
+        """
+        with self._lock:
+            self._expire(time.time())
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = copy.deepcopy(entry['result'])
+
+        result['similarity'] = 1.0
+        return result
+
+    def put_exact(self, key: str, result: Dict[str, Any]):
+        """Store an answer under an exact key; never matched by similarity lookups"""
+        entry = {
+            'embedding': None,
+            'scope': None,
+            'result': copy.deepcopy(result),
+            'created_at': time.time()
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
@@ -0,0 +1,253 @@
+"""
+In-process BM25 keyword index
+
+Embedding search is weak on exact tokens: a question naming "2020-03-14", a
+reading like "5.12" or a country buried in a multi-country chunk often misses
+the chunk that contains it. A BM25 inverted index over the chunk texts catches
+those, and its ranking is fused with the vector ranking by reciprocal rank
+fusion (RRF), which needs no score calibration between the two.
+
+The index is built at ingestion (EmbeddingService.export_bm25_index) and stored
+as CSR postings in .npy files that are memory-mapped at startup, next to JSON
+ids, documents and metadata. Like vector snapshots, each save is a versioned
+export published in one atomic step, and records the collection it was built
+from. Where clauses are evaluated like in VectorIndex.
+"""
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from collections import Counter
+import json
+import re
+import numpy as np
+from loguru import logger
+from backend.services.vector_index import MetadataFilter
+from backend.utils.vector_codec import publish_export, export_path, check_export_counts, write_json
+
+
+# Words, numbers and dates; inner '.' and '-' are kept so "5.12" and
+# "2020-03-14" stay single tokens
+TOKEN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked ID lists: each list contributes 1 / (k + rank) per ID
+
+    Returns:
+        (id, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index(MetadataFilter):
+    """Okapi BM25 over chunk texts with CSR postings"""
+
+    def __init__(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        terms: List[str],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        collection: Optional[str] = None
+    ):
+        """
+        Args:
+            ids, documents, metadatas: Chunk records, aligned by position
+            terms: Vocabulary; term i's postings are postings[offsets[i]:offsets[i + 1]]
+            offsets: int64 array of len(terms) + 1 posting offsets
+            postings: int32 document positions per term
+            frequencies: float32 term frequency per posting
+            lengths: float32 token count per document
+            k1, b: BM25 term-frequency saturation and length normalisation
+            collection: Collection the records were read from (None if unknown)
+        """
+        super().__init__(metadatas)
+        self.ids = ids
+        self.documents = documents
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.collection = collection
+
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        # Per-document part of the BM25 denominator, computed once
+        self._norms = (k1 * (1 - b + b * lengths / max(average, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(
+        cls,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        collection: Optional[str] = None
+    ) -> "BM25Index":
+        """Build the index from chunk records"""
+        term_ids: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        lengths = np.zeros(len(documents), dtype=np.float32)
+
+        for position, document in enumerate(documents):
+            tokens = tokenize(document or "")
+            lengths[position] = len(tokens)
+            for term, count in Counter(tokens).items():
+                if term not in term_ids:
+                    term_ids[term] = len(postings)
+                    postings.append([])
+                postings[term_ids[term]].append((position, count))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        flat = [entry for p in postings for entry in p]
+        return cls(
+            ids, documents, metadatas,
+            terms=list(term_ids),
+            offsets=offsets,
+            postings=np.array([position for position, _ in flat], dtype=np.int32),
+            frequencies=np.array([count for _, count in flat], dtype=np.float32),
+            lengths=lengths,
+            k1=k1,
+            b=b,
+            collection=collection
+        )
+
+    def save(self, directory: str) -> Dict[str, Any]:
+        """
+        Write the index to disk and return its manifest
+
+        The postings and records are published together (see publish_export),
+        so a reload never pairs postings with another save's documents.
+        """
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        manifest = {
+            'count': len(self.ids),
+            'terms': len(terms),
+            'postings': int(len(self.postings)),
+            'k1': self.k1,
+            'b': self.b,
+            'collection': self.collection
+        }
+
+        with publish_export(directory) as path:
+            for name in ('offsets', 'postings', 'frequencies', 'lengths'):
+                with open(path / f"{name}.npy", 'wb') as f:
+                    np.save(f, getattr(self, name))
+            write_json(path / "terms.json", terms)
+            write_json(path / "ids.json", self.ids)
+            write_json(path / "documents.json", self.documents)
+            write_json(path / "metadatas.json", self.metadatas)
+            write_json(path / "manifest.json", manifest)
+        return manifest
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "BM25Index":
+        """
+        Load the live index written by save(); postings are memory-mapped
+
+        Raises:
+            FileNotFoundError: No index in directory
+            ValueError: The index files disagree with each other
+        """
+        path = export_path(directory)
+        if not (path / "manifest.json").exists():
+            raise FileNotFoundError(f"No BM25 index found at {directory}")
+
+        with open(path / "manifest.json") as f:
+            manifest = json.load(f)
+        records = {}
+        for name in ('terms', 'ids', 'documents', 'metadatas'):
+            with open(path / f"{name}.json") as f:
+                records[name] = json.load(f)
+
+        mmap_mode = 'r' if mmap else None
+        offsets = np.load(path / "offsets.npy", mmap_mode=mmap_mode)
+        postings = np.load(path / "postings.npy", mmap_mode=mmap_mode)
+        frequencies = np.load(path / "frequencies.npy", mmap_mode=mmap_mode)
+        lengths = np.load(path / "lengths.npy")
+
+        check_export_counts(
+            manifest, ids=records['ids'], documents=records['documents'],
+            metadatas=records['metadatas'], lengths=lengths
+        )
+        if not (len(records['terms']) + 1 == len(offsets) and len(postings) == len(frequencies) == offsets[-1]):
+            raise ValueError(f"BM25 postings at {path} do not match its vocabulary")
+
+        index = cls(
+            records['ids'], records['documents'], records['metadatas'],
+            terms=records['terms'],
+            offsets=offsets,
+            postings=postings,
+            frequencies=frequencies,
+            lengths=lengths,
+            k1=manifest.get('k1', 1.5),
+            b=manifest.get('b', 0.75),
+            collection=manifest.get('collection')
+        )
+        logger.info(f"Loaded BM25 index: {manifest['count']} chunks, {manifest['terms']} terms")
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for a query"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        count = len(self.ids)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            documents = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            idf = np.log(1.0 + (count - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[documents] += idf * tf * (self.k1 + 1) / (tf + self._norms[documents])
+        return scores
+
+    def query(
+        self,
+        query: str,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, List[Any]]:
+        """
+        Top-k keyword search
+
+        Returns:
+            Dict with ids, documents, metadatas and scores, best first; only
+            chunks sharing at least one term with the query are returned
+        """
+        scores = self.scores(query)
+        mask = self.filter_mask(where)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        matches = np.flatnonzero(scores > 0)
+        if len(matches) > n_results:
+            matches = matches[np.argpartition(-scores[matches], n_results - 1)[:n_results]]
+        matches = matches[np.argsort(-scores[matches], kind='stable')]
+
+        return {
+            'ids': [self.ids[i] for i in matches],
+            'documents': [self.documents[i] for i in matches],
+            'metadatas': [self.metadatas[i] for i in matches],
+            'scores': scores[matches].astype(float).tolist()
+        }
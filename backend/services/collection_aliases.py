@@ -0,0 +1,67 @@
+"""
+Collection aliases for zero-downtime reindexing
+
+ChromaDB has no native aliases, so a small JSON registry next to the database
+maps a logical collection name (e.g. "sentiment_data") to the physical,
+versioned collection currently serving queries (e.g. "sentiment_data_v3").
+Updates replace the file atomically so readers never see a partial write.
+"""
+from typing import Dict, Optional
+from pathlib import Path
+import json
+import os
+import re
+
+
+class CollectionAliases:
+    """File-backed alias registry for ChromaDB collections"""
+
+    FILENAME = "aliases.json"
+
+    def __init__(self, root: str):
+        self.path = Path(root) / self.FILENAME
+
+    def all(self) -> Dict[str, str]:
+        """Return every alias -> collection mapping"""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def resolve(self, name: str) -> str:
+        """Resolve an alias to its collection, or return the name unchanged"""
+        return self.all().get(name, name)
+
+    def set(self, alias: str, collection_name: str):
+        """Atomically point an alias at a collection"""
+        aliases = self.all()
+        aliases[alias] = collection_name
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(aliases, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def mtime(self) -> Optional[int]:
+        """Modification time of the registry, used to detect alias flips cheaply"""
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+
+def collection_version(alias: str, collection_name: str) -> Optional[int]:
+    """
+    Version number of a physical collection for an alias
+
+    ``{alias}_v{n}`` is version n; the legacy unversioned collection named like
+    the alias itself counts as version 0.
+    """
+    if collection_name == alias:
+        return 0
+    match = re.fullmatch(rf"{re.escape(alias)}_v(\d+)", collection_name)
+    return int(match.group(1)) if match else None
@@ -0,0 +1,190 @@
+"""
+Incrementally maintained collection statistics
+
+Counting chunks by type in ChromaDB means scanning the collection, so a small
+SQLite sidecar next to the database keeps one row per indexed chunk (type and
+token count) plus per-type aggregates maintained by triggers. Ingestion updates
+it as batches are committed; reading the stats is a lookup of a handful of rows.
+"""
+from typing import List, Dict, Any, Optional, Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+from datetime import datetime
+import sqlite3
+from backend.utils.tokens import count_tokens
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    collection TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (collection, chunk_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS type_counts (
+    collection TEXT NOT NULL,
+    type TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (collection, type)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS collections (
+    collection TEXT PRIMARY KEY,
+    embedding_model TEXT,
+    dimensions INTEGER,
+    build_version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO type_counts (collection, type, chunks, tokens)
+    VALUES (new.collection, new.type, 1, new.tokens)
+    ON CONFLICT (collection, type) DO UPDATE SET
+        chunks = chunks + 1,
+        tokens = tokens + excluded.tokens;
+END;
+
+CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+    UPDATE type_counts SET chunks = chunks - 1, tokens = tokens - old.tokens
+    WHERE collection = old.collection AND type = old.type;
+    DELETE FROM type_counts
+    WHERE collection = old.collection AND type = old.type AND chunks <= 0;
+END;
+"""
+
+
+class CollectionStatsStore:
+    """SQLite sidecar holding exact per-collection statistics"""
+
+    FILENAME = "collection_stats.sqlite3"
+
+    def __init__(self, root: str):
+        self.path = Path(root) / self.FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection committed (or rolled back) and closed on exit"""
+        # Short-lived connections: the indexer and API servers may be separate processes
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+
+    def record_chunks(
+        self,
+        collection: str,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Optional[Dict[str, Any]]]
+    ):
+        """Add or replace chunks (upsert semantics)"""
+        rows = [
+            (collection, chunk_id, (metadata or {}).get('type', 'unknown'), count_tokens(document or ""))
+            for chunk_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+        with self._connect() as conn:
+            # Delete + insert rather than REPLACE so both triggers fire
+            conn.executemany(
+                "DELETE FROM chunks WHERE collection = ? AND chunk_id = ?",
+                [(collection, chunk_id) for chunk_id in ids]
+            )
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+
+    def remove_chunks(self, collection: str, ids: List[str]):
+        """Remove deleted chunks"""
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM chunks WHERE collection = ? AND chunk_id = ?",
+                [(collection, chunk_id) for chunk_id in ids]
+            )
+
+    def replace_all(
+        self,
+        collection: str,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Optional[Dict[str, Any]]]
+    ):
+        """Replace every chunk of a collection (reconciliation after a full scan)"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+        self.record_chunks(collection, ids, documents, metadatas)
+
+    def set_info(
+        self,
+        collection: str,
+        embedding_model: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        bump_version: bool = False
+    ):
+        """Record collection-level facts; bump_version marks a completed build"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO collections (collection, embedding_model, dimensions, build_version, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (collection) DO UPDATE SET
+                    embedding_model = COALESCE(excluded.embedding_model, embedding_model),
+                    dimensions = COALESCE(excluded.dimensions, dimensions),
+                    build_version = build_version + ?,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    collection, embedding_model, dimensions, int(bump_version),
+                    datetime.now().isoformat(), int(bump_version)
+                )
+            )
+
+    def drop(self, collection: str):
+        """Forget a collection (e.g. after it was garbage collected)"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+            conn.execute("DELETE FROM collections WHERE collection = ?", (collection,))
+
+    def count(self, collection: str) -> int:
+        """Number of chunks recorded for a collection"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(chunks), 0) FROM type_counts WHERE collection = ?",
+                (collection,)
+            ).fetchone()
+        return int(row[0])
+
+    def get(self, collection: str) -> Optional[Dict[str, Any]]:
+        """
+        Statistics for a collection
+
+        Returns:
+            Dict with total_chunks, chunk_types, tokens_by_type, total_tokens,
+            embedding_model, dimensions, build_version and updated_at, or None
+            if the collection has never been recorded
+        """
+        with self._connect() as conn:
+            info = conn.execute(
+                "SELECT embedding_model, dimensions, build_version, updated_at FROM collections WHERE collection = ?",
+                (collection,)
+            ).fetchone()
+            if info is None:
+                return None
+            types = conn.execute(
+                "SELECT type, chunks, tokens FROM type_counts WHERE collection = ? ORDER BY type",
+                (collection,)
+            ).fetchall()
+
+        return {
+            'collection': collection,
+            'total_chunks': sum(row[1] for row in types),
+            'chunk_types': {row[0]: row[1] for row in types},
+            'tokens_by_type': {row[0]: row[2] for row in types},
+            'total_tokens': sum(row[2] for row in types),
+            'embedding_model': info[0],
+            'dimensions': info[1],
+            'build_version': info[2],
+            'updated_at': info[3]
+        }
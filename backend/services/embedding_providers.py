@@ -0,0 +1,201 @@
+"""
+Embedding providers for the vector database
+
+EmbeddingService delegates all vector generation to one of these backends so the
+ingest -> query path can run against OpenAI, a deterministic offline hashing
+model (tests, benchmarks, air-gapped builds) or a small local ONNX sentence model.
+"""
+from typing import List, Optional
+from pathlib import Path
+import asyncio
+import hashlib
+import re
+import numpy as np
+from loguru import logger
+from openai import OpenAI, AsyncOpenAI
+from backend.core.config import Settings
+from backend.services.openai_client import get_openai_client, get_async_openai_client
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+
+class EmbeddingProvider:
+    """Base class for embedding backends"""
+
+    # Identifier stored alongside vectors so incompatible indexes can be detected
+    name: str = "base"
+    # Seconds to wait between remote batches (0 for local backends)
+    batch_delay: float = 0.0
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        """Vector size produced by this provider, if known up front"""
+        return None
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts"""
+        raise NotImplementedError
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts without blocking the event loop"""
+        # Local backends are CPU-bound: run them in a worker thread
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI embeddings API"""
+
+    batch_delay = 0.1  # Small delay to respect rate limits
+
+    def __init__(
+        self,
+        model: str,
+        dimensions: Optional[int] = None,
+        client: Optional[OpenAI] = None,
+        async_client: Optional[AsyncOpenAI] = None
+    ):
+        # Default to the process-wide pooled clients
+        self.client = client or get_openai_client()
+        self.async_client = async_client or get_async_openai_client()
+        self.model = model
+        self._dimensions = dimensions
+        self.name = f"openai:{model}" + (f"@{dimensions}" if dimensions else "")
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return self._dimensions
+
+    def _params(self, texts: List[str]) -> dict:
+        params = {'model': self.model, 'input': texts}
+        # text-embedding-3 models shorten natively (truncate + re-normalise)
+        if self._dimensions:
+            params['dimensions'] = self._dimensions
+        return params
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(**self._params(texts))
+        return [item.embedding for item in response.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.async_client.embeddings.create(**self._params(texts))
+        return [item.embedding for item in response.data]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic hashing-trick embeddings
+
+    Unigrams and bigrams are hashed with blake2b (stable across processes, unlike
+    Python's salted hash()) into a signed bag-of-features vector, then L2
+    normalised so cosine distance behaves like it does for model embeddings.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+    def __init__(self, dimensions: int = 384):
+        if dimensions <= 0:
+            raise ValueError("Hashing embedding dimensions must be positive")
+        self._dimensions = dimensions
+        self.name = f"hashing:{dimensions}"
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return self._dimensions
+
+    def _features(self, text: str) -> List[str]:
+        tokens = self.TOKEN_PATTERN.findall(text.lower())
+        bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens + bigrams
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = int.from_bytes(
+                hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little'
+            )
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self._dimensions] += sign
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(text).tolist() for text in texts]
+
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """
+    Local sentence-transformer style model exported to ONNX
+
+    Expects a directory containing ``model.onnx`` and a HuggingFace
+    ``tokenizer.json`` (e.g. an all-MiniLM-L6-v2 export). Token embeddings are
+    mean-pooled over the attention mask and L2 normalised.
+    """
+
+    def __init__(self, model_path: str, max_length: int = 256):
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime and tokenizers are required for the onnx embedding provider")
+
+        model_dir = Path(model_path)
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.session = ort.InferenceSession(
+            str(model_dir / "model.onnx"),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.name = f"onnx:{model_dir.name}"
+        self._dimensions = self.session.get_outputs()[0].shape[-1]
+        if not isinstance(self._dimensions, int):
+            self._dimensions = None
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return self._dimensions
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+        return pooled.astype(np.float32).tolist()
+
+
+def get_embedding_provider(settings: Settings) -> EmbeddingProvider:
+    """Create the embedding provider selected in settings"""
+    provider = settings.embedding_provider.lower()
+
+    if provider == "openai":
+        return OpenAIEmbeddingProvider(
+            model=settings.openai_embedding_model,
+            dimensions=settings.embedding_dimensions
+        )
+    elif provider == "hashing":
+        logger.info(f"Using offline hashing embeddings ({settings.hash_embedding_dimensions} dims)")
+        return HashingEmbeddingProvider(dimensions=settings.hash_embedding_dimensions)
+    elif provider == "onnx":
+        if not settings.onnx_model_path:
+            raise ValueError("ONNX_MODEL_PATH must be set when EMBEDDING_PROVIDER=onnx")
+        logger.info(f"Using local ONNX embeddings from {settings.onnx_model_path}")
+        return OnnxEmbeddingProvider(settings.onnx_model_path)
+    else:
+        raise ValueError(f"Unknown embedding provider: {settings.embedding_provider}")
@@ -3,26 +3,47 @@ Embedding generation and vector database management
 """
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
-import json
+from typing import List, Dict, Any, Optional, Union
 from pathlib import Path
 from loguru import logger
-from openai import OpenAI
 from backend.core.config import get_settings
+from backend.services.embedding_providers import EmbeddingProvider, get_embedding_provider
+from backend.services.collection_aliases import CollectionAliases
+from backend.services.collection_stats import CollectionStatsStore
+from backend.services.vector_index import VectorIndex
+from backend.services.bm25_index import BM25Index, reciprocal_rank_fusion
+from backend.utils.vector_codec import save_vector_snapshot, current_export
+from backend.utils.metadata import flatten_chunk_metadata
+import numpy as np
+import json
 import time
 
 
 class EmbeddingService:
     """Service for generating embeddings and managing vector database"""
     
-    def __init__(self):
+    def __init__(self, provider: Optional[EmbeddingProvider] = None):
         self.settings = get_settings()
-        self.client = OpenAI(api_key=self.settings.openai_api_key)
+        self.provider = provider or get_embedding_provider(self.settings)
         self.chroma_client = None
         self.collection = None
+        self.collection_alias = None
+        self.collection_name = None
+        self.aliases = None
+        self.stats_store = None
+        self._alias_mtime = None
+        self.vector_index = None
+        self._snapshot_export = None
+        self.bm25_index = None
+        self._bm25_export = None
         
     def initialize_chromadb(self, collection_name: str = "sentiment_data"):
-        """Initialize ChromaDB client and collection"""
+        """
+        Initialize ChromaDB client and collection
+        
+        collection_name may be an alias (see CollectionAliases); it is resolved
+        to the physical versioned collection currently serving queries.
+        """
         logger.info(f"Initializing ChromaDB at {self.settings.chromadb_path}")
         
         # Create directory if it doesn't exist
@@ -33,27 +54,122 @@ class EmbeddingService:
             path=self.settings.chromadb_path
         )
         
+        # Resolve blue-green alias to the live collection
+        self.aliases = CollectionAliases(self.settings.chromadb_path)
+        self._alias_mtime = self.aliases.mtime()
+        self.collection_alias = collection_name
+        collection_name = self.aliases.resolve(collection_name)
+        self.collection_name = collection_name
+        self.stats_store = CollectionStatsStore(self.settings.chromadb_path)
+        
         # Get or create collection
         try:
             self.collection = self.chroma_client.get_collection(name=collection_name)
             logger.info(f"Loaded existing collection '{collection_name}' with {self.collection.count()} documents")
+            
+            # Vectors from different providers live in incompatible spaces
+            stored_model = (self.collection.metadata or {}).get('embedding_model')
+            if stored_model and stored_model != self.provider.name:
+                logger.warning(
+                    f"Collection '{collection_name}' was built with {stored_model} "
+                    f"but the active embedding provider is {self.provider.name}"
+                )
         except:
             self.collection = self.chroma_client.create_collection(
                 name=collection_name,
-                metadata={"hnsw:space": "cosine"}
+                metadata={"hnsw:space": "cosine", "embedding_model": self.provider.name}
             )
             logger.info(f"Created new collection '{collection_name}'")
         
+        if self.settings.vector_backend == "numpy":
+            self.load_vector_index()
+        if self.settings.hybrid_search_enabled:
+            self.load_bm25_index()
+        
         return self.collection
     
+    def _serves_live_collection(self, index) -> bool:
+        """Whether a loaded snapshot or keyword index was exported from the collection being served"""
+        return index is not None and index.collection in (None, self.collection_name)
+    
+    def load_vector_index(self) -> Optional[VectorIndex]:
+        """Load the in-process NumPy index from the vector snapshot"""
+        self._snapshot_export = current_export(self.settings.vector_snapshot_path)
+        try:
+            self.vector_index = VectorIndex.from_snapshot(self.settings.vector_snapshot_path)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"Vector snapshot unusable ({e}); falling back to ChromaDB search")
+            self.vector_index = None
+            return None
+        if not self._serves_live_collection(self.vector_index):
+            logger.warning(
+                f"Vector snapshot was exported from '{self.vector_index.collection}' but "
+                f"'{self.collection_name}' is live; searching ChromaDB until it is re-exported"
+            )
+        return self.vector_index
+    
+    def load_bm25_index(self) -> Optional[BM25Index]:
+        """Load (memory-map) the BM25 keyword index used for hybrid search"""
+        self._bm25_export = current_export(self.settings.bm25_index_path)
+        try:
+            self.bm25_index = BM25Index.load(self.settings.bm25_index_path)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"BM25 index unusable ({e}); using vector search only")
+            self.bm25_index = None
+            return None
+        if not self._serves_live_collection(self.bm25_index):
+            logger.warning(
+                f"BM25 index was built from '{self.bm25_index.collection}' but "
+                f"'{self.collection_name}' is live; using vector search only until it is rebuilt"
+            )
+        return self.bm25_index
+    
+    def refresh_collection(self):
+        """Switch to a new live collection if the alias was flipped by a reindex"""
+        if self.vector_index is not None and current_export(self.settings.vector_snapshot_path) != self._snapshot_export:
+            logger.info("Vector snapshot changed on disk, reloading NumPy index")
+            self.load_vector_index()
+        if self.bm25_index is not None and current_export(self.settings.bm25_index_path) != self._bm25_export:
+            logger.info("BM25 index changed on disk, reloading it")
+            self.load_bm25_index()
+        
+        if self.aliases is None or self.aliases.mtime() == self._alias_mtime:
+            return
+        
+        self._alias_mtime = self.aliases.mtime()
+        target = self.aliases.resolve(self.collection_alias)
+        if target != self.collection_name:
+            logger.info(f"Alias '{self.collection_alias}' moved from '{self.collection_name}' to '{target}'")
+            self.collection = self.chroma_client.get_collection(name=target)
+            self.collection_name = target
+    
+    def dataset_version(self) -> str:
+        """Identifier that changes whenever the served collection is rebuilt or re-ingested"""
+        self.refresh_collection()
+        stats = self.stats_store.get(self.collection_name) if self.stats_store else None
+        build = f"{stats['build_version']}@{stats['updated_at']}" if stats else "0"
+        return f"{self.collection_name}:{build}"
+    
+    def list_collection_names(self) -> List[str]:
+        """Names of all collections in the database"""
+        # Older ChromaDB releases return Collection objects, newer ones names
+        return [
+            c if isinstance(c, str) else c.name
+            for c in self.chroma_client.list_collections()
+        ]
+    
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for a single text"""
         try:
-            response = self.client.embeddings.create(
-                model=self.settings.openai_embedding_model,
-                input=text
-            )
-            return response.data[0].embedding
+            return self.provider.embed([text])[0]
+        except Exception as e:
+            logger.error(f"Error generating embedding: {e}")
+            raise
+    
+    async def agenerate_embedding(self, text: str) -> List[float]:
+        """Generate embedding for a single text without blocking the event loop"""
+        try:
+            return (await self.provider.aembed([text]))[0]
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             raise
@@ -67,15 +183,11 @@ class EmbeddingService:
             logger.info(f"Generating embeddings for batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
             
             try:
-                response = self.client.embeddings.create(
-                    model=self.settings.openai_embedding_model,
-                    input=batch
-                )
-                batch_embeddings = [item.embedding for item in response.data]
-                embeddings.extend(batch_embeddings)
+                embeddings.extend(self.provider.embed(batch))
                 
                 # Small delay to respect rate limits
-                time.sleep(0.1)
+                if self.provider.batch_delay:
+                    time.sleep(self.provider.batch_delay)
                 
             except Exception as e:
                 logger.error(f"Error generating embeddings for batch: {e}")
@@ -93,7 +205,7 @@ class EmbeddingService:
         # Prepare data
         texts = [chunk['text'] for chunk in chunks]
         ids = [chunk['chunk_id'] for chunk in chunks]
-        metadatas = [chunk['metadata'] for chunk in chunks]
+        metadatas = [flatten_chunk_metadata(chunk['metadata']) for chunk in chunks]
         
         # Generate embeddings in batches
         embeddings = self.generate_embeddings_batch(texts, batch_size=batch_size)
@@ -108,99 +220,394 @@ class EmbeddingService:
                 documents=texts[i:end_idx],
                 metadatas=metadatas[i:end_idx]
             )
+            self.stats_store.record_chunks(
+                self.collection_name, ids[i:end_idx], texts[i:end_idx], metadatas[i:end_idx]
+            )
             
             logger.info(f"Added batch {i//batch_size + 1}/{(len(chunks)-1)//batch_size + 1}")
         
+        if embeddings:
+            self.stats_store.set_info(self.collection_name, self.provider.name, len(embeddings[0]))
+        
         logger.info(f"Successfully added {len(chunks)} chunks to vector database")
         
     def query_similar_chunks(
         self, 
         query: str, 
         top_k: int = 10,
-        filter_dict: Optional[Dict[str, Any]] = None
+        filter_dict: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+        include_embeddings: bool = False
     ) -> Dict[str, Any]:
-        """Query similar chunks from vector database"""
+        """
+        Query similar chunks from vector database
+        
+        query_embedding may be passed to reuse an embedding across several
+        searches for the same query. With include_embeddings the result also
+        carries each chunk's vector under 'embeddings' (e.g. for MMR reranking).
+        
+        When a BM25 index is loaded the vector and keyword rankings are fused
+        (see _fuse_keyword_results).
+        """
         if self.collection is None:
             raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
         
+        self.refresh_collection()
+        
         # Generate query embedding
-        query_embedding = self.generate_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.generate_embedding(query)
         
-        # Query ChromaDB
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where=filter_dict if filter_dict else None
-        )
+        # Query the in-process index or ChromaDB
+        results = self._search([query_embedding], top_k, filter_dict, include_embeddings)
+        formatted = self._format_results(results, 0)
+        
+        if self._serves_live_collection(self.bm25_index):
+            formatted = self._fuse_keyword_results(query, formatted, top_k, filter_dict)
+        
+        return formatted
+    
+    def _fuse_keyword_results(
+        self,
+        query: str,
+        vector_results: Dict[str, Any],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Merge BM25 hits into vector results with reciprocal rank fusion
+        
+        Returns:
+            The top_k fused chunks in the query_similar_chunks format.
+            'distances' become 1 - fused score / best fused score (0.0 for the
+            top chunk), since keyword-only hits have no vector distance;
+            embeddings of keyword-only hits are fetched when requested.
+        """
+        keyword_results = self.bm25_index.query(query, n_results=top_k, where=filter_dict)
+        if not keyword_results['ids']:
+            return vector_results
+        
+        fused = reciprocal_rank_fusion(
+            [vector_results['ids'], keyword_results['ids']],
+            k=self.settings.rrf_k
+        )[:top_k]
+        
+        records = {}
+        for source in (keyword_results, vector_results):
+            for i, chunk_id in enumerate(source['ids']):
+                records[chunk_id] = (source['documents'][i], source['metadatas'][i])
         
-        # Format results
-        formatted_results = {
-            'documents': results['documents'][0] if results['documents'] else [],
-            'metadatas': results['metadatas'][0] if results['metadatas'] else [],
-            'distances': results['distances'][0] if results['distances'] else [],
-            'ids': results['ids'][0] if results['ids'] else []
+        best = fused[0][1]
+        results = {
+            'documents': [records[chunk_id][0] for chunk_id, _ in fused],
+            'metadatas': [records[chunk_id][1] for chunk_id, _ in fused],
+            'distances': [1.0 - score / best for _, score in fused],
+            'ids': [chunk_id for chunk_id, _ in fused]
         }
         
-        return formatted_results
+        if 'embeddings' in vector_results:
+            vectors = dict(zip(vector_results['ids'], vector_results['embeddings']))
+            missing = [chunk_id for chunk_id in results['ids'] if chunk_id not in vectors]
+            vectors.update(self._get_embeddings(missing))
+            if all(chunk_id in vectors for chunk_id in results['ids']):
+                results['embeddings'] = [vectors[chunk_id] for chunk_id in results['ids']]
+        
+        logger.debug(
+            f"Hybrid search: {len(vector_results['ids'])} vector, {len(keyword_results['ids'])} keyword hits, "
+            f"{sum(chunk_id not in vector_results['ids'] for chunk_id in results['ids'])} from keywords only"
+        )
+        return results
     
-    def get_collection_stats(self) -> Dict[str, Any]:
-        """Get statistics about the collection"""
+    def _get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors by chunk ID (missing IDs are skipped)"""
+        if not ids:
+            return {}
+        if self._serves_live_collection(self.vector_index):
+            return self.vector_index.get_embeddings(ids)
+        page = self.collection.get(ids=list(ids), include=["embeddings"])
+        return {chunk_id: list(vector) for chunk_id, vector in zip(page['ids'], page['embeddings'])}
+    
+    def query_similar_chunks_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        filters: Optional[Union[Dict[str, Any], List[Optional[Dict[str, Any]]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Query similar chunks for several queries at once
+        
+        All queries are embedded in a single provider call and searched with
+        one batched query per distinct filter. Keyword results are fused per
+        query as in query_similar_chunks, so both return the same ranking.
+        
+        Args:
+            queries: Query texts
+            top_k: Number of results per query
+            filters: One where clause applied to every query, or a list with
+                one (possibly None) clause per query
+            
+        Returns:
+            List of results in the same format as query_similar_chunks, one per query
+        """
         if self.collection is None:
             raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
+        if not queries:
+            return []
+        
+        if isinstance(filters, list):
+            if len(filters) != len(queries):
+                raise ValueError("filters must have one entry per query")
+            per_query_filters = filters
+        else:
+            per_query_filters = [filters] * len(queries)
+        
+        self.refresh_collection()
+        
+        try:
+            query_embeddings = self.provider.embed(list(queries))
+        except Exception as e:
+            logger.error(f"Error generating embeddings for batch: {e}")
+            raise
+        
+        # ChromaDB takes one where clause per call, so group queries by filter
+        groups: Dict[str, List[int]] = {}
+        for i, filter_dict in enumerate(per_query_filters):
+            key = json.dumps(filter_dict, sort_keys=True, default=str) if filter_dict else ""
+            groups.setdefault(key, []).append(i)
+        
+        formatted: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        for positions in groups.values():
+            results = self._search(
+                [query_embeddings[i] for i in positions],
+                top_k,
+                per_query_filters[positions[0]]
+            )
+            for row, i in enumerate(positions):
+                formatted[i] = self._format_results(results, row)
         
-        count = self.collection.count()
+        if self._serves_live_collection(self.bm25_index):
+            formatted = [
+                self._fuse_keyword_results(query, results, top_k, filter_dict)
+                for query, results, filter_dict in zip(queries, formatted, per_query_filters)
+            ]
         
-        # Get sample to analyze chunk types
-        sample = self.collection.get(limit=min(100, count))
+        return formatted
+    
+    def get_chunks_by_ids(self, ids: List[str]) -> Dict[str, Any]:
+        """
+        Fetch chunks by their deterministic IDs, without embedding anything
+        
+        Returns:
+            Results in the query_similar_chunks format (distance 0.0 for exact
+            matches), in the requested order; missing IDs are skipped
+        """
+        if self.collection is None:
+            raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
         
-        chunk_types = {}
-        if sample['metadatas']:
-            for metadata in sample['metadatas']:
-                chunk_type = metadata.get('type', 'unknown')
-                chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
+        self.refresh_collection()
         
-        return {
-            'total_chunks': count,
-            'chunk_types_sample': chunk_types
+        if self._serves_live_collection(self.vector_index):
+            found = self.vector_index.get(ids)
+        else:
+            page = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+            by_id = {
+                chunk_id: (document, metadata)
+                for chunk_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas'])
+            }
+            present = [chunk_id for chunk_id in ids if chunk_id in by_id]
+            found = {
+                'ids': present,
+                'documents': [by_id[chunk_id][0] for chunk_id in present],
+                'metadatas': [by_id[chunk_id][1] or {} for chunk_id in present]
+            }
+        
+        found['distances'] = [0.0] * len(found['ids'])
+        return found
+    
+    @staticmethod
+    def _format_results(results: Dict[str, Any], row: int) -> Dict[str, Any]:
+        """Flatten one query's row of a (batched) search result"""
+        formatted = {
+            key: results[key][row] if results.get(key) else []
+            for key in ('documents', 'metadatas', 'distances', 'ids')
         }
+        # ChromaDB returns embeddings as arrays, so no truthiness test here
+        if results.get('embeddings') is not None:
+            formatted['embeddings'] = [list(vector) for vector in results['embeddings'][row]]
+        return formatted
+    
+    def _search(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        """Run a (batched) nearest-neighbour search on the active backend"""
+        if self._serves_live_collection(self.vector_index):
+            return self.vector_index.query(
+                query_embeddings,
+                n_results=top_k,
+                where=filter_dict if filter_dict else None,
+                include_embeddings=include_embeddings
+            )
+        
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=filter_dict if filter_dict else None,
+            include=include
+        )
+    
+    def export_vector_snapshot(
+        self,
+        directory: Optional[str] = None,
+        dtype: Optional[str] = None,
+        page_size: int = 1000
+    ) -> Dict[str, Any]:
+        """
+        Write the collection to a compact on-disk vector snapshot
+        
+        Args:
+            directory: Output directory (defaults to settings.vector_snapshot_path)
+            dtype: Storage dtype, one of float32/float16/int8
+                (defaults to settings.vector_storage_dtype)
+            page_size: Number of records read from ChromaDB per request
+            
+        Returns:
+            Snapshot manifest
+        """
+        if self.collection is None:
+            raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
+        
+        directory = directory or self.settings.vector_snapshot_path
+        dtype = dtype or self.settings.vector_storage_dtype
+        
+        ids, documents, metadatas, vectors = [], [], [], []
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            ids.extend(page['ids'])
+            documents.extend(page['documents'])
+            metadatas.extend(page['metadatas'])
+            vectors.extend(page['embeddings'])
+        
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        manifest = save_vector_snapshot(
+            directory, ids, matrix, documents, metadatas,
+            dtype=dtype,
+            embedding_model=self.provider.name,
+            collection=self.collection_name
+        )
+        
+        logger.info(
+            f"Exported {manifest['count']} vectors ({manifest['dimensions']} dims, {dtype}, "
+            f"{manifest['vector_bytes'] / 1e6:.1f} MB) to {directory}"
+        )
+        return manifest
+    
+    def export_bm25_index(self, directory: Optional[str] = None, page_size: int = 1000) -> Dict[str, Any]:
+        """
+        Build the BM25 keyword index from the collection and write it to disk
+        
+        The index records the collection it was read from and is only fused
+        into searches while that collection is live.
+        
+        Args:
+            directory: Output directory (defaults to settings.bm25_index_path)
+            page_size: Number of records read from ChromaDB per request
+            
+        Returns:
+            Index manifest
+        """
+        if self.collection is None:
+            raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
+        
+        directory = directory or self.settings.bm25_index_path
+        
+        ids, documents, metadatas = [], [], []
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            ids.extend(page['ids'])
+            documents.extend(page['documents'])
+            metadatas.extend(page['metadatas'])
+        
+        manifest = BM25Index.build(ids, documents, metadatas, collection=self.collection_name).save(directory)
+        logger.info(f"Built BM25 index: {manifest['count']} chunks, {manifest['terms']} terms in {directory}")
+        return manifest
+    
+    def sync_collection_stats(self, page_size: int = 1000) -> Dict[str, Any]:
+        """
+        Rebuild the stats sidecar from a full scan of the collection
+        
+        Only needed for collections indexed before the sidecar existed or
+        modified outside the indexer; ingestion keeps it current otherwise.
+        """
+        if self.collection is None:
+            raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
+        
+        ids, documents, metadatas = [], [], []
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            ids.extend(page['ids'])
+            documents.extend(page['documents'])
+            metadatas.extend(page['metadatas'])
+        
+        dimensions = None
+        if total:
+            first = self.collection.get(limit=1, include=["embeddings"])['embeddings']
+            dimensions = len(first[0]) if first is not None and len(first) else None
+        
+        stored_model = (self.collection.metadata or {}).get('embedding_model')
+        self.stats_store.replace_all(self.collection_name, ids, documents, metadatas)
+        self.stats_store.set_info(self.collection_name, stored_model, dimensions)
+        logger.info(f"Reconciled collection stats for '{self.collection_name}' ({len(ids)} chunks)")
+        return self.stats_store.get(self.collection_name)
+    
+    def get_collection_stats(self) -> Dict[str, Any]:
+        """Get statistics about the collection (read from the stats sidecar)"""
+        if self.collection is None:
+            raise ValueError("ChromaDB collection not initialized. Call initialize_chromadb() first.")
+        
+        self.refresh_collection()
+        
+        stats = self.stats_store.get(self.collection_name)
+        if stats is None:
+            # Collection predates the sidecar: scan once, then reads are O(1)
+            stats = self.sync_collection_stats()
+        
+        return stats
 
 
 def load_and_embed_data():
-    """Load processed data and create embeddings"""
-    settings = get_settings()
-    
-    # Load chunks from processed data
-    chunks_path = Path(settings.processed_data_path) / "text_chunks.json"
+    """Load processed data and create embeddings (resumable, non-interactive)"""
+    from backend.services.indexer import ChunkIndexer, load_chunks
     
-    if not chunks_path.exists():
-        logger.error(f"Chunks file not found at {chunks_path}")
-        logger.info("Please run data_loader.py first to generate chunks")
+    try:
+        chunks = load_chunks()
+    except FileNotFoundError as e:
+        logger.error(str(e))
         return
     
-    logger.info(f"Loading chunks from {chunks_path}")
-    with open(chunks_path, 'r') as f:
-        chunks = json.load(f)
-    
     logger.info(f"Loaded {len(chunks)} chunks")
     
-    # Initialize embedding service
-    embedding_service = EmbeddingService()
-    embedding_service.initialize_chromadb()
-    
-    # Check if database already has data
-    current_count = embedding_service.collection.count()
-    if current_count > 0:
-        logger.warning(f"Collection already has {current_count} documents")
-        response = input("Do you want to clear and re-create? (yes/no): ")
-        if response.lower() == 'yes':
-            embedding_service.chroma_client.delete_collection("sentiment_data")
-            embedding_service.initialize_chromadb()
-        else:
-            logger.info("Keeping existing collection")
-            return
+    # Upsert new/changed chunks, resuming from the last checkpoint
+    indexer = ChunkIndexer(batch_size=50)
+    indexer.run(chunks)
+    embedding_service = indexer.embedding_service
     
-    # Add chunks to database
-    embedding_service.add_chunks_to_db(chunks, batch_size=50)
+    # Write the compact vector snapshot and keyword index alongside ChromaDB
+    embedding_service.export_vector_snapshot()
+    embedding_service.export_bm25_index()
     
     # Print stats
     stats = embedding_service.get_collection_stats()
@@ -208,7 +615,8 @@ def load_and_embed_data():
     print("Vector Database Summary")
     print("="*50)
     print(f"Total chunks in database: {stats['total_chunks']}")
-    print(f"Chunk types: {stats['chunk_types_sample']}")
+    print(f"Chunk types: {stats['chunk_types']}")
+    print(f"Total tokens: {stats['total_tokens']}")
     print("="*50 + "\n")
     
     logger.info("Embedding generation complete!")
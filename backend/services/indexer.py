@@ -0,0 +1,456 @@
+"""
+Resumable, idempotent vector ingestion
+
+Chunks are upserted by chunk_id in batches. After every committed batch a
+checkpoint is written, so a crashed run resumes where it stopped instead of
+paying for every embedding again. Each chunk stores a content hash in its
+metadata: unchanged chunks are skipped on re-runs and IDs no longer present in
+the chunk set are deleted. The collection stats sidecar (per-type counts,
+tokens, embedding model, build version) is updated alongside every batch.
+
+With --blue-green the chunks are built into a fresh versioned collection
+(sentiment_data_v{n}), validated with smoke queries and only then made live by
+flipping the collection alias, so serving processes never see a half-built or
+empty index.
+
+Usage:
+    python -m backend.services.indexer [--reset] [--no-prune] [--batch-size 50]
+    python -m backend.services.indexer --blue-green [--keep-versions 2]
+"""
+from typing import List, Dict, Any, Optional, Set, Tuple
+from pathlib import Path
+from datetime import datetime
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from loguru import logger
+from backend.core.config import get_settings
+from backend.services.embeddings import EmbeddingService
+from backend.services.collection_aliases import collection_version
+from backend.utils.metadata import flatten_chunk_metadata
+
+
+def chunk_content_hash(chunk: Dict[str, Any]) -> str:
+    """Stable hash of everything that ends up in the vector database for a chunk"""
+    payload = json.dumps(
+        {'text': chunk['text'], 'metadata': chunk['metadata']},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def prepare_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Flatten metadata into filterable scalar fields (idempotent for new chunk files)"""
+    return [{**chunk, 'metadata': flatten_chunk_metadata(chunk['metadata'])} for chunk in chunks]
+
+
+def chunks_fingerprint(chunks: List[Dict[str, Any]]) -> str:
+    """Fingerprint of an ordered chunk set, used to validate checkpoints"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk['chunk_id'].encode('utf-8'))
+        digest.update(chunk_content_hash(chunk).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ChunkIndexer:
+    """Upsert-based indexer with checkpointing and pruning"""
+
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        checkpoint_path: Optional[str] = None,
+        batch_size: int = 50
+    ):
+        self.settings = get_settings()
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.checkpoint_path = Path(
+            checkpoint_path or Path(self.settings.processed_data_path) / "ingest_checkpoint.json"
+        )
+        self.batch_size = batch_size
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        """Load the last checkpoint, or an empty one"""
+        if not self.checkpoint_path.exists():
+            return {}
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {e}")
+            return {}
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]):
+        """Atomically persist a checkpoint"""
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint['updated_at'] = datetime.now().isoformat()
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _existing_hashes(self, page_size: int = 1000) -> Dict[str, Optional[str]]:
+        """Map of chunk_id -> stored content hash for the whole collection"""
+        collection = self.embedding_service.collection
+        existing = {}
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+            for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+                existing[chunk_id] = (metadata or {}).get('content_hash')
+        return existing
+
+    def _prune(self, existing_ids: Set[str], current_ids: Set[str]) -> int:
+        """Delete IDs that are no longer part of the chunk set"""
+        stale = sorted(existing_ids - current_ids)
+        service = self.embedding_service
+        for i in range(0, len(stale), self.batch_size):
+            service.collection.delete(ids=stale[i:i + self.batch_size])
+            service.stats_store.remove_chunks(service.collection_name, stale[i:i + self.batch_size])
+        if stale:
+            logger.info(f"Deleted {len(stale)} stale chunks")
+        return len(stale)
+
+    def run(
+        self,
+        chunks: List[Dict[str, Any]],
+        collection_name: str = "sentiment_data",
+        prune: bool = True,
+        reset: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Index chunks into a collection, resuming from the last checkpoint
+
+        Args:
+            chunks: Chunks as produced by SentimentChunker
+            collection_name: Target ChromaDB collection
+            prune: Delete IDs not present in chunks
+            reset: Ignore the checkpoint and re-check every chunk
+
+        Returns:
+            Dict with counts of upserted, skipped and deleted chunks
+        """
+        start_time = time.time()
+        chunks = prepare_chunks(chunks)
+        service = self.embedding_service
+        service.initialize_chromadb(collection_name)
+        collection = service.collection
+        dimensions = None
+
+        fingerprint = chunks_fingerprint(chunks)
+        checkpoint = {} if reset else self.load_checkpoint()
+
+        start_offset = 0
+        if checkpoint.get('collection') == collection_name and checkpoint.get('fingerprint') == fingerprint:
+            start_offset = checkpoint.get('next_offset', 0)
+            if start_offset:
+                logger.info(f"Resuming from checkpoint at chunk {start_offset}/{len(chunks)}")
+
+        existing = self._existing_hashes()
+        stats = {'upserted': 0, 'skipped': start_offset, 'deleted': 0, 'total': len(chunks)}
+
+        for i in range(start_offset, len(chunks), self.batch_size):
+            batch = chunks[i:i + self.batch_size]
+
+            # Only pay for embeddings of new or changed chunks
+            pending = []
+            for chunk in batch:
+                content_hash = chunk_content_hash(chunk)
+                if existing.get(chunk['chunk_id']) != content_hash:
+                    pending.append((chunk, content_hash))
+
+            if pending:
+                ids = [chunk['chunk_id'] for chunk, _ in pending]
+                texts = [chunk['text'] for chunk, _ in pending]
+                metadatas = [{**chunk['metadata'], 'content_hash': h} for chunk, h in pending]
+                embeddings = service.generate_embeddings_batch(texts, batch_size=self.batch_size)
+                collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+                service.stats_store.record_chunks(service.collection_name, ids, texts, metadatas)
+                dimensions = len(embeddings[0])
+
+            stats['upserted'] += len(pending)
+            stats['skipped'] += len(batch) - len(pending)
+
+            self.save_checkpoint({
+                'collection': collection_name,
+                'fingerprint': fingerprint,
+                'next_offset': i + len(batch),
+                'total': len(chunks),
+                'complete': False
+            })
+            logger.info(f"Committed chunks {i + 1}-{i + len(batch)}/{len(chunks)} ({len(pending)} embedded)")
+
+        if prune:
+            stats['deleted'] = self._prune(set(existing), {c['chunk_id'] for c in chunks})
+
+        # Chunks written before the sidecar existed (or by other tools) are
+        # picked up by a one-off full reconcile
+        if service.stats_store.count(service.collection_name) != collection.count():
+            service.sync_collection_stats()
+        service.stats_store.set_info(
+            service.collection_name,
+            embedding_model=service.provider.name,
+            dimensions=dimensions,
+            bump_version=True
+        )
+
+        self.save_checkpoint({
+            'collection': collection_name,
+            'fingerprint': fingerprint,
+            'next_offset': len(chunks),
+            'total': len(chunks),
+            'complete': True
+        })
+
+        stats['duration_seconds'] = round(time.time() - start_time, 2)
+        logger.info(
+            f"Indexing complete: {stats['upserted']} upserted, {stats['skipped']} unchanged, "
+            f"{stats['deleted']} deleted in {stats['duration_seconds']}s"
+        )
+        return stats
+
+    def _next_version(self, alias: str) -> int:
+        """Version to build: an unfinished build is resumed, otherwise max + 1"""
+        checkpoint = self.load_checkpoint()
+        pending = collection_version(alias, checkpoint.get('collection', ''))
+        if pending and not checkpoint.get('complete'):
+            logger.info(f"Resuming unfinished build of {checkpoint['collection']}")
+            return pending
+
+        versions = [
+            collection_version(alias, name)
+            for name in self.embedding_service.list_collection_names()
+        ]
+        return max([v for v in versions if v is not None], default=0) + 1
+
+    def _copy_unchanged(self, source, target, chunks: List[Dict[str, Any]], page_size: int = 500) -> int:
+        """Copy vectors for unchanged chunks from the live collection instead of re-embedding"""
+        wanted = {chunk['chunk_id']: chunk_content_hash(chunk) for chunk in chunks}
+        copied = 0
+
+        total = source.count()
+        for offset in range(0, total, page_size):
+            page = source.get(
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            keep = [
+                i for i, (chunk_id, metadata) in enumerate(zip(page['ids'], page['metadatas']))
+                if chunk_id in wanted and (metadata or {}).get('content_hash') == wanted[chunk_id]
+            ]
+            if not keep:
+                continue
+
+            embeddings = np.asarray(page['embeddings'], dtype=np.float32)[keep]
+            ids = [page['ids'][i] for i in keep]
+            documents = [page['documents'][i] for i in keep]
+            metadatas = [page['metadatas'][i] for i in keep]
+            target.upsert(ids=ids, embeddings=embeddings.tolist(), documents=documents, metadatas=metadatas)
+            self.embedding_service.stats_store.record_chunks(target.name, ids, documents, metadatas)
+            copied += len(keep)
+
+        return copied
+
+    def validate(
+        self,
+        collection,
+        chunks: List[Dict[str, Any]],
+        smoke_queries: Optional[List[str]] = None,
+        samples: int = 5
+    ) -> Tuple[bool, List[str]]:
+        """
+        Smoke-test a freshly built collection before it goes live
+
+        Checks the document count, that sampled chunks retrieve themselves in
+        the top 3 and that every smoke query returns results.
+
+        Returns:
+            (is_valid, list of failure reasons)
+        """
+        failures = []
+
+        count = collection.count()
+        if count != len(chunks):
+            failures.append(f"expected {len(chunks)} documents, found {count}")
+
+        step = max(1, len(chunks) // samples)
+        sampled = chunks[::step][:samples]
+        queries = [chunk['text'] for chunk in sampled] + list(smoke_queries or [])
+        if not queries:
+            return not failures, failures
+
+        embeddings = self.embedding_service.generate_embeddings_batch(queries, batch_size=self.batch_size)
+        results = collection.query(query_embeddings=embeddings, n_results=min(3, max(count, 1)))
+
+        for chunk, ids in zip(sampled, results['ids']):
+            if chunk['chunk_id'] not in ids:
+                failures.append(f"chunk '{chunk['chunk_id']}' does not retrieve itself")
+        for query, ids in zip(smoke_queries or [], results['ids'][len(sampled):]):
+            if not ids:
+                failures.append(f"smoke query '{query}' returned no results")
+
+        return not failures, failures
+
+    def _drop_collection(self, name: str):
+        self.embedding_service.chroma_client.delete_collection(name)
+        self.embedding_service.stats_store.drop(name)
+
+    def _discard_build(self, name: str):
+        """Delete a build that failed validation, with its checkpoint, so it never counts as a version"""
+        try:
+            self._drop_collection(name)
+        except Exception as e:
+            logger.error(f"Could not delete failed build {name}: {e}")
+        if self.load_checkpoint().get('collection') == name:
+            self.checkpoint_path.unlink(missing_ok=True)
+
+    def _garbage_collect(self, alias: str, keep_versions: int, live_name: str) -> List[str]:
+        """
+        Drop old versions, keeping the live one and the keep_versions - 1
+        versions before it (rollback targets)
+
+        Versions newer than the live one are never counted or deleted.
+        """
+        live_version = collection_version(alias, live_name)
+        versions = sorted(
+            (
+                (collection_version(alias, name), name)
+                for name in self.embedding_service.list_collection_names()
+                if collection_version(alias, name) is not None
+            ),
+            reverse=True
+        )
+        versions = [(v, name) for v, name in versions if v <= live_version]
+
+        deleted = []
+        for _, name in versions[max(1, keep_versions):]:
+            self._drop_collection(name)
+            deleted.append(name)
+        if deleted:
+            logger.info(f"Garbage collected old collections: {', '.join(deleted)}")
+        return deleted
+
+    def rebuild(
+        self,
+        chunks: List[Dict[str, Any]],
+        alias: str = "sentiment_data",
+        smoke_queries: Optional[List[str]] = None,
+        keep_versions: int = 2
+    ) -> Dict[str, Any]:
+        """
+        Blue-green reindex: build a new versioned collection, validate it and
+        atomically flip the alias to it
+
+        Args:
+            chunks: Chunks as produced by SentimentChunker
+            alias: Logical collection name served to RAGEngine
+            smoke_queries: Extra queries that must return results
+            keep_versions: Number of versions to keep, including the new one
+
+        Returns:
+            Indexing stats plus the new collection name and deleted versions
+        """
+        chunks = prepare_chunks(chunks)
+        service = self.embedding_service
+        live = service.initialize_chromadb(alias)
+        live_name = service.collection_name
+        live_compatible = (live.metadata or {}).get('embedding_model') == service.provider.name
+
+        version = self._next_version(alias)
+        target_name = f"{alias}_v{version}"
+        logger.info(f"Building {target_name} (live: {live_name})")
+
+        target = service.initialize_chromadb(target_name)
+        copied = 0
+        if live_name != target_name and live_compatible and live.count() > 0:
+            copied = self._copy_unchanged(live, target, chunks)
+            logger.info(f"Copied {copied} unchanged vectors from {live_name}")
+
+        stats = self.run(chunks, collection_name=target_name, prune=True)
+        stats['copied'] = copied
+
+        is_valid, failures = self.validate(service.collection, chunks, smoke_queries)
+        if not is_valid:
+            service.initialize_chromadb(alias)
+            self._discard_build(target_name)
+            raise RuntimeError(f"Validation of {target_name} failed: {'; '.join(failures)}")
+
+        service.aliases.set(alias, target_name)
+        logger.info(f"Alias '{alias}' now points to {target_name}")
+
+        stats['collection'] = target_name
+        stats['deleted_versions'] = self._garbage_collect(alias, keep_versions, target_name)
+        service.initialize_chromadb(alias)
+        return stats
+
+
+def load_chunks(chunks_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Load processed text chunks from disk"""
+    settings = get_settings()
+    path = Path(chunks_path or Path(settings.processed_data_path) / "text_chunks.json")
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Chunks file not found at {path}. Run python -m backend.services.data_loader first."
+        )
+
+    logger.info(f"Loading chunks from {path}")
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Index text chunks into the vector database")
+    parser.add_argument('--chunks', help="Path to text_chunks.json")
+    parser.add_argument('--collection', default="sentiment_data")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--reset', action='store_true', help="Ignore the checkpoint")
+    parser.add_argument('--no-prune', action='store_true', help="Keep IDs missing from the chunk set")
+    parser.add_argument('--blue-green', action='store_true', help="Build a new version and flip the alias")
+    parser.add_argument('--keep-versions', type=int, default=2, help="Versions kept after a blue-green build")
+    parser.add_argument('--smoke-query', action='append', default=[], help="Query that must return results")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.chunks)
+    indexer = ChunkIndexer(batch_size=args.batch_size)
+    if args.blue_green:
+        stats = indexer.rebuild(
+            chunks,
+            alias=args.collection,
+            smoke_queries=args.smoke_query,
+            keep_versions=args.keep_versions
+        )
+    else:
+        stats = indexer.run(
+            chunks,
+            collection_name=args.collection,
+            prune=not args.no_prune,
+            reset=args.reset
+        )
+
+    # The NumPy backend serves from the snapshot, so refresh it with the index
+    if indexer.settings.vector_backend == "numpy":
+        indexer.embedding_service.export_vector_snapshot()
+    # Likewise the keyword index used for hybrid search
+    if indexer.settings.hybrid_search_enabled:
+        indexer.embedding_service.export_bm25_index()
+
+    print("\n" + "="*50)
+    print("Indexing Summary")
+    print("="*50)
+    print(f"Chunks: {stats['total']}")
+    print(f"Upserted: {stats['upserted']}")
+    print(f"Unchanged: {stats['skipped']}")
+    print(f"Deleted: {stats['deleted']}")
+    if 'collection' in stats:
+        print(f"Live collection: {stats['collection']} ({stats['copied']} vectors reused)")
+    print("="*50 + "\n")
+
+
+if __name__ == "__main__":
+    main()
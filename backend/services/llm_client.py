@@ -1,18 +1,54 @@
 """
 OpenAI LLM client for chat completions
 """
-from openai import OpenAI
-from typing import List, Dict, Any, Optional
+from openai import OpenAI, AsyncOpenAI
+from typing import List, Dict, Any, Optional, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from loguru import logger
 from backend.core.config import get_settings
+from backend.services.openai_client import get_openai_client, get_async_openai_client
 from backend.services.web_search import get_web_search_service
 from backend.services.external_apis import ExternalAPIService
+from backend.services.tool_cache import get_tool_cache, tool_cache_key
+from backend.utils.singleflight import SingleFlight
+from backend.utils.tokens import count_tokens
+import asyncio
+import threading
+import time
 import json
 
 
+_tool_executor: Optional[ThreadPoolExecutor] = None
+_tool_executor_lock = threading.Lock()
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all tool calls (web search and market APIs block)"""
+    global _tool_executor
+    if _tool_executor is None:
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                _tool_executor = ThreadPoolExecutor(
+                    max_workers=get_settings().tool_max_workers,
+                    thread_name_prefix="llm-tool"
+                )
+    return _tool_executor
+
+
+class ToolError(Exception):
+    """A tool ran but produced no usable result; the message goes to the model"""
+
+
 class LLMClient:
     """Client for OpenAI GPT-5"""
     
+    # Arguments the tools default, so omitted and explicit defaults share a cache key
+    TOOL_DEFAULTS = {
+        'search_web': {'search_depth': 'advanced'},
+        'get_news': {'days_back': 30},
+        'get_financial_data': {'days_back': 365}
+    }
+    
     # Define available tools for function calling
     TOOLS = [
         {
@@ -133,92 +169,221 @@ SECURITY RULES:
 
 Remember: You analyze 55+ years of sentiment index data across 32 countries. All information you provide is "Sephira data" regardless of its actual source. Provide confident, insightful analysis that helps users understand and anticipate sentiment trends."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[OpenAI] = None, async_client: Optional[AsyncOpenAI] = None):
+        """
+        Args:
+            client, async_client: OpenAI clients; default to the process-wide
+                pooled clients
+        """
         self.settings = get_settings()
-        self.client = OpenAI(api_key=self.settings.openai_api_key)
+        self.client = client or get_openai_client()
+        self.async_client = async_client or get_async_openai_client()
         self.web_search = get_web_search_service()
         self.external_apis = ExternalAPIService()
+        self.tool_cache = get_tool_cache()
+        # Identical tool calls in flight at once share one execution
+        self._tool_flight = SingleFlight()
         
     def _execute_function(self, function_name: str, arguments: Dict[str, Any]) -> str:
-        """Execute a function call and return results"""
+        """
+        Execute a function call and return results
+        
+        Successful results are served from and stored in the tool cache;
+        errors are never cached.
+        """
+        arguments = {**self.TOOL_DEFAULTS.get(function_name, {}), **arguments}
+        
+        cached = self.tool_cache.get(function_name, arguments) if self.tool_cache else None
+        if cached is not None:
+            return cached
+        
+        def run() -> str:
+            result = self._invoke_function(function_name, arguments)
+            if self.tool_cache:
+                self.tool_cache.set(function_name, arguments, result)
+            return result
+        
         try:
-            if function_name == "search_web":
-                query = arguments.get("query")
-                search_depth = arguments.get("search_depth", "advanced")
-                result = self.web_search.search(query, search_depth=search_depth)
-                
-                if result.get('error'):
-                    return f"Web search error: {result['error']}"
-                
-                # Format results for the LLM
-                formatted = f"Web search results for '{query}':\n\n"
-                if result.get('answer'):
-                    formatted += f"Answer: {result['answer']}\n\n"
-                formatted += "Sources:\n"
-                for i, res in enumerate(result.get('results', [])[:5], 1):
-                    formatted += f"{i}. {res['title']}\n   {res['content'][:200]}...\n   URL: {res['url']}\n\n"
-                return formatted
-                
-            elif function_name == "get_news":
-                query = arguments.get("query")
-                days_back = arguments.get("days_back", 30)
-                from datetime import datetime, timedelta
-                
-                from_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-                result = self.external_apis.get_news(query, from_date=from_date)
-                
-                if result.get('error'):
-                    return f"News search error: {result['error']}"
-                
-                formatted = f"Recent news for '{query}' (last {days_back} days):\n\n"
-                for i, article in enumerate(result.get('articles', [])[:5], 1):
-                    formatted += f"{i}. {article['title']}\n"
-                    formatted += f"   Source: {article['source']}\n"
-                    formatted += f"   {article['description']}\n"
-                    formatted += f"   Published: {article['published_at']}\n\n"
-                return formatted
-                
-            elif function_name == "get_financial_data":
-                symbol = arguments.get("symbol")
-                days_back = arguments.get("days_back", 365)
-                from datetime import datetime, timedelta
-                
-                start_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-                result = self.external_apis.get_financial_data(symbol, start_date=start_date)
-                
-                if result.get('error'):
-                    return f"Financial data error: {result['error']}"
-                
-                data = result.get('data', [])
-                if not data:
-                    return f"No financial data available for {symbol}"
-                
-                recent = data[-10:] if len(data) > 10 else data
-                formatted = f"Financial data for {symbol} ({result['info']['name']}):\n\n"
-                formatted += f"Recent prices (last {len(recent)} days):\n"
-                for d in recent:
-                    formatted += f"  {d['date']}: Close ${d['close']:.2f}, Volume {d['volume']:,}\n"
-                
-                if len(data) >= 2:
-                    change = ((data[-1]['close'] - data[0]['close']) / data[0]['close']) * 100
-                    formatted += f"\nChange over period: {change:+.2f}%"
-                
-                return formatted
-            
-            else:
-                return f"Unknown function: {function_name}"
-                
+            result, _ = self._tool_flight.call(tool_cache_key(function_name, arguments), run)
+            return result
+        except ToolError as e:
+            return str(e)
         except Exception as e:
             logger.error(f"Error executing function {function_name}: {e}")
             return f"Error executing {function_name}: {str(e)}"
     
+    def _invoke_function(self, function_name: str, arguments: Dict[str, Any]) -> str:
+        """Call the service behind a tool; raises ToolError for unusable results"""
+        if function_name == "search_web":
+            query = arguments.get("query")
+            search_depth = arguments.get("search_depth", "advanced")
+            result = self.web_search.search(query, search_depth=search_depth)
+            
+            if result.get('error'):
+                raise ToolError(f"Web search error: {result['error']}")
+                
+            # Format results for the LLM
+            formatted = f"Web search results for '{query}':\n\n"
+            if result.get('answer'):
+                formatted += f"Answer: {result['answer']}\n\n"
+            formatted += "Sources:\n"
+            for i, res in enumerate(result.get('results', [])[:5], 1):
+                formatted += f"{i}. {res['title']}\n   {res['content'][:200]}...\n   URL: {res['url']}\n\n"
+            return formatted
+            
+        elif function_name == "get_news":
+            query = arguments.get("query")
+            days_back = arguments.get("days_back", 30)
+            from datetime import datetime, timedelta
+            
+            from_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+            result = self.external_apis.get_news(query, from_date=from_date)
+            
+            if result.get('error'):
+                raise ToolError(f"News search error: {result['error']}")
+            
+            formatted = f"Recent news for '{query}' (last {days_back} days):\n\n"
+            for i, article in enumerate(result.get('articles', [])[:5], 1):
+                formatted += f"{i}. {article['title']}\n"
+                formatted += f"   Source: {article['source']}\n"
+                formatted += f"   {article['description']}\n"
+                formatted += f"   Published: {article['published_at']}\n\n"
+            return formatted
+            
+        elif function_name == "get_financial_data":
+            symbol = arguments.get("symbol")
+            days_back = arguments.get("days_back", 365)
+            from datetime import datetime, timedelta
+            
+            start_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+            result = self.external_apis.get_financial_data(symbol, start_date=start_date)
+            
+            if result.get('error'):
+                raise ToolError(f"Financial data error: {result['error']}")
+            
+            data = result.get('data', [])
+            if not data:
+                raise ToolError(f"No financial data available for {symbol}")
+            
+            recent = data[-10:] if len(data) > 10 else data
+            formatted = f"Financial data for {symbol} ({result['info']['name']}):\n\n"
+            formatted += f"Recent prices (last {len(recent)} days):\n"
+            for d in recent:
+                formatted += f"  {d['date']}: Close ${d['close']:.2f}, Volume {d['volume']:,}\n"
+            
+            if len(data) >= 2:
+                change = ((data[-1]['close'] - data[0]['close']) / data[0]['close']) * 100
+                formatted += f"\nChange over period: {change:+.2f}%"
+            
+            return formatted
+        
+        else:
+            raise ToolError(f"Unknown function: {function_name}")
+    
+    def _build_messages(
+        self,
+        query: str,
+        context: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        conversation_summary: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Build the chat messages for a RAG query"""
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT}
+        ]
+        
+        # Earlier turns of a long conversation, rolled up
+        if conversation_summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{conversation_summary}"
+            })
+        
+        # Add conversation history if available
+        if conversation_history:
+            messages.extend(conversation_history[-5:])  # Last 5 turns
+        
+        # Add current query with context
+        if context and context.strip():
+            user_message = f"""Context from sentiment database:
+{context}
+
+User question: {query}
+
+Please provide a detailed, accurate answer. Use the sentiment context if relevant, or use available tools (web search, news, financial data) if you need additional information."""
+        else:
+            user_message = f"""User question: {query}
+
+Please provide a detailed, accurate answer. Use available tools (web search, news, financial data) as needed."""
+        
+        messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    def _completion_params(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return {
+            'model': model or self.settings.openai_model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_completion_tokens': max_tokens,
+            'tools': self.TOOLS if self.web_search.is_available() else None
+        }
+    
+    @staticmethod
+    def _estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+        """Approximate prompt tokens of chat messages (content plus per-message overhead)"""
+        return sum(
+            4 + count_tokens(message.get('content') or "") + sum(
+                count_tokens(call['function']['arguments']) for call in message.get('tool_calls', [])
+            )
+            for message in messages
+        )
+    
+    @staticmethod
+    def _adjust_usage(total_usage: Dict[str, int], prompt_tokens: int, completion_tokens: int) -> None:
+        total_usage['prompt_tokens'] += prompt_tokens
+        total_usage['completion_tokens'] += completion_tokens
+        total_usage['total_tokens'] += prompt_tokens + completion_tokens
+    
+    @staticmethod
+    def _add_usage(total_usage: Dict[str, int], response) -> None:
+        if response.usage:
+            total_usage['prompt_tokens'] += response.usage.prompt_tokens
+            total_usage['completion_tokens'] += response.usage.completion_tokens
+            total_usage['total_tokens'] += response.usage.total_tokens
+    
+    @staticmethod
+    def _assistant_tool_message(message) -> Dict[str, Any]:
+        """Assistant message with tool calls (content can be None when making tool calls)"""
+        return {
+            "role": "assistant",
+            "content": message.content if message.content is not None else "",
+            "tool_calls": [
+                {
+                    "id": tc.id,
+                    "type": "function",
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                }
+                for tc in message.tool_calls
+            ]
+        }
+    
     def generate_response(
         self,
         query: str,
         context: str,
         conversation_history: Optional[List[Dict[str, str]]] = None,
         temperature: float = 0.7,
-        max_tokens: int = 4000
+        max_tokens: int = 4000,
+        conversation_summary: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Generate a response using GPT-5 with function calling
@@ -229,55 +394,26 @@ Remember: You analyze 55+ years of sentiment index data across 32 countries. All
             conversation_history: Previous conversation turns
             temperature: Sampling temperature
             max_tokens: Maximum tokens in response
+            conversation_summary: Summary of turns older than conversation_history
             
         Returns:
             Dict with response and metadata
         """
         try:
-            # Build messages
-            messages = [
-                {"role": "system", "content": self.SYSTEM_PROMPT}
-            ]
-            
-            # Add conversation history if available
-            if conversation_history:
-                messages.extend(conversation_history[-5:])  # Last 5 turns
-            
-            # Add current query with context
-            if context and context.strip():
-                user_message = f"""Context from sentiment database:
-{context}
-
-User question: {query}
-
-Please provide a detailed, accurate answer. Use the sentiment context if relevant, or use available tools (web search, news, financial data) if you need additional information."""
-            else:
-                user_message = f"""User question: {query}
-
-Please provide a detailed, accurate answer. Use available tools (web search, news, financial data) as needed."""
-            
-            messages.append({"role": "user", "content": user_message})
+            messages = self._build_messages(query, context, conversation_history, conversation_summary)
             
-            # Track total usage
+            # Track total usage and time spent in tools
             total_usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+            tool_calls, tool_seconds = 0, 0.0
             
             # Function calling loop (max 5 iterations to prevent infinite loops)
             max_iterations = 5
             for iteration in range(max_iterations):
                 # Call OpenAI API with tools
                 response = self.client.chat.completions.create(
-                    model=self.settings.openai_model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_completion_tokens=max_tokens,
-                    tools=self.TOOLS if self.web_search.is_available() else None
+                    **self._completion_params(messages, temperature, max_tokens)
                 )
-                
-                # Update usage
-                if response.usage:
-                    total_usage['prompt_tokens'] += response.usage.prompt_tokens
-                    total_usage['completion_tokens'] += response.usage.completion_tokens
-                    total_usage['total_tokens'] += response.usage.total_tokens
+                self._add_usage(total_usage, response)
                 
                 message = response.choices[0].message
                 finish_reason = response.choices[0].finish_reason
@@ -291,42 +427,17 @@ Please provide a detailed, accurate answer. Use available tools (web search, new
                         'finish_reason': finish_reason,
                         'usage': total_usage,
                         'model': response.model,
-                        'function_calls_made': iteration
+                        'function_calls_made': iteration,
+                        'tool_calls': tool_calls,
+                        'tool_seconds': tool_seconds
                     }
                 
-                # Add assistant message with tool calls (content can be None when making tool calls)
-                messages.append({
-                    "role": "assistant",
-                    "content": message.content if message.content is not None else "",
-                    "tool_calls": [
-                        {
-                            "id": tc.id,
-                            "type": "function",
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                        for tc in message.tool_calls
-                    ]
-                })
+                messages.append(self._assistant_tool_message(message))
                 
-                # Execute each tool call
-                for tool_call in message.tool_calls:
-                    function_name = tool_call.function.name
-                    arguments = json.loads(tool_call.function.arguments)
-                    
-                    logger.info(f"Executing function: {function_name} with args: {arguments}")
-                    
-                    # Execute function
-                    function_result = self._execute_function(function_name, arguments)
-                    
-                    # Add function result to messages
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": function_result
-                    })
+                # Execute the tool calls concurrently
+                calls = self._tool_call_dicts(message.tool_calls)
+                tool_seconds += self._run_tools(messages, calls)
+                tool_calls += len(calls)
                 
                 # Continue loop to get final response with tool results
             
@@ -337,13 +448,335 @@ Please provide a detailed, accurate answer. Use available tools (web search, new
                 'finish_reason': 'max_iterations',
                 'usage': total_usage,
                 'model': response.model,
-                'function_calls_made': max_iterations
+                'function_calls_made': max_iterations,
+                'tool_calls': tool_calls,
+                'tool_seconds': tool_seconds
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating LLM response: {e}")
+            raise
+    
+    async def agenerate_response(
+        self,
+        query: str,
+        context: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        conversation_summary: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of generate_response
+        
+        Completions go through AsyncOpenAI; blocking tool calls (web search,
+        news, market data) run in worker threads, so the event loop keeps
+        serving other requests while a response is generated.
+        """
+        try:
+            messages = self._build_messages(query, context, conversation_history, conversation_summary)
+            total_usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+            tool_calls, tool_seconds = 0, 0.0
+            
+            max_iterations = 5
+            for iteration in range(max_iterations):
+                response = await self.async_client.chat.completions.create(
+                    **self._completion_params(messages, temperature, max_tokens)
+                )
+                self._add_usage(total_usage, response)
+                
+                message = response.choices[0].message
+                finish_reason = response.choices[0].finish_reason
+                
+                if not message.tool_calls:
+                    return {
+                        'response': message.content if message.content is not None else "",
+                        'finish_reason': finish_reason,
+                        'usage': total_usage,
+                        'model': response.model,
+                        'function_calls_made': iteration,
+                        'tool_calls': tool_calls,
+                        'tool_seconds': tool_seconds
+                    }
+                
+                messages.append(self._assistant_tool_message(message))
+                
+                calls = self._tool_call_dicts(message.tool_calls)
+                tool_seconds += await self._arun_tools(messages, calls)
+                tool_calls += len(calls)
+            
+            logger.warning(f"Hit max function calling iterations ({max_iterations})")
+            return {
+                'response': "I apologize, but I encountered too many function calls. Please try rephrasing your question.",
+                'finish_reason': 'max_iterations',
+                'usage': total_usage,
+                'model': response.model,
+                'function_calls_made': max_iterations,
+                'tool_calls': tool_calls,
+                'tool_seconds': tool_seconds
             }
             
         except Exception as e:
             logger.error(f"Error generating LLM response: {e}")
             raise
     
+    async def astream_response(
+        self,
+        query: str,
+        context: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        conversation_summary: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of agenerate_response
+        
+        Text is yielded as it arrives. When the model calls tools, they run
+        between completions and streaming resumes with the next completion.
+        
+        Yields:
+            Events as described in astream_messages
+        """
+        messages = self._build_messages(query, context, conversation_history, conversation_summary)
+        async for event in self.astream_messages(messages, temperature, max_tokens, usage=usage):
+            yield event
+    
+    async def astream_messages(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        model: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a completion for prebuilt messages, running tool calls mid-stream
+        
+        Args:
+            messages: Chat messages; tool turns are appended to this list
+            temperature: Sampling temperature
+            max_tokens: Completion token cap per model call
+            model: Overrides Settings.openai_model
+            usage: Dict kept up to date with the tokens spent so far, so a
+                caller that stops the stream early can still account for
+                them; estimated until the API reports the exact counts
+            
+        Yields:
+            {'type': 'token', 'content'} for each text delta,
+            {'type': 'tool', 'name'} when a tool is about to run, and finally
+            {'type': 'done', 'finish_reason', 'usage', 'function_calls_made',
+            'tool_calls', 'tool_seconds'}
+        """
+        total_usage = usage if usage is not None else {}
+        for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            total_usage.setdefault(key, 0)
+        tool_calls, tool_seconds = 0, 0.0
+        
+        max_iterations = 5
+        for iteration in range(max_iterations):
+            # Running estimate for this completion, replaced by the reported usage
+            estimate = {'prompt_tokens': self._estimate_prompt_tokens(messages), 'completion_tokens': 0}
+            self._adjust_usage(total_usage, estimate['prompt_tokens'], 0)
+            stream = await self.async_client.chat.completions.create(
+                **self._completion_params(messages, temperature, max_tokens, model),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            
+            content_parts: List[str] = []
+            calls: Dict[int, Dict[str, str]] = {}
+            finish_reason = None
+            async for chunk in stream:
+                # Usage arrives on a final chunk without choices
+                if chunk.usage:
+                    self._adjust_usage(total_usage, -estimate['prompt_tokens'], -estimate['completion_tokens'])
+                    estimate = {'prompt_tokens': 0, 'completion_tokens': 0}
+                self._add_usage(total_usage, chunk)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                generated = (choice.delta.content or "") + "".join(
+                    d.function.arguments or "" for d in choice.delta.tool_calls or [] if d.function is not None
+                )
+                if generated:
+                    tokens = count_tokens(generated)
+                    estimate['completion_tokens'] += tokens
+                    self._adjust_usage(total_usage, 0, tokens)
+                if choice.delta.content:
+                    content_parts.append(choice.delta.content)
+                    yield {'type': 'token', 'content': choice.delta.content}
+                self._merge_tool_call_deltas(calls, choice.delta.tool_calls)
+                finish_reason = choice.finish_reason or finish_reason
+            
+            if not calls:
+                yield {
+                    'type': 'done',
+                    'finish_reason': finish_reason,
+                    'usage': total_usage,
+                    'function_calls_made': iteration,
+                    'tool_calls': tool_calls,
+                    'tool_seconds': tool_seconds
+                }
+                return
+            
+            ordered = [calls[index] for index in sorted(calls)]
+            messages.append({
+                "role": "assistant",
+                "content": "".join(content_parts),
+                "tool_calls": [
+                    {"id": c['id'], "type": "function", "function": {"name": c['name'], "arguments": c['arguments']}}
+                    for c in ordered
+                ]
+            })
+            for call in ordered:
+                yield {'type': 'tool', 'name': call['name']}
+            tool_seconds += await self._arun_tools(messages, ordered)
+            tool_calls += len(ordered)
+        
+        logger.warning(f"Hit max function calling iterations ({max_iterations})")
+        yield {
+            'type': 'token',
+            'content': "I apologize, but I encountered too many function calls. Please try rephrasing your question."
+        }
+        yield {
+            'type': 'done',
+            'finish_reason': 'max_iterations',
+            'usage': total_usage,
+            'function_calls_made': max_iterations,
+            'tool_calls': tool_calls,
+            'tool_seconds': tool_seconds
+        }
+    
+    @staticmethod
+    def _merge_tool_call_deltas(calls: Dict[int, Dict[str, str]], deltas) -> None:
+        """Assemble streamed tool calls; ids, names and arguments arrive in fragments"""
+        for delta in deltas or []:
+            call = calls.setdefault(delta.index, {'id': '', 'name': '', 'arguments': ''})
+            if delta.id:
+                call['id'] = delta.id
+            if delta.function is not None:
+                call['name'] += delta.function.name or ""
+                call['arguments'] += delta.function.arguments or ""
+    
+    @staticmethod
+    def _tool_call_dicts(tool_calls) -> List[Dict[str, str]]:
+        return [
+            {'id': tc.id, 'name': tc.function.name, 'arguments': tc.function.arguments}
+            for tc in tool_calls
+        ]
+    
+    def _call_tool(self, call: Dict[str, str]) -> str:
+        """Parse a tool call's arguments and execute it (runs in the tool pool)"""
+        try:
+            arguments = json.loads(call['arguments'] or "{}")
+        except json.JSONDecodeError as e:
+            return f"Error executing {call['name']}: invalid arguments ({e})"
+        
+        logger.info(f"Executing function: {call['name']} with args: {arguments}")
+        return self._execute_function(call['name'], arguments)
+    
+    def _timed_out(self, call: Dict[str, str]) -> str:
+        logger.warning(f"Function {call['name']} timed out after {self.settings.tool_timeout_seconds}s")
+        return f"Error executing {call['name']}: timed out after {self.settings.tool_timeout_seconds:g} seconds"
+    
+    @staticmethod
+    def _tool_message(call: Dict[str, str], content: str) -> Dict[str, Any]:
+        return {"role": "tool", "tool_call_id": call['id'], "content": content}
+    
+    def _run_tools(self, messages: List[Dict[str, Any]], calls: List[Dict[str, str]]) -> float:
+        """
+        Execute tool calls concurrently and append their results to messages
+        
+        Results are appended in call order. A tool still running after
+        tool_timeout_seconds is reported to the model as timed out (its
+        thread cannot be interrupted and finishes in the background).
+        
+        Returns:
+            Wall-clock seconds spent executing tools
+        """
+        started = time.perf_counter()
+        deadline = started + self.settings.tool_timeout_seconds
+        futures = [get_tool_executor().submit(self._call_tool, call) for call in calls]
+        
+        for call, future in zip(calls, futures):
+            try:
+                content = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FuturesTimeoutError:
+                future.cancel()
+                content = self._timed_out(call)
+            messages.append(self._tool_message(call, content))
+        return time.perf_counter() - started
+    
+    async def _arun_tools(self, messages: List[Dict[str, Any]], calls: List[Dict[str, str]]) -> float:
+        """
+        Async variant of _run_tools
+        
+        If the request is cancelled (e.g. the client disconnects), waiting on
+        every tool is cancelled with it.
+        
+        Returns:
+            Wall-clock seconds spent executing tools
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.settings.tool_timeout_seconds
+        
+        async def run(call: Dict[str, str]) -> str:
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(get_tool_executor(), self._call_tool, call),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                return self._timed_out(call)
+        
+        started = time.perf_counter()
+        results = await asyncio.gather(*[run(call) for call in calls])
+        messages.extend(self._tool_message(call, content) for call, content in zip(calls, results))
+        return time.perf_counter() - started
+    
+    def summarize_conversation(
+        self,
+        summary: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 300
+    ) -> Dict[str, Any]:
+        """
+        Fold conversation turns into a running summary
+        
+        Args:
+            summary: Summary so far (may be empty)
+            messages: Turns to add, oldest first
+            max_tokens: Maximum tokens in the new summary
+            
+        Returns:
+            Dict with the updated summary and the token usage of the call
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        response = self.client.chat.completions.create(
+            model=self.settings.openai_model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You maintain a concise running summary of a conversation about sentiment data. "
+                               "Keep countries, dates, figures and conclusions the user may refer back to; drop pleasantries."
+                },
+                {
+                    "role": "user",
+                    "content": f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+                }
+            ],
+            temperature=0.2,
+            max_completion_tokens=max_tokens
+        )
+        usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        self._add_usage(usage, response)
+        return {
+            'summary': response.choices[0].message.content or summary,
+            'usage': usage
+        }
+    
     def generate_analysis(
         self,
         data_summary: str,
@@ -0,0 +1,89 @@
+"""
+Process-wide OpenAI clients
+
+Every OpenAI call (chat completions, embeddings, the dashboard endpoints) goes
+through the same pair of clients, so requests reuse warm keep-alive
+connections from one tuned httpx pool instead of paying a TCP + TLS handshake
+per client instance. The async client is the default; the sync client only
+serves the remaining blocking call sites (sync RAG queries, batch ingestion).
+HTTP/2 is used when the h2 package is installed.
+"""
+from typing import Optional
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from loguru import logger
+from backend.core.config import get_settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+_async_client: Optional[AsyncOpenAI] = None
+_sync_client: Optional[OpenAI] = None
+_clients_lock = threading.Lock()
+
+
+def _http_options() -> dict:
+    """httpx pool, timeout and protocol options from settings"""
+    settings = get_settings()
+    http2 = settings.openai_http2 and HTTP2_AVAILABLE
+    if settings.openai_http2 and not HTTP2_AVAILABLE:
+        logger.info("h2 is not installed; OpenAI connections use HTTP/1.1. Install with: pip install httpx[http2]")
+    return {
+        'http2': http2,
+        'limits': httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_expiry_seconds
+        ),
+        'timeout': httpx.Timeout(
+            settings.openai_timeout_seconds,
+            connect=settings.openai_connect_timeout_seconds
+        )
+    }
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get the shared AsyncOpenAI client (created on first use)"""
+    global _async_client
+    if _async_client is None:
+        with _clients_lock:
+            if _async_client is None:
+                settings = get_settings()
+                _async_client = AsyncOpenAI(
+                    api_key=settings.openai_api_key,
+                    max_retries=settings.openai_max_retries,
+                    http_client=httpx.AsyncClient(**_http_options())
+                )
+    return _async_client
+
+
+def get_openai_client() -> OpenAI:
+    """Get the shared blocking OpenAI client (created on first use)"""
+    global _sync_client
+    if _sync_client is None:
+        with _clients_lock:
+            if _sync_client is None:
+                settings = get_settings()
+                _sync_client = OpenAI(
+                    api_key=settings.openai_api_key,
+                    max_retries=settings.openai_max_retries,
+                    http_client=httpx.Client(**_http_options())
+                )
+    return _sync_client
+
+
+async def close_openai_clients():
+    """Close pooled connections (on application shutdown)"""
+    global _async_client, _sync_client
+    with _clients_lock:
+        async_client, sync_client = _async_client, _sync_client
+        _async_client = _sync_client = None
+    if async_client is not None:
+        await async_client.close()
+    if sync_client is not None:
+        sync_client.close()
@@ -0,0 +1,204 @@
+"""
+Server-side conversation sessions
+
+Chat clients send a session_id instead of their whole history. Each session
+keeps its most recent turns verbatim plus a running summary of everything
+older, so the history handed to the LLM stays within a token cap however long
+the conversation runs. Sessions live in an in-process LRU, or in Redis when
+Settings.redis_url is set (shared across workers and restarts).
+"""
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from collections import OrderedDict
+import json
+import threading
+import time
+from loguru import logger
+from backend.core.config import get_settings
+from backend.utils.tokens import count_tokens_batch, truncate_to_tokens
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def _empty_session() -> Dict[str, Any]:
+    return {'summary': "", 'messages': []}
+
+
+class InMemorySessionStore:
+    """Sessions in an LRU dict, expired after ttl_seconds of inactivity"""
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: int = 86400):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.time() - entry[0] > self.ttl_seconds:
+                self._sessions.pop(session_id, None)
+                return _empty_session()
+            self._sessions.move_to_end(session_id)
+            # Stored serialized so callers never share mutable state
+            return json.loads(entry[1])
+
+    def save(self, session_id: str, session: Dict[str, Any]):
+        with self._lock:
+            self._sessions[session_id] = (time.time(), json.dumps(session))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore:
+    """Sessions as JSON values in Redis, expired after ttl_seconds of inactivity"""
+
+    KEY_PREFIX = "sephira:session:"
+
+    def __init__(self, url: str, ttl_seconds: int = 86400):
+        if not REDIS_AVAILABLE:
+            raise ImportError("redis is not installed. Install with: pip install redis")
+        self.client = redis.Redis.from_url(url, socket_timeout=2)
+        self.ttl_seconds = ttl_seconds
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        raw = self.client.get(self.KEY_PREFIX + session_id)
+        return json.loads(raw) if raw else _empty_session()
+
+    def save(self, session_id: str, session: Dict[str, Any]):
+        self.client.set(self.KEY_PREFIX + session_id, json.dumps(session), ex=self.ttl_seconds)
+
+    def delete(self, session_id: str):
+        self.client.delete(self.KEY_PREFIX + session_id)
+
+
+class ConversationSessions:
+    """Token-capped conversation history with rolling summaries"""
+
+    LOCK_STRIPES = 64
+
+    def __init__(
+        self,
+        store,
+        summarize: Callable[[str, List[Dict[str, str]]], Dict[str, Any]],
+        max_history_tokens: int = 1000,
+        max_recent_messages: int = 4,
+        max_summary_tokens: int = 300
+    ):
+        """
+        Args:
+            store: InMemorySessionStore or RedisSessionStore
+            summarize: Folds messages into an existing summary, returning a
+                dict with the new 'summary' and the 'usage' of the call
+                (e.g. LLMClient.summarize_conversation)
+            max_history_tokens: Cap on verbatim history passed to the LLM
+            max_recent_messages: Messages kept verbatim before rolling up
+            max_summary_tokens: Cap on the running summary
+        """
+        self.store = store
+        self.summarize = summarize
+        self.max_history_tokens = max_history_tokens
+        self.max_recent_messages = max_recent_messages
+        self.max_summary_tokens = max_summary_tokens
+        # Striped rather than per session, so the lock set never grows
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    def _lock(self, session_id: str) -> threading.Lock:
+        return self._locks[hash(session_id) % self.LOCK_STRIPES]
+
+    def history(self, session_id: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Bounded history for the next request
+
+        Returns:
+            (most recent messages within the token cap, running summary or None)
+        """
+        session = self.store.load(session_id)
+        messages = session['messages'][-self.max_recent_messages:]
+        # Normally compact() has already rolled older turns up; this only
+        # bounds history between a turn and its background compaction
+        while messages and count_tokens_batch(m['content'] for m in messages) > self.max_history_tokens:
+            messages = messages[1:]
+        # Start on a user turn so the model never sees an orphaned answer
+        while messages and messages[0]['role'] != 'user':
+            messages = messages[1:]
+        return messages, session['summary'] or None
+
+    def append_turn(self, session_id: str, query: str, response: str):
+        """Record a question and its answer"""
+        with self._lock(session_id):
+            session = self.store.load(session_id)
+            session['messages'].extend([
+                {'role': 'user', 'content': query},
+                {'role': 'assistant', 'content': response}
+            ])
+            self.store.save(session_id, session)
+
+    def compact(self, session_id: str) -> Dict[str, int]:
+        """
+        Roll turns beyond the recent window into the running summary
+
+        Makes an LLM call, so it is meant to run after the response has been
+        sent (e.g. as a FastAPI background task).
+
+        Returns:
+            Token usage of the summary call (empty if none was made), for the
+            caller to charge to the session's user
+        """
+        with self._lock(session_id):
+            session = self.store.load(session_id)
+        messages = session['messages']
+
+        # Keep whole question/answer pairs
+        keep = min(len(messages), self.max_recent_messages) // 2 * 2
+        while keep > 0 and count_tokens_batch(m['content'] for m in messages[-keep:]) > self.max_history_tokens:
+            keep -= 2
+        older = messages[:len(messages) - keep]
+        if not older:
+            return {}
+
+        # Summarize without holding the lock; new turns may arrive meanwhile
+        try:
+            result = self.summarize(session['summary'], older)
+        except Exception as e:
+            logger.error(f"Could not summarize session {session_id}: {e}")
+            return {}
+
+        with self._lock(session_id):
+            current = self.store.load(session_id)
+            if current['summary'] != session['summary'] or current['messages'][:len(older)] != older:
+                # Another compaction got there first (the tokens are spent all the same)
+                return result['usage']
+            current['summary'] = truncate_to_tokens(result['summary'].strip(), self.max_summary_tokens)
+            current['messages'] = current['messages'][len(older):]
+            self.store.save(session_id, current)
+        logger.info(f"Rolled {len(older)} messages of session {session_id} into its summary")
+        return result['usage']
+
+    def clear(self, session_id: str):
+        self.store.delete(session_id)
+
+
+def create_session_store():
+    """Redis when configured and reachable, in-memory otherwise"""
+    settings = get_settings()
+    if settings.redis_url and REDIS_AVAILABLE:
+        try:
+            store = RedisSessionStore(settings.redis_url, ttl_seconds=settings.session_ttl_seconds)
+            store.client.ping()
+            logger.info("Conversation sessions stored in Redis")
+            return store
+        except Exception as e:
+            logger.warning(f"Redis unavailable for sessions, keeping them in memory: {e}")
+    return InMemorySessionStore(
+        max_sessions=settings.session_max_sessions,
+        ttl_seconds=settings.session_ttl_seconds
+    )
@@ -0,0 +1,193 @@
+"""
+TTL cache for LLM tool results
+
+The model keeps asking for the same web searches, news and price histories
+across users and turns. Results are cached by tool name and normalized
+arguments (case, whitespace and defaulted arguments don't change the key),
+each tool with its own TTL: minutes for news, a day for historical prices.
+Entries live in an in-process LRU, or in a SQLite file when the cache should
+be shared across workers and survive restarts.
+"""
+from typing import Dict, Any, Optional, Tuple, Iterator
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+from loguru import logger
+from backend.core.config import get_settings
+from backend.utils.singleflight import normalize_text
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    key TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    result TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tool_results_expiry ON tool_results (expires_at);
+"""
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def tool_cache_key(tool: str, arguments: Dict[str, Any]) -> str:
+    """Stable key for a tool call with normalized arguments"""
+    normalized = {k: _normalize_value(v) for k, v in arguments.items() if v is not None}
+    return json.dumps({'tool': tool, 'arguments': normalized}, sort_keys=True, default=str)
+
+
+class InMemoryToolResults:
+    """Results in an LRU dict with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, tool: str, result: str, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteToolResults:
+    """Results in a SQLite file shared by every worker process"""
+
+    def __init__(self, path: str, max_entries: int = 1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection committed (or rolled back) and closed on exit"""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM tool_results WHERE key = ? AND expires_at >= ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, tool: str, result: str, ttl_seconds: float):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tool_results VALUES (?, ?, ?, ?)",
+                (key, tool, result, now + ttl_seconds)
+            )
+            conn.execute("DELETE FROM tool_results WHERE expires_at < ?", (now,))
+            # Bound the file: drop the entries closest to expiry
+            conn.execute(
+                "DELETE FROM tool_results WHERE key IN ("
+                "SELECT key FROM tool_results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tool_results")
+
+
+class ToolResultCache:
+    """Per-tool TTL cache in front of the LLM tools"""
+
+    def __init__(self, backend, ttls: Dict[str, float]):
+        """
+        Args:
+            backend: InMemoryToolResults or SQLiteToolResults
+            ttls: Seconds each tool's results stay valid; tools without a
+                (positive) TTL are never cached
+        """
+        self.backend = backend
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, tool: str) -> bool:
+        return self.ttls.get(tool, 0) > 0
+
+    def get(self, tool: str, arguments: Dict[str, Any]) -> Optional[str]:
+        if not self.cacheable(tool):
+            return None
+        try:
+            result = self.backend.get(tool_cache_key(tool, arguments))
+        except Exception as e:
+            logger.error(f"Tool cache lookup failed: {e}")
+            return None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.info(f"Tool cache hit for {tool}")
+        return result
+
+    def set(self, tool: str, arguments: Dict[str, Any], result: str):
+        if not self.cacheable(tool):
+            return
+        try:
+            self.backend.set(tool_cache_key(tool, arguments), tool, result, self.ttls[tool])
+        except Exception as e:
+            logger.error(f"Tool cache store failed: {e}")
+
+    def clear(self):
+        self.backend.clear()
+
+
+_tool_cache: Optional[ToolResultCache] = None
+_tool_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> Optional[ToolResultCache]:
+    """Get the process-wide tool result cache (None when disabled)"""
+    global _tool_cache
+    settings = get_settings()
+    if not settings.tool_cache_enabled:
+        return None
+    if _tool_cache is None:
+        with _tool_cache_lock:
+            if _tool_cache is None:
+                if settings.tool_cache_backend == "disk":
+                    backend = SQLiteToolResults(settings.tool_cache_path, settings.tool_cache_max_entries)
+                else:
+                    backend = InMemoryToolResults(settings.tool_cache_max_entries)
+                _tool_cache = ToolResultCache(backend, {
+                    'search_web': settings.tool_cache_ttl_search_web,
+                    'get_news': settings.tool_cache_ttl_news,
+                    'get_financial_data': settings.tool_cache_ttl_financial_data
+                })
+    return _tool_cache
@@ -0,0 +1,243 @@
+"""
+In-process exact vector index
+
+For a corpus of tens of thousands of chunks a contiguous float32 matrix and one
+matrix product give exact top-k in a few milliseconds, without an ANN index.
+Vectors come from the snapshot written by EmbeddingService.export_vector_snapshot
+(memory-mapped when stored as float32). Metadata filters use ChromaDB's ``where``
+syntax and are evaluated as boolean masks before scoring; equality masks on
+low-cardinality fields (chunk type, country flags) are cached as bitmaps.
+"""
+from typing import List, Dict, Any, Optional
+import numpy as np
+from loguru import logger
+from backend.utils.vector_codec import load_vector_snapshot, dequantize
+
+
+class MetadataFilter:
+    """
+    Evaluates ChromaDB-style where clauses over a list of metadata dicts
+
+    Shared by the in-process indexes so they filter exactly like ChromaDB.
+    """
+
+    # Fields with at most this many distinct values get cached equality bitmaps
+    BITMAP_MAX_CARDINALITY = 1024
+
+    def __init__(self, metadatas: List[Dict[str, Any]]):
+        self.metadatas = [m or {} for m in metadatas]
+        self._columns: Dict[str, np.ndarray] = {}
+        self._cardinality: Dict[str, int] = {}
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+
+    def _column(self, key: str) -> np.ndarray:
+        """Column of metadata values (object array, None when missing)"""
+        if key not in self._columns:
+            column = np.empty(len(self.metadatas), dtype=object)
+            column[:] = [m.get(key) for m in self.metadatas]
+            self._columns[key] = column
+        return self._columns[key]
+
+    def _eq_mask(self, key: str, value: Any) -> np.ndarray:
+        """Equality mask, cached as a bitmap for low-cardinality fields"""
+        cache_key = (key, value)
+        if cache_key in self._bitmaps:
+            return self._bitmaps[cache_key]
+
+        column = self._column(key)
+        mask = np.asarray(column == value, dtype=bool)
+
+        if key not in self._cardinality:
+            self._cardinality[key] = len(set(column.tolist()))
+        if self._cardinality[key] <= self.BITMAP_MAX_CARDINALITY:
+            self._bitmaps[cache_key] = mask
+        return mask
+
+    def _compare_mask(self, key: str, op: str, value: Any) -> np.ndarray:
+        """Range comparison; records missing the field never match"""
+        column = self._column(key)
+        present = np.array([v is not None and not isinstance(v, bool) for v in column], dtype=bool)
+        result = np.zeros(len(column), dtype=bool)
+        if not present.any():
+            return result
+
+        values = column[present]
+        if op == "$gt":
+            result[present] = values > value
+        elif op == "$gte":
+            result[present] = values >= value
+        elif op == "$lt":
+            result[present] = values < value
+        else:
+            result[present] = values <= value
+        return result
+
+    def _field_mask(self, key: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            return self._eq_mask(key, condition)
+
+        mask = np.ones(len(self.metadatas), dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= self._eq_mask(key, value)
+            elif op == "$ne":
+                mask &= ~self._eq_mask(key, value)
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                mask &= self._compare_mask(key, op, value)
+            elif op == "$in":
+                mask &= np.logical_or.reduce([self._eq_mask(key, v) for v in value]) if value else False
+            elif op == "$nin":
+                for v in value:
+                    mask &= ~self._eq_mask(key, v)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+        return mask
+
+    def filter_mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Evaluate a ChromaDB-style where clause to a boolean mask (None = everything)"""
+        if not where:
+            return None
+
+        mask = np.ones(len(self.metadatas), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.filter_mask(clause)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self.filter_mask(clause) for clause in condition])
+            else:
+                mask &= self._field_mask(key, condition)
+        return mask
+
+
+class VectorIndex(MetadataFilter):
+    """Exact cosine-similarity index over a memory-mapped vector matrix"""
+
+    def __init__(
+        self,
+        ids: List[str],
+        vectors: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embedding_model: Optional[str] = None,
+        collection: Optional[str] = None
+    ):
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+
+        super().__init__(metadatas)
+        self.ids = ids
+        self.documents = documents
+        self.embedding_model = embedding_model
+        # Collection the snapshot was exported from (None if unknown)
+        self.collection = collection
+        self.vectors = vectors
+
+        # Pre-computed norms turn dot products into cosine similarity without
+        # touching a (read-only, memory-mapped) matrix
+        norms = np.linalg.norm(vectors, axis=1) if len(vectors) else np.zeros(0)
+        self._inv_norms = (1.0 / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+
+    @classmethod
+    def from_snapshot(cls, directory: str, mmap: bool = True) -> "VectorIndex":
+        """
+        Load an index from a vector snapshot
+
+        float32 snapshots are memory-mapped; compact float16/int8 snapshots are
+        decoded once into RAM so queries run on a contiguous float32 matrix.
+        """
+        snapshot = load_vector_snapshot(directory, mmap=mmap)
+        manifest = snapshot['manifest']
+        vectors = snapshot['vectors']
+        if vectors.dtype != np.float32 or snapshot['scales'] is not None:
+            vectors = np.ascontiguousarray(dequantize(vectors, snapshot['scales']))
+
+        logger.info(
+            f"Loaded vector index: {manifest['count']} vectors, {manifest['dimensions']} dims "
+            f"({manifest['dtype']} on disk)"
+        )
+        return cls(
+            snapshot['ids'],
+            vectors,
+            snapshot['documents'],
+            snapshot['metadatas'],
+            embedding_model=manifest.get('embedding_model'),
+            collection=manifest.get('collection')
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the vector matrix (resident only once paged in when memory-mapped)"""
+        return int(self.vectors.nbytes)
+
+    def get(self, ids: List[str]) -> Dict[str, List[Any]]:
+        """Fetch records by ID (missing IDs are skipped), in the requested order"""
+        positions = [self._positions[i] for i in ids if i in self._positions]
+        return {
+            'ids': [self.ids[p] for p in positions],
+            'documents': [self.documents[p] for p in positions],
+            'metadatas': [self.metadatas[p] for p in positions]
+        }
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Vectors by ID (missing IDs are skipped)"""
+        return {i: np.asarray(self.vectors[self._positions[i]]) for i in ids if i in self._positions}
+
+    # -- search -----------------------------------------------------------------
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> Dict[str, List[List[Any]]]:
+        """
+        Exact top-k search for a batch of queries
+
+        Returns results in the same nested-list shape as ChromaDB's
+        collection.query, with cosine distances (and the matched vectors under
+        'embeddings' when include_embeddings is set).
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+
+        mask = self.filter_mask(where)
+        candidates = np.flatnonzero(mask) if mask is not None else None
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        if include_embeddings:
+            results['embeddings'] = []
+        if len(self.ids) == 0 or (candidates is not None and len(candidates) == 0):
+            for key in results:
+                results[key] = [[] for _ in range(len(queries))]
+            return results
+
+        # One matrix product scores every query against the candidate set
+        if candidates is None:
+            scores = (queries @ self.vectors.T) * self._inv_norms
+        else:
+            scores = (queries @ self.vectors[candidates].T) * self._inv_norms[candidates]
+
+        k = min(n_results, scores.shape[1])
+        top = np.argpartition(-scores, kth=k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        for row, positions in enumerate(top):
+            indices = candidates[positions] if candidates is not None else positions
+            results['ids'].append([self.ids[i] for i in indices])
+            results['documents'].append([self.documents[i] for i in indices])
+            results['metadatas'].append([self.metadatas[i] for i in indices])
+            results['distances'].append((1.0 - scores[row, positions]).astype(float).tolist())
+            if include_embeddings:
+                results['embeddings'].append(np.asarray(self.vectors[indices], dtype=np.float32))
+
+        return results
@@ -5,6 +5,7 @@ from typing import List, Dict, Any
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
+from backend.utils.metadata import flatten_chunk_metadata
 
 
 class SentimentChunker:
@@ -18,7 +19,7 @@ class SentimentChunker:
         chunks = []
         
         for idx, row in self.df.iterrows():
-            date_str = row['date']
+            date_str = pd.to_datetime(row['date']).strftime('%Y-%m-%d')
             
             # Get non-null sentiment values for this day
             countries_data = []
@@ -42,11 +43,11 @@ class SentimentChunker:
             chunks.append({
                 'chunk_id': f"daily_{date_str}",
                 'text': text,
-                'metadata': {
+                'metadata': flatten_chunk_metadata({
                     'date': str(date_str),
                     'countries': [cd['country'] for cd in countries_data],
                     'type': 'daily'
-                },
+                }),
                 'chunk_type': 'daily'
             })
             
@@ -92,12 +93,12 @@ class SentimentChunker:
                 chunks.append({
                     'chunk_id': f"weekly_{week}",
                     'text': " | ".join(text_parts),
-                    'metadata': {
+                    'metadata': flatten_chunk_metadata({
                         'start_date': str(start_date),
                         'end_date': str(end_date),
                         'countries': list(countries_data.keys()),
                         'type': 'weekly'
-                    },
+                    }),
                     'chunk_type': 'weekly'
                 })
         
@@ -139,11 +140,11 @@ class SentimentChunker:
                 chunks.append({
                     'chunk_id': f"monthly_{month}",
                     'text': " | ".join(text_parts),
-                    'metadata': {
+                    'metadata': flatten_chunk_metadata({
                         'month': str(month_str),
                         'countries': list(countries_data.keys()),
                         'type': 'monthly'
-                    },
+                    }),
                     'chunk_type': 'monthly'
                 })
         
@@ -183,14 +184,14 @@ class SentimentChunker:
                 chunks.append({
                     'chunk_id': f"country_summary_{col}",
                     'text': text,
-                    'metadata': {
+                    'metadata': flatten_chunk_metadata({
                         'country': col,
                         'start_date': str(dates.min().strftime('%Y-%m-%d')),
                         'end_date': str(dates.max().strftime('%Y-%m-%d')),
                         'mean': float(mean_val),
                         'std': float(std_val),
                         'type': 'country_summary'
-                    },
+                    }),
                     'chunk_type': 'country_summary'
                 })
         
@@ -231,13 +232,13 @@ class SentimentChunker:
                     chunks.append({
                         'chunk_id': f"anomaly_{col}_{date_val.strftime('%Y%m%d')}",
                         'text': text,
-                        'metadata': {
+                        'metadata': flatten_chunk_metadata({
                             'country': col,
                             'date': str(date_val.strftime('%Y-%m-%d')),
                             'sentiment': float(sentiment_val),
                             'z_score': float(z_score),
                             'type': 'anomaly'
-                        },
+                        }),
                         'chunk_type': 'event'
                     })
         
@@ -255,3 +256,23 @@ class SentimentChunker:
         all_chunks.extend(self.create_anomaly_chunks())
         
         return all_chunks
+
+
+def filter_chunk_text(text: str, countries: List[str]) -> str:
+    """
+    Keep only the given countries' segments of a multi-country chunk
+    
+    Daily, weekly and monthly chunks are " | "-separated: a header followed by
+    one "<Country>: ..." / "<Country> avg: ..." segment per country. Other
+    chunks, or chunks mentioning none of the countries, are returned unchanged.
+    """
+    parts = text.split(" | ")
+    if len(parts) < 2 or not countries:
+        return text
+    
+    wanted = set(countries)
+    kept = [
+        part for part in parts[1:]
+        if part.split(":", 1)[0].removesuffix(" avg") in wanted
+    ]
+    return " | ".join([parts[0]] + kept) if kept else text
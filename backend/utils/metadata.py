@@ -0,0 +1,154 @@
+"""
+Chunk metadata flattening and retrieval filter construction
+
+Vector databases filter on scalar metadata only, so chunk metadata is flattened
+into filterable fields:
+- ``country_<slug>: True`` for every country a chunk covers
+- ``start_ord`` / ``end_ord``: integer date ordinals of the period covered
+- ``type``: chunk type (daily, weekly, monthly, country_summary, anomaly)
+Request filters (countries, date range, chunk types) are then translated into
+ChromaDB ``where`` clauses over those fields.
+"""
+from typing import List, Dict, Any, Optional, Union
+from datetime import date, datetime
+import calendar
+import json
+import re
+import pandas as pd
+
+
+DateLike = Union[str, date, datetime, pd.Timestamp]
+
+
+def country_field(country: str) -> str:
+    """Metadata flag name for a country, e.g. 'United States' -> 'country_united_states'"""
+    return "country_" + re.sub(r"[^a-z0-9]+", "_", country.lower()).strip("_")
+
+
+def date_ordinal(value: DateLike) -> int:
+    """Proleptic Gregorian ordinal of a date-like value"""
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return pd.to_datetime(value).date().toordinal()
+
+
+def month_range_ordinals(month: str) -> tuple:
+    """First and last day ordinals of a 'YYYY-MM' month"""
+    year, month_num = (int(part) for part in month.split("-")[:2])
+    last_day = calendar.monthrange(year, month_num)[1]
+    return date(year, month_num, 1).toordinal(), date(year, month_num, last_day).toordinal()
+
+
+def flatten_chunk_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flatten chunk metadata into scalar, filterable fields
+
+    Idempotent: flattening already flattened metadata returns it unchanged.
+    """
+    flat = {}
+    countries = []
+
+    for key, value in metadata.items():
+        if key == 'countries' and isinstance(value, list):
+            countries.extend(value)
+        elif isinstance(value, (list, dict)):
+            flat[key] = json.dumps(value)
+        elif value is not None:
+            flat[key] = value
+
+    if isinstance(metadata.get('country'), str):
+        countries.append(metadata['country'])
+    if countries:
+        flat['countries'] = ", ".join(dict.fromkeys(countries))
+        for country in countries:
+            flat[country_field(country)] = True
+
+    # Period covered by the chunk, as integer ordinals for range filters
+    if 'start_ord' not in flat:
+        if metadata.get('date'):
+            flat['start_ord'] = flat['end_ord'] = date_ordinal(metadata['date'])
+        elif metadata.get('start_date') and metadata.get('end_date'):
+            flat['start_ord'] = date_ordinal(metadata['start_date'])
+            flat['end_ord'] = date_ordinal(metadata['end_date'])
+        elif metadata.get('month'):
+            flat['start_ord'], flat['end_ord'] = month_range_ordinals(str(metadata['month']))
+
+    return flat
+
+
+def combine_filters(*clauses: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """AND together where clauses, dropping empty ones"""
+    clauses = [c for c in clauses if c]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def any_of(clauses: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """OR together where clauses (ChromaDB requires at least two operands for $or)"""
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$or": clauses}
+
+
+def countries_filter(countries: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Chunks covering at least one of the countries"""
+    return any_of([{country_field(c): True} for c in countries or []])
+
+
+def period_filter(start_ord: Optional[int] = None, end_ord: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Chunks whose covered period overlaps [start_ord, end_ord]
+
+    Overlap rather than containment, so weekly/monthly/summary chunks spanning
+    the range still match.
+    """
+    return combine_filters(
+        {"end_ord": {"$gte": start_ord}} if start_ord is not None else None,
+        {"start_ord": {"$lte": end_ord}} if end_ord is not None else None
+    )
+
+
+def chunk_types_filter(chunk_types: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Chunks of the given types"""
+    if not chunk_types:
+        return None
+    return {"type": {"$in": list(chunk_types)}} if len(chunk_types) > 1 else {"type": chunk_types[0]}
+
+
+def build_where_filter(
+    countries: Optional[List[str]] = None,
+    start_date: Optional[DateLike] = None,
+    end_date: Optional[DateLike] = None,
+    chunk_types: Optional[List[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Translate request filters into a ChromaDB where clause
+
+    Args:
+        countries: Chunks must cover at least one of these countries
+        start_date: Chunks must cover a period ending on or after this date
+        end_date: Chunks must cover a period starting on or before this date
+        chunk_types: Restrict to these chunk types
+
+    Returns:
+        Where clause, or None when no filter applies
+    """
+    period = period_filter(
+        date_ordinal(start_date) if start_date else None,
+        date_ordinal(end_date) if end_date else None
+    )
+    # Flatten the period's $and so the clause stays a single level deep
+    period_clauses = period["$and"] if period and "$and" in period else [period]
+
+    return combine_filters(
+        countries_filter(countries),
+        *period_clauses,
+        chunk_types_filter(chunk_types)
+    )
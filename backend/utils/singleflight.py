@@ -0,0 +1,86 @@
+"""
+Single-flight request coalescing
+
+When the same work is requested again while a first call is still running
+(a dashboard refresh, a retrying client), later callers wait for the
+in-flight call and share its result instead of repeating embedding,
+retrieval and LLM calls.
+"""
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from concurrent.futures import Future
+import asyncio
+import json
+import re
+import threading
+
+
+def normalize_text(text: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a query"""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").lower()
+
+
+def flight_key(**parts: Any) -> str:
+    """Stable key from keyword parts (filters, history, dataset version, ...)"""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class SingleFlight:
+    """Share the result of concurrent calls with the same key"""
+
+    def __init__(self):
+        # Tasks are tied to their event loop, so async calls coalesce per loop
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await fn(), or the in-flight call with the same key
+
+        Returns:
+            (result, leader) where leader is True for the caller whose fn ran.
+            The result object is shared between callers; treat it as read-only.
+        """
+        loop_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(loop_key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._tasks[loop_key] = task
+            task.add_done_callback(lambda done: self._forget(self._tasks, loop_key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller disconnecting doesn't cancel the others' answer
+        return await asyncio.shield(task), leader
+
+    def call(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Blocking variant of do() for threaded callers"""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._futures[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result(), False
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._forget(self._futures, key, future)
+        return future.result(), True
+
+    @staticmethod
+    def _forget(calls: Dict[Any, Any], key: Any, done: Any):
+        if calls.get(key) is done:
+            del calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._tasks) + len(self._futures)
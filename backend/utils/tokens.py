@@ -0,0 +1,65 @@
+"""
+Token counting for embedding and chat budgets
+"""
+from typing import Iterable
+from functools import lru_cache
+from loguru import logger
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+
+# Encoding shared by text-embedding-3 and GPT-4 class models
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(name: str):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # Encodings are downloaded on first use; offline hosts fall back to estimates
+        logger.warning(f"tiktoken encoding '{name}' unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
+    """
+    Count tokens in a text
+
+    Uses tiktoken when available, otherwise the ~4 characters per token
+    heuristic.
+    """
+    if not text:
+        return 0
+    enc = _get_encoding(encoding)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(texts: Iterable[str], encoding: str = DEFAULT_ENCODING) -> int:
+    """Total tokens across texts"""
+    return sum(count_tokens(text, encoding) for text in texts)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding: str = DEFAULT_ENCODING) -> str:
+    """
+    Cut a text down to at most max_tokens tokens
+
+    Returns the text unchanged if it already fits.
+    """
+    if max_tokens <= 0:
+        return ""
+    enc = _get_encoding(encoding)
+    if enc is None:
+        return text[:max_tokens * 4]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
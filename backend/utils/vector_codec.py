@@ -0,0 +1,226 @@
+"""
+Compact on-disk storage for embedding vectors
+
+ChromaDB always persists float32, so the compact float16/int8 path lives in a
+vector snapshot directory next to it: a quantized matrix plus ids, documents and
+metadata that local backends can memory-map.
+
+Each export is written to its own versioned subdirectory and published by
+atomically replacing a CURRENT pointer file, so a process reloading during an
+export sees either the previous export or the new one, never a mix of both.
+"""
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import os
+import re
+import shutil
+import time
+import numpy as np
+
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+CURRENT_FILE = "CURRENT"
+EXPORT_NAME = re.compile(r"^v\d+$")
+
+
+def truncate_dimensions(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Shorten embeddings to their first ``dimensions`` components and re-normalise
+
+    This is what text-embedding-3 models do natively for the ``dimensions``
+    parameter, so it can be applied to stored full-size vectors after the fact.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions >= vectors.shape[-1]:
+        return vectors
+    shortened = vectors[..., :dimensions]
+    norms = np.linalg.norm(shortened, axis=-1, keepdims=True)
+    return shortened / np.clip(norms, 1e-12, None)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Encode float vectors in a storage dtype
+
+    Returns:
+        (encoded, scales) where scales holds the per-vector int8 scale factor
+        and is None for floating point dtypes
+    """
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported vector storage dtype: {dtype}")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+
+    # Symmetric per-vector int8 quantization
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    encoded = np.round(vectors / scales[..., None]).astype(np.int8)
+    return encoded, scales
+
+
+def dequantize(encoded: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decode stored vectors back to float32"""
+    if scales is not None:
+        return encoded.astype(np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+    return np.asarray(encoded, dtype=np.float32)
+
+
+def replace_file(path: Path, write):
+    """
+    Write a file via a temporary sibling and atomically swap it in
+
+    Readers that memory-mapped the previous version keep their (now unlinked)
+    inode instead of seeing a truncated file.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_json(path: Path, payload: Any):
+    replace_file(path, lambda f: f.write(json.dumps(payload).encode('utf-8')))
+
+
+def current_export(directory: str) -> Optional[str]:
+    """Name of the live export in directory, or None if nothing was published there"""
+    try:
+        return (Path(directory) / CURRENT_FILE).read_text().strip() or None
+    except OSError:
+        return None
+
+
+def export_path(directory: str) -> Path:
+    """Directory holding the files of the live export"""
+    name = current_export(directory)
+    # Exports written before versioning keep their files in directory itself
+    return Path(directory) / name if name else Path(directory)
+
+
+@contextmanager
+def publish_export(directory: str, keep: int = 2) -> Iterator[Path]:
+    """
+    Write an export into a fresh versioned subdirectory and make it live
+
+    Yields the staging directory to write into. When the block completes the
+    directory is renamed into place and the CURRENT pointer is atomically
+    replaced; on error nothing is published. The newest keep exports are
+    retained so readers still loading the previous one are not cut off.
+    """
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    name = f"v{time.time_ns()}"
+    staging = root / f".{name}.tmp"
+    staging.mkdir()
+    try:
+        yield staging
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    os.rename(staging, root / name)
+    replace_file(root / CURRENT_FILE, lambda f: f.write(name.encode('utf-8')))
+
+    exports = sorted(
+        (p for p in root.iterdir() if p.is_dir() and EXPORT_NAME.match(p.name)),
+        key=lambda p: int(p.name[1:]),
+        reverse=True
+    )
+    for old in exports[max(1, keep):]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def check_export_counts(manifest: Dict[str, Any], **records: Any):
+    """Raise ValueError unless every record list has the manifest's count"""
+    mismatched = {name: len(values) for name, values in records.items() if len(values) != manifest['count']}
+    if mismatched:
+        raise ValueError(f"Export is inconsistent: manifest count {manifest['count']}, found {mismatched}")
+
+
+def save_vector_snapshot(
+    directory: str,
+    ids: List[str],
+    vectors: np.ndarray,
+    documents: List[str],
+    metadatas: List[Dict[str, Any]],
+    dtype: str = "float32",
+    embedding_model: Optional[str] = None,
+    collection: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Write a vector snapshot to disk and return its manifest
+
+    collection names the (physical) collection the vectors were exported
+    from, so servers can tell whether the snapshot matches the live index.
+    """
+    encoded, scales = quantize(vectors, dtype)
+    manifest = {
+        'count': len(ids),
+        'dimensions': int(encoded.shape[1]) if encoded.ndim == 2 else 0,
+        'dtype': dtype,
+        'embedding_model': embedding_model,
+        'collection': collection,
+        'vector_bytes': int(encoded.nbytes)
+    }
+
+    with publish_export(directory) as path:
+        with open(path / "vectors.npy", 'wb') as f:
+            np.save(f, encoded)
+        if scales is not None:
+            with open(path / "scales.npy", 'wb') as f:
+                np.save(f, scales)
+        write_json(path / "ids.json", ids)
+        write_json(path / "documents.json", documents)
+        write_json(path / "metadatas.json", metadatas)
+        write_json(path / "manifest.json", manifest)
+
+    return manifest
+
+
+def load_vector_snapshot(directory: str, mmap: bool = True) -> Dict[str, Any]:
+    """
+    Load the live vector snapshot written by save_vector_snapshot
+
+    Vectors are memory-mapped in their stored dtype; use dequantize() with the
+    returned scales to obtain float32.
+
+    Raises:
+        FileNotFoundError: No snapshot in directory
+        ValueError: The snapshot's files disagree on the number of records
+    """
+    path = export_path(directory)
+    if not (path / "manifest.json").exists():
+        raise FileNotFoundError(f"No vector snapshot found at {directory}")
+
+    with open(path / "manifest.json") as f:
+        manifest = json.load(f)
+    with open(path / "ids.json") as f:
+        ids = json.load(f)
+    with open(path / "documents.json") as f:
+        documents = json.load(f)
+    with open(path / "metadatas.json") as f:
+        metadatas = json.load(f)
+
+    mmap_mode = 'r' if mmap else None
+    vectors = np.load(path / "vectors.npy", mmap_mode=mmap_mode)
+    scales = np.load(path / "scales.npy") if (path / "scales.npy").exists() else None
+    check_export_counts(
+        manifest, ids=ids, documents=documents, metadatas=metadatas, vectors=vectors,
+        **({'scales': scales} if scales is not None else {})
+    )
+
+    return {
+        'manifest': manifest,
+        'ids': ids,
+        'vectors': vectors,
+        'scales': scales,
+        'documents': documents,
+        'metadatas': metadatas
+    }
@@ -0,0 +1,3 @@
+"""
+Local benchmarks for the retrieval path (run with python -m benchmarks.<name>)
+"""
@@ -0,0 +1,148 @@
+"""
+Recall vs latency benchmark for shortened embeddings and compact storage
+
+Embeds the chunk corpus once at the provider's native size, then for each
+target dimension (truncate + re-normalise, as text-embedding-3 does natively)
+and storage dtype measures:
+- recall@k against exact search over the full-size float32 vectors
+- ChromaDB HNSW query latency (p50/p95)
+- vector storage size
+
+Usage:
+    python -m benchmarks.embedding_dimensions --limit 2000 --dims 3072 1024 256
+    EMBEDDING_PROVIDER=hashing python -m benchmarks.embedding_dimensions --dims 384 128 64
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+import chromadb
+import numpy as np
+
+from backend.core.config import get_settings
+from backend.services.embedding_providers import get_embedding_provider
+from backend.utils.vector_codec import STORAGE_DTYPES, truncate_dimensions, quantize, dequantize
+
+
+DEFAULT_QUERIES = [
+    "How did United States sentiment change in March 2020?",
+    "Japan sentiment trend over the last decade",
+    "Which countries had anomalies during the 2008 financial crisis?",
+    "Germany monthly sentiment range in 2015",
+    "Compare United Kingdom and France sentiment",
+    "Brazil sentiment volatility",
+    "Weekly sentiment for China in 2022",
+    "Overall statistics for India",
+    "Unusual drop in Russia sentiment",
+    "South Korea sentiment in January 2021",
+]
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact cosine top-k indices for each query (vectors are unit length)"""
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, kth=min(k, corpus.shape[0] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    """Mean fraction of ground-truth neighbours recovered"""
+    hits = [len(set(t) & set(f)) / len(t) for t, f in zip(truth, found)]
+    return float(np.mean(hits))
+
+
+def chroma_latency(ids: List[str], corpus: np.ndarray, queries: np.ndarray, k: int) -> Dict[str, float]:
+    """Build an in-memory HNSW collection and time single-query searches"""
+    client = chromadb.EphemeralClient()
+    name = f"bench_{corpus.shape[1]}_{random.randint(0, 1_000_000)}"
+    collection = client.create_collection(name=name, metadata={"hnsw:space": "cosine"})
+    for i in range(0, len(ids), 1000):
+        collection.add(ids=ids[i:i + 1000], embeddings=corpus[i:i + 1000].tolist())
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query.tolist()], n_results=k)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    client.delete_collection(name)
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95))
+    }
+
+
+def run(chunks_path: Path, limit: int, dims: List[int], dtypes: List[str], k: int, seed: int) -> List[Dict[str, Any]]:
+    settings = get_settings()
+    # Always embed at native size; shorter variants are derived by truncation
+    provider = get_embedding_provider(settings.model_copy(update={'embedding_dimensions': None}))
+
+    with open(chunks_path) as f:
+        chunks = json.load(f)
+    random.Random(seed).shuffle(chunks)
+    chunks = chunks[:limit]
+
+    texts = [c['text'] for c in chunks]
+    ids = [c['chunk_id'] for c in chunks]
+
+    print(f"Embedding {len(texts)} chunks and {len(DEFAULT_QUERIES)} queries with {provider.name}...")
+    corpus = np.vstack([
+        np.asarray(provider.embed(texts[i:i + 100]), dtype=np.float32)
+        for i in range(0, len(texts), 100)
+    ])
+    queries = np.asarray(provider.embed(DEFAULT_QUERIES), dtype=np.float32)
+    native = corpus.shape[1]
+
+    truth = exact_top_k(corpus, queries, k)
+
+    rows = []
+    for dim in sorted({d for d in dims if d <= native}, reverse=True):
+        corpus_d = truncate_dimensions(corpus, dim)
+        queries_d = truncate_dimensions(queries, dim)
+        latency = chroma_latency(ids, corpus_d, queries_d, k)
+
+        for dtype in dtypes:
+            encoded, scales = quantize(corpus_d, dtype)
+            decoded = dequantize(encoded, scales)
+            found = exact_top_k(decoded, queries_d, k)
+            storage = encoded.nbytes + (scales.nbytes if scales is not None else 0)
+
+            rows.append({
+                'dims': dim,
+                'dtype': dtype,
+                f'recall@{k}': round(recall_at_k(truth, found), 3),
+                'chroma_p50_ms': round(latency['p50_ms'], 2),
+                'chroma_p95_ms': round(latency['p95_ms'], 2),
+                'storage_mb': round(storage / 1e6, 2)
+            })
+    return rows
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', default=str(Path(settings.processed_data_path) / "text_chunks.json"))
+    parser.add_argument('--limit', type=int, default=2000, help="Number of chunks to sample")
+    parser.add_argument('--dims', type=int, nargs='+', default=[3072, 1024, 256])
+    parser.add_argument('--dtypes', nargs='+', default=list(STORAGE_DTYPES), choices=STORAGE_DTYPES)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rows = run(Path(args.chunks), args.limit, args.dims, args.dtypes, args.top_k, args.seed)
+
+    print("\n" + "=" * 72)
+    print("Embedding dimension / storage benchmark")
+    print("=" * 72)
+    headers = list(rows[0].keys()) if rows else []
+    print("  ".join(f"{h:>14}" for h in headers))
+    for row in rows:
+        print("  ".join(f"{str(row[h]):>14}" for h in headers))
+    print("=" * 72 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+ChromaDB (HNSW) vs in-process NumPy exact index
+
+Embeds a sample of the chunk corpus once, loads it into both backends and
+reports single-query and batched latency, recall@k (the NumPy index is exact, so
+it is the ground truth) and memory for the vectors. A filtered run exercises the
+metadata prefilter on chunk type.
+
+Usage:
+    python -m benchmarks.vector_backends --limit 20000
+    EMBEDDING_PROVIDER=hashing python -m benchmarks.vector_backends
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import chromadb
+import numpy as np
+
+from backend.core.config import get_settings
+from backend.services.embedding_providers import get_embedding_provider
+from backend.services.vector_index import VectorIndex
+from benchmarks.embedding_dimensions import DEFAULT_QUERIES
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (Linux), 0 when unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        import resource
+        return pages * resource.getpagesize() / 1e6
+    except (OSError, ImportError, ValueError):
+        return 0.0
+
+
+def time_queries(search, queries: np.ndarray, repeats: int) -> Dict[str, float]:
+    """p50/p95 latency of single-query searches in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            search([query.tolist()])
+            timings.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': float(np.percentile(timings, 50)), 'p95_ms': float(np.percentile(timings, 95))}
+
+
+def time_batch(search, queries: np.ndarray) -> float:
+    """Per-query latency in milliseconds when all queries go in one call"""
+    start = time.perf_counter()
+    search(queries.tolist())
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall(reference: List[List[str]], found: List[List[str]]) -> float:
+    return float(np.mean([len(set(r) & set(f)) / max(len(r), 1) for r, f in zip(reference, found)]))
+
+
+def run(chunks_path: Path, limit: int, k: int, repeats: int, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    settings = get_settings()
+    provider = get_embedding_provider(settings)
+
+    with open(chunks_path) as f:
+        chunks = json.load(f)
+    random.Random(42).shuffle(chunks)
+    chunks = chunks[:limit]
+
+    ids = [c['chunk_id'] for c in chunks]
+    texts = [c['text'] for c in chunks]
+    metadatas = [{'type': c['metadata'].get('type', 'unknown')} for c in chunks]
+
+    print(f"Embedding {len(texts)} chunks with {provider.name}...")
+    vectors = np.vstack([
+        np.asarray(provider.embed(texts[i:i + 100]), dtype=np.float32)
+        for i in range(0, len(texts), 100)
+    ])
+    queries = np.asarray(provider.embed(DEFAULT_QUERIES), dtype=np.float32)
+
+    rows = []
+
+    # NumPy exact index
+    before = rss_mb()
+    index = VectorIndex(ids, vectors, texts, metadatas)
+    numpy_search = lambda q: index.query(q, n_results=k, where=where)
+    numpy_ids = numpy_search(queries.tolist())['ids']
+    rows.append({
+        'backend': 'numpy',
+        **time_queries(numpy_search, queries, repeats),
+        'batch_ms_per_query': time_batch(numpy_search, queries),
+        f'recall@{k}': 1.0,
+        'vector_mb': index.memory_bytes / 1e6,
+        'rss_delta_mb': rss_mb() - before
+    })
+
+    # ChromaDB HNSW
+    before = rss_mb()
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name="bench_backends", metadata={"hnsw:space": "cosine"})
+    for i in range(0, len(ids), 1000):
+        collection.add(
+            ids=ids[i:i + 1000],
+            embeddings=vectors[i:i + 1000].tolist(),
+            documents=texts[i:i + 1000],
+            metadatas=metadatas[i:i + 1000]
+        )
+    chroma_search = lambda q: collection.query(query_embeddings=q, n_results=k, where=where)
+    chroma_ids = chroma_search(queries.tolist())['ids']
+    rows.append({
+        'backend': 'chroma',
+        **time_queries(chroma_search, queries, repeats),
+        'batch_ms_per_query': time_batch(chroma_search, queries),
+        f'recall@{k}': recall(numpy_ids, chroma_ids),
+        'vector_mb': vectors.nbytes / 1e6,
+        'rss_delta_mb': rss_mb() - before
+    })
+    client.delete_collection("bench_backends")
+
+    return rows
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', default=str(Path(settings.processed_data_path) / "text_chunks.json"))
+    parser.add_argument('--limit', type=int, default=20000, help="Number of chunks to sample")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    for label, where in [("unfiltered", None), ("type = daily", {"type": "daily"})]:
+        rows = run(Path(args.chunks), args.limit, args.top_k, args.repeats, where)
+
+        print("\n" + "=" * 100)
+        print(f"Vector backend benchmark ({label})")
+        print("=" * 100)
+        headers = list(rows[0].keys())
+        print("  ".join(f"{h:>18}" for h in headers))
+        for row in rows:
+            print("  ".join(
+                f"{row[h]:>18.3f}" if isinstance(row[h], float) else f"{str(row[h]):>18}"
+                for h in headers
+            ))
+        print("=" * 100 + "\n")
+
+
+if __name__ == "__main__":
+    main()
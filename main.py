@@ -2,27 +2,28 @@
 Sephira Institute - Unified API
 Serves both the Sephira Orion frontend and the external financial dashboard.
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from pathlib import Path
+import asyncio
 import json
 import os
 import time
 import numpy as np
 import pandas as pd
 
+from backend.utils.singleflight import SingleFlight, flight_key, normalize_text
+from backend.services.openai_client import get_async_openai_client, close_openai_clients
+from backend.services.accounting import get_usage_ledger
+
 # Load environment variables from .env
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Model configuration
 MODEL = "gpt-5.2"
 
@@ -365,6 +366,18 @@ def get_quant_engine() -> Optional[QuantEngine]:
     return _quant_engine
 
 
+def _dataset_version() -> str:
+    """Identifies the loaded sentiment data, so answers aren't shared across reloads."""
+    qe = get_quant_engine()
+    if qe is None or qe.df is None:
+        return "none"
+    return f"{len(qe.df)}:{qe.df['date'].max().date()}"
+
+
+# Identical concurrent /get_summary and /chat requests share one answer
+_flight = SingleFlight()
+
+
 # ---------------------------------------------------------------------------
 # 24 Priority Countries
 # ---------------------------------------------------------------------------
@@ -467,10 +480,11 @@ app.add_middleware(
 # ---------------------------------------------------------------------------
 _backend_loaded = False
 try:
-    from backend.api.routes import chat as sephira_chat, predictions, data
+    from backend.api.routes import chat as sephira_chat, predictions, data, metrics
     app.include_router(sephira_chat.router)    # /api/chat
     app.include_router(predictions.router)      # /api/predict/*
     app.include_router(data.router)             # /api/data/*
+    app.include_router(metrics.router)          # /metrics
     _backend_loaded = True
     print("Sephira Orion backend routers mounted successfully.")
 except Exception as e:
@@ -478,6 +492,12 @@ except Exception as e:
     print("Falling back to lightweight /api/* endpoints.")
 
 
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Release pooled OpenAI connections."""
+    await close_openai_clients()
+
+
 # ---------------------------------------------------------------------------
 # Health & root endpoints
 # ---------------------------------------------------------------------------
@@ -531,7 +551,7 @@ if not _backend_loaded:
             messages.append({"role": "user", "content": user_content})
 
             t0 = time.time()
-            response = client.chat.completions.create(
+            response = await get_async_openai_client().chat.completions.create(
                 model=MODEL,
                 messages=messages,
                 temperature=0.3,
@@ -559,7 +579,7 @@ if not _backend_loaded:
         country = request.get("country", "Unknown")
         try:
             context = fetch_current_context(country)
-            response = client.chat.completions.create(
+            response = await get_async_openai_client().chat.completions.create(
                 model=MODEL,
                 messages=[
                     {"role": "system", "content": SYSTEM_PROMPT},
@@ -582,7 +602,7 @@ if not _backend_loaded:
     async def fallback_trends(request: dict):
         countries = request.get("countries", [])
         try:
-            response = client.chat.completions.create(
+            response = await get_async_openai_client().chat.completions.create(
                 model=MODEL,
                 messages=[
                     {"role": "system", "content": SYSTEM_PROMPT},
@@ -628,21 +648,57 @@ class DashboardChatRequest(BaseModel):
 # Streaming helpers
 # ---------------------------------------------------------------------------
 
-def _stream_openai(messages, max_tokens=1500):
-    """Generator that yields SSE-formatted chunks from OpenAI streaming."""
+_llm_client = None
+
+def get_llm_client():
+    """Lazy-init the backend LLM client (tool calling + streaming)."""
+    global _llm_client
+    if _llm_client is None:
+        from backend.services.llm_client import LLMClient
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+def _check_budget(user_id: str):
+    """Refuse users over their token budget (429)."""
+    allowed, message = get_usage_ledger().check_budget(user_id)
+    if not allowed:
+        raise HTTPException(status_code=429, detail=message)
+
+
+def _usage(response) -> dict:
+    """Prompt/completion tokens of a non-streaming completion."""
+    if not response.usage:
+        return {}
+    return {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+    }
+
+
+async def _stream_openai(messages, max_tokens=1500, endpoint="stream", user_id="anonymous", started=None):
+    """
+    Async generator that yields SSE-formatted chunks from OpenAI streaming.
+
+    The model may call tools (web search, news, market data) mid-answer; a
+    {'tool': name} frame is sent while each runs, then tokens resume. Token
+    usage is recorded against user_id when the stream ends, however it ends.
+    """
+    started = started or time.time()
+    # Kept current while streaming, so disconnected clients are still charged
+    usage = {}
+    tool_calls = 0
     try:
-        stream = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            temperature=0.3,
-            max_completion_tokens=max_tokens,
-            stream=True,
+        events = get_llm_client().astream_messages(
+            messages, temperature=0.3, max_tokens=max_tokens, model=MODEL, usage=usage
         )
-        for chunk in stream:
-            delta = chunk.choices[0].delta if chunk.choices else None
-            if delta and delta.content:
+        async for event in events:
+            if event['type'] == 'token':
                 # SSE format: data: <content>\n\n
-                yield f"data: {json.dumps({'content': delta.content})}\n\n"
+                yield f"data: {json.dumps({'content': event['content']})}\n\n"
+            elif event['type'] == 'tool':
+                tool_calls += 1
+                yield f"data: {json.dumps({'tool': event['name']})}\n\n"
 
         # Signal end of stream
         yield f"data: {json.dumps({'done': True})}\n\n"
@@ -651,6 +707,15 @@ def _stream_openai(messages, max_tokens=1500):
         print(f"Streaming error: {e}")
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
+    finally:
+        get_usage_ledger().record(
+            endpoint, user_id, MODEL,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0),
+            latency_seconds=time.time() - started,
+            tool_calls=tool_calls,
+        )
+
 
 # ---------------------------------------------------------------------------
 # /get_summary - non-streaming (returns structured JSON)
@@ -713,19 +778,34 @@ def _extract_json(text: str) -> dict:
 
 
 @app.post("/get_summary")
-async def get_summary(request: CountryRequest):
+async def get_summary(request: CountryRequest, http_request: Request):
     """Comprehensive country analysis with current events, risk radar, and equity signals."""
+    started = time.time()
+    user_id = http_request.client.host
+    _check_budget(user_id)
+    key = flight_key(endpoint="get_summary", country=normalize_text(request.country), dataset=_dataset_version())
+    (result, usage), leader = await _flight.do(key, lambda: _generate_summary(request.country))
+    # Coalesced callers share the leader's completion; only the leader is charged
+    get_usage_ledger().record(
+        "/get_summary", user_id, MODEL, latency_seconds=time.time() - started, **(usage if leader else {})
+    )
+    return result
+
+
+async def _generate_summary(country: str) -> tuple:
+    """Returns (response body, token usage)."""
     try:
-        context = fetch_current_context(request.country)
+        # Web search and quant lookups block; keep them off the event loop
+        context = await asyncio.to_thread(fetch_current_context, country)
         if not context:
             context = "(No live web data available; use your training knowledge of recent events.)"
 
         prompt = GET_SUMMARY_USER_PROMPT.format(
-            country=request.country,
+            country=country,
             context=context,
         )
 
-        response = client.chat.completions.create(
+        response = await get_async_openai_client().chat.completions.create(
             model=MODEL,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -750,7 +830,7 @@ async def get_summary(request: CountryRequest):
             "drivers": parsed.get("drivers", []),
             "risk_radar": parsed.get("risk_radar", []),
             "equity_signal": parsed.get("equity_signal", ""),
-        }
+        }, _usage(response)
 
     except Exception as e:
         print(f"OpenAI error in /get_summary: {e}")
@@ -762,7 +842,7 @@ async def get_summary(request: CountryRequest):
             "drivers": [],
             "risk_radar": [],
             "equity_signal": "",
-        }
+        }, {}
 
 
 # ---------------------------------------------------------------------------
@@ -780,20 +860,40 @@ Answer in continuous prose (no section headers or labels). Open by citing the cu
 
 
 @app.post("/chat")
-async def dashboard_chat(request: DashboardChatRequest):
+async def dashboard_chat(request: DashboardChatRequest, http_request: Request):
     """Answer a financial question with current events and structured analysis."""
+    started = time.time()
+    user_id = http_request.client.host
+    _check_budget(user_id)
+    key = flight_key(
+        endpoint="chat",
+        country=normalize_text(request.country),
+        question=normalize_text(request.user_question),
+        dataset=_dataset_version(),
+    )
+    (result, usage), leader = await _flight.do(
+        key, lambda: _generate_chat_answer(request.country, request.user_question)
+    )
+    get_usage_ledger().record(
+        "/chat", user_id, MODEL, latency_seconds=time.time() - started, **(usage if leader else {})
+    )
+    return result
+
+
+async def _generate_chat_answer(country: str, user_question: str) -> tuple:
+    """Returns (response body, token usage)."""
     try:
-        context = fetch_current_context(request.country)
+        context = await asyncio.to_thread(fetch_current_context, country)
         if not context:
             context = "(No live web data available; use your training knowledge of recent events.)"
 
         prompt = CHAT_USER_PROMPT.format(
-            country=request.country,
+            country=country,
             context=context,
-            question=request.user_question,
+            question=user_question,
         )
 
-        response = client.chat.completions.create(
+        response = await get_async_openai_client().chat.completions.create(
             model=MODEL,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -803,11 +903,11 @@ async def dashboard_chat(request: DashboardChatRequest):
             max_completion_tokens=1500,
         )
 
-        return {"answer": response.choices[0].message.content}
+        return {"answer": response.choices[0].message.content}, _usage(response)
 
     except Exception as e:
         print(f"OpenAI error in /chat: {e}")
-        return {"answer": "Unable to generate a response at this time. Please try again later."}
+        return {"answer": "Unable to generate a response at this time. Please try again later."}, {}
 
 
 # ---------------------------------------------------------------------------
@@ -815,9 +915,12 @@ async def dashboard_chat(request: DashboardChatRequest):
 # ---------------------------------------------------------------------------
 
 @app.post("/chat/stream")
-async def dashboard_chat_stream(request: DashboardChatRequest):
+async def dashboard_chat_stream(request: DashboardChatRequest, http_request: Request):
     """Streaming version of /chat. Returns Server-Sent Events with tokens in real-time."""
-    context = fetch_current_context(request.country)
+    started = time.time()
+    user_id = http_request.client.host
+    _check_budget(user_id)
+    context = await asyncio.to_thread(fetch_current_context, request.country)
     if not context:
         context = "(No live web data available; use your training knowledge of recent events.)"
 
@@ -833,7 +936,7 @@ async def dashboard_chat_stream(request: DashboardChatRequest):
     ]
 
     return StreamingResponse(
-        _stream_openai(messages, max_tokens=1000),
+        _stream_openai(messages, max_tokens=1000, endpoint="/chat/stream", user_id=user_id, started=started),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -855,9 +958,12 @@ Provide a comprehensive analysis in continuous prose (no headers or labels). Ope
 
 
 @app.post("/get_summary/stream")
-async def get_summary_stream(request: CountryRequest):
+async def get_summary_stream(request: CountryRequest, http_request: Request):
     """Streaming version of /get_summary. Returns SSE with analysis text in real-time."""
-    context = fetch_current_context(request.country)
+    started = time.time()
+    user_id = http_request.client.host
+    _check_budget(user_id)
+    context = await asyncio.to_thread(fetch_current_context, request.country)
     if not context:
         context = "(No live web data available; use your training knowledge of recent events.)"
 
@@ -872,7 +978,7 @@ async def get_summary_stream(request: CountryRequest):
     ]
 
     return StreamingResponse(
-        _stream_openai(messages, max_tokens=1000),
+        _stream_openai(messages, max_tokens=1000, endpoint="/get_summary/stream", user_id=user_id, started=started),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -8,6 +8,9 @@ import sys
 # Add backend to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Settings require an API key; tests never call OpenAI directly
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
 
 @pytest.fixture(scope="session")
 def test_config():
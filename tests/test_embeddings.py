@@ -0,0 +1,640 @@
+"""
+Tests for embedding providers and the vector database service
+"""
+import pytest
+import numpy as np
+from unittest.mock import patch
+from backend.services.embedding_providers import HashingEmbeddingProvider
+from backend.services.embeddings import EmbeddingService
+from backend.services.indexer import ChunkIndexer
+from backend.services.vector_index import VectorIndex
+from backend.services.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+from backend.utils.vector_codec import (
+    truncate_dimensions, quantize, dequantize, load_vector_snapshot, save_vector_snapshot,
+    current_export, write_json
+)
+
+
+@pytest.fixture
+def embedding_service(tmp_path):
+    """Embedding service backed by offline hashing vectors and a temporary ChromaDB"""
+    service = EmbeddingService(provider=HashingEmbeddingProvider(dimensions=128))
+    service.settings = service.settings.model_copy(update={'chromadb_path': str(tmp_path / "chroma")})
+    return service
+
+
+@pytest.fixture
+def sample_chunks():
+    """Small chunk corpus in the shape produced by SentimentChunker"""
+    return [
+        {
+            'chunk_id': 'daily_2020-03-15',
+            'text': 'On 2020-03-15, sentiment data: | Japan: 5.12 | United States: 6.40',
+            'metadata': {'type': 'daily', 'date': '2020-03-15'}
+        },
+        {
+            'chunk_id': 'monthly_2020-03',
+            'text': 'Month of 2020-03: | Japan: mean=5.20, range=[5.01, 5.44]',
+            'metadata': {'type': 'monthly', 'month': '2020-03'}
+        },
+        {
+            'chunk_id': 'country_summary_Germany',
+            'text': 'Country: Germany. Overall statistics: mean=6.80, std=0.30. Overall trend: increasing.',
+            'metadata': {'type': 'country_summary', 'country': 'Germany'}
+        }
+    ]
+
+
+class TestHashingEmbeddingProvider:
+    """Test the deterministic offline embedding backend"""
+    
+    def test_deterministic(self):
+        """Same text always maps to the same vector, across instances"""
+        a = HashingEmbeddingProvider(dimensions=64).embed(["Japan sentiment in March"])
+        b = HashingEmbeddingProvider(dimensions=64).embed(["Japan sentiment in March"])
+        
+        assert a == b
+        assert len(a[0]) == 64
+    
+    def test_normalized(self):
+        """Vectors are unit length so cosine distance is meaningful"""
+        vectors = HashingEmbeddingProvider(dimensions=64).embed(["United States trend", "Germany"])
+        
+        for vector in vectors:
+            assert np.linalg.norm(vector) == pytest.approx(1.0, abs=1e-5)
+    
+    def test_similar_texts_are_closer(self):
+        """Texts sharing terms score higher than unrelated ones"""
+        provider = HashingEmbeddingProvider(dimensions=256)
+        query, related, unrelated = np.array(provider.embed([
+            "Japan sentiment March 2020",
+            "Japan sentiment data for March 2020",
+            "Germany overall trend increasing"
+        ]))
+        
+        assert query @ related > query @ unrelated
+
+
+class TestEmbeddingService:
+    """Test the ingest -> query path without network access"""
+    
+    def test_ingest_and_query(self, embedding_service, sample_chunks):
+        """Chunks added offline can be retrieved by similarity"""
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        
+        results = embedding_service.query_similar_chunks("Germany overall trend", top_k=2)
+        
+        assert len(results['ids']) == 2
+        assert results['ids'][0] == 'country_summary_Germany'
+        assert 'embeddings' not in results
+    
+    def test_query_includes_embeddings(self, embedding_service, sample_chunks):
+        """Chunk vectors can be returned alongside results for MMR reranking"""
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        
+        results = embedding_service.query_similar_chunks("Germany overall trend", top_k=2, include_embeddings=True)
+        
+        assert len(results['embeddings']) == 2
+        assert len(results['embeddings'][0]) == 128
+    
+    def test_collection_records_provider(self, embedding_service):
+        """New collections remember which provider produced their vectors"""
+        collection = embedding_service.initialize_chromadb()
+        
+        assert collection.metadata['embedding_model'] == 'hashing:128'
+    
+    def test_export_vector_snapshot(self, embedding_service, sample_chunks, tmp_path):
+        """Collection can be written to a compact memory-mappable snapshot"""
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        
+        manifest = embedding_service.export_vector_snapshot(str(tmp_path / "vectors"), dtype="float16")
+        snapshot = load_vector_snapshot(str(tmp_path / "vectors"))
+        
+        assert manifest['count'] == 3
+        assert manifest['dimensions'] == 128
+        assert snapshot['vectors'].dtype == np.float16
+        assert sorted(snapshot['ids']) == sorted(c['chunk_id'] for c in sample_chunks)
+
+    
+    def test_filtered_query(self, embedding_service):
+        """Country and date filters are pushed down into ChromaDB"""
+        import pandas as pd
+        from backend.utils.chunking import SentimentChunker
+        from backend.utils.metadata import build_where_filter
+        
+        df = pd.DataFrame({
+            'date': pd.date_range('2020-02-25', periods=10),
+            'Japan': [5.0 + i * 0.1 for i in range(10)],
+            'Germany': [6.0] * 6 + [None] * 4
+        })
+        chunks = SentimentChunker(df).create_daily_chunks()
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(chunks)
+        
+        where = build_where_filter(countries=['Germany'], start_date='2020-03-01', end_date='2020-03-31')
+        results = embedding_service.query_similar_chunks("Germany sentiment", top_k=10, filter_dict=where)
+        
+        assert sorted(results['ids']) == ['daily_2020-03-01']
+
+    
+    def test_batch_query_matches_single_queries(self, embedding_service, sample_chunks):
+        """Batched retrieval embeds once and returns per-query results"""
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        queries = ["Japan sentiment March", "Germany overall trend"]
+        
+        with patch.object(embedding_service.provider, 'embed', wraps=embedding_service.provider.embed) as embed:
+            batch = embedding_service.query_similar_chunks_batch(queries, top_k=2)
+        
+        assert embed.call_count == 1
+        for query, results in zip(queries, batch):
+            assert results['ids'] == embedding_service.query_similar_chunks(query, top_k=2)['ids']
+    
+    def test_batch_query_fuses_keyword_results(self, embedding_service, sample_chunks, tmp_path):
+        """With a BM25 index loaded, batched and single queries still rank alike"""
+        embedding_service.settings = embedding_service.settings.model_copy(update={
+            'bm25_index_path': str(tmp_path / "bm25")
+        })
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        embedding_service.export_bm25_index()
+        embedding_service.load_bm25_index()
+        queries = ["Germany std 0.30", "Japan 5.12", "monthly mean"]
+        filters = [None, {'type': 'daily'}, None]
+        
+        batch = embedding_service.query_similar_chunks_batch(queries, top_k=2, filters=filters)
+        
+        assert batch[0]['ids'][0] == 'country_summary_Germany'
+        for query, filter_dict, results in zip(queries, filters, batch):
+            single = embedding_service.query_similar_chunks(query, top_k=2, filter_dict=filter_dict)
+            assert results['ids'] == single['ids']
+            assert results['distances'] == single['distances']
+    
+    def test_batch_query_per_query_filters(self, embedding_service, sample_chunks):
+        """Each query can carry its own where clause"""
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        
+        batch = embedding_service.query_similar_chunks_batch(
+            ["sentiment", "sentiment", "sentiment"],
+            top_k=3,
+            filters=[{'type': 'daily'}, None, {'type': 'monthly'}]
+        )
+        
+        assert batch[0]['ids'] == ['daily_2020-03-15']
+        assert len(batch[1]['ids']) == 3
+        assert batch[2]['ids'] == ['monthly_2020-03']
+        
+        with pytest.raises(ValueError):
+            embedding_service.query_similar_chunks_batch(["a", "b"], filters=[None])
+
+    
+    def test_get_chunks_by_ids(self, embedding_service, sample_chunks):
+        """Chunks are fetched by ID in request order, skipping unknown IDs"""
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        
+        with patch.object(embedding_service.provider, 'embed') as embed:
+            results = embedding_service.get_chunks_by_ids(
+                ['country_summary_Germany', 'daily_1999-01-01', 'daily_2020-03-15']
+            )
+        
+        embed.assert_not_called()
+        assert results['ids'] == ['country_summary_Germany', 'daily_2020-03-15']
+        assert results['documents'][1] == sample_chunks[0]['text']
+        assert results['distances'] == [0.0, 0.0]
+
+
+class TestVectorCodec:
+    """Test reduced-dimension and compact vector storage"""
+    
+    def test_truncate_dimensions_renormalizes(self):
+        """Shortened vectors stay unit length"""
+        vectors = np.random.randn(5, 64).astype(np.float32)
+        
+        shortened = truncate_dimensions(vectors, 16)
+        
+        assert shortened.shape == (5, 16)
+        assert np.allclose(np.linalg.norm(shortened, axis=1), 1.0, atol=1e-5)
+    
+    @pytest.mark.parametrize("dtype,tolerance", [("float32", 0), ("float16", 1e-3), ("int8", 2e-2)])
+    def test_quantize_roundtrip(self, dtype, tolerance):
+        """Compact dtypes decode close to the original vectors"""
+        vectors = truncate_dimensions(np.random.randn(10, 32), 32)
+        
+        encoded, scales = quantize(vectors, dtype)
+        decoded = dequantize(encoded, scales)
+        
+        assert encoded.dtype == np.dtype(dtype)
+        assert np.abs(decoded - vectors).max() <= tolerance + 1e-7
+    
+    def test_unknown_dtype_rejected(self):
+        """Only supported storage dtypes are accepted"""
+        with pytest.raises(ValueError):
+            quantize(np.zeros((1, 4)), "bfloat16")
+    
+    def test_snapshot_exports_swap_atomically(self, tmp_path):
+        """Each export lands in its own directory; a failed export publishes nothing"""
+        directory = str(tmp_path / "vectors")
+        save_vector_snapshot(directory, ['a'], np.ones((1, 4)), ['doc a'], [{}])
+        first = current_export(directory)
+        save_vector_snapshot(directory, ['a', 'b'], np.ones((2, 4)), ['doc a', 'doc b'], [{}, {}])
+        
+        with patch('backend.utils.vector_codec.write_json', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                save_vector_snapshot(directory, ['c'], np.ones((1, 4)), ['doc c'], [{}])
+        
+        assert current_export(directory) != first
+        assert load_vector_snapshot(directory)['ids'] == ['a', 'b']
+        assert (tmp_path / "vectors" / first / "ids.json").exists()
+        assert not list((tmp_path / "vectors").glob(".*.tmp"))
+    
+    def test_inconsistent_snapshot_rejected(self, tmp_path):
+        """Records that disagree with the manifest count are never served"""
+        directory = tmp_path / "vectors"
+        save_vector_snapshot(str(directory), ['a', 'b'], np.ones((2, 4)), ['doc a', 'doc b'], [{}, {}])
+        write_json(directory / current_export(str(directory)) / "ids.json", ['a'])
+        
+        with pytest.raises(ValueError):
+            load_vector_snapshot(str(directory))
+
+
+class TestChunkIndexer:
+    """Test resumable upsert-based ingestion"""
+    
+    @pytest.fixture
+    def indexer(self, embedding_service, tmp_path):
+        return ChunkIndexer(
+            embedding_service=embedding_service,
+            checkpoint_path=str(tmp_path / "checkpoint.json"),
+            batch_size=1
+        )
+    
+    def test_rerun_is_idempotent(self, indexer, sample_chunks):
+        """A second run over unchanged chunks embeds nothing"""
+        first = indexer.run(sample_chunks)
+        second = indexer.run(sample_chunks, reset=True)
+        
+        assert first['upserted'] == 3
+        assert second['upserted'] == 0
+        assert second['skipped'] == 3
+        assert indexer.embedding_service.collection.count() == 3
+    
+    def test_resume_after_failure(self, indexer, sample_chunks):
+        """A crashed run resumes after the last committed batch"""
+        service = indexer.embedding_service
+        original = service.generate_embeddings_batch
+        calls = {'n': 0}
+        
+        def flaky(texts, batch_size=100):
+            calls['n'] += 1
+            if calls['n'] == 2:
+                raise RuntimeError("embedding API down")
+            return original(texts, batch_size=batch_size)
+        
+        with patch.object(service, 'generate_embeddings_batch', side_effect=flaky):
+            with pytest.raises(RuntimeError):
+                indexer.run(sample_chunks)
+        
+        assert indexer.load_checkpoint()['next_offset'] == 1
+        
+        with patch.object(service, 'generate_embeddings_batch', wraps=original) as embed:
+            stats = indexer.run(sample_chunks)
+        
+        assert embed.call_count == 2
+        assert stats['upserted'] == 2
+        assert service.collection.count() == 3
+    
+    def test_changed_and_stale_chunks(self, indexer, sample_chunks):
+        """Changed chunks are re-embedded and removed chunks are deleted"""
+        indexer.run(sample_chunks)
+        
+        updated = [dict(sample_chunks[0], text=sample_chunks[0]['text'] + ' | Germany: 6.90'), sample_chunks[1]]
+        stats = indexer.run(updated)
+        
+        assert stats['upserted'] == 1
+        assert stats['deleted'] == 1
+        assert indexer.embedding_service.collection.get(ids=['country_summary_Germany'])['ids'] == []
+
+    
+    def test_blue_green_rebuild(self, indexer, sample_chunks):
+        """Rebuilds go into new versions, flip the alias and reuse unchanged vectors"""
+        first = indexer.rebuild(sample_chunks)
+        second = indexer.rebuild(sample_chunks)
+        third = indexer.rebuild(sample_chunks, keep_versions=2)
+        service = indexer.embedding_service
+        
+        assert first['collection'] == 'sentiment_data_v1'
+        assert second['copied'] == 3
+        assert second['upserted'] == 0
+        assert third['deleted_versions'] == ['sentiment_data_v1']
+        assert service.collection_name == 'sentiment_data_v3'
+        assert service.aliases.resolve('sentiment_data') == 'sentiment_data_v3'
+    
+    def test_failed_validation_keeps_live_alias(self, indexer, sample_chunks):
+        """A build that fails its smoke test is never made live"""
+        indexer.rebuild(sample_chunks)
+        
+        with patch.object(indexer, 'validate', return_value=(False, ['broken'])):
+            with pytest.raises(RuntimeError):
+                indexer.rebuild(sample_chunks)
+        
+        service = indexer.embedding_service
+        assert service.aliases.resolve('sentiment_data') == 'sentiment_data_v1'
+        assert 'sentiment_data_v2' not in service.list_collection_names()
+        assert not indexer.checkpoint_path.exists()
+        
+        # The failed build must not push the rollback version out of the keep window
+        for _ in range(2):
+            with patch.object(indexer, 'validate', return_value=(False, ['broken'])):
+                with pytest.raises(RuntimeError):
+                    indexer.rebuild(sample_chunks)
+        stats = indexer.rebuild(sample_chunks, keep_versions=2)
+        
+        assert service.aliases.resolve('sentiment_data') == stats['collection'] == 'sentiment_data_v2'
+        assert 'sentiment_data_v1' not in stats['deleted_versions']
+        assert {'sentiment_data_v1', 'sentiment_data_v2'} <= set(service.list_collection_names())
+    
+    def test_serving_service_follows_alias(self, indexer, sample_chunks, embedding_service):
+        """A serving EmbeddingService switches collections after a flip"""
+        indexer.rebuild(sample_chunks)
+        serving = EmbeddingService(provider=embedding_service.provider)
+        serving.settings = embedding_service.settings
+        serving.initialize_chromadb()
+        
+        indexer.rebuild(sample_chunks[:2])
+        results = serving.query_similar_chunks("Japan sentiment", top_k=3)
+        
+        assert serving.collection_name == 'sentiment_data_v2'
+        assert len(results['ids']) == 2
+
+
+class TestCollectionStats:
+    """Test the incrementally maintained stats sidecar"""
+    
+    @pytest.fixture
+    def indexer(self, embedding_service, tmp_path):
+        return ChunkIndexer(
+            embedding_service=embedding_service,
+            checkpoint_path=str(tmp_path / "checkpoint.json"),
+            batch_size=2
+        )
+    
+    def test_stats_after_ingest(self, indexer, sample_chunks):
+        """Ingestion records exact per-type counts, tokens and the model"""
+        indexer.run(sample_chunks)
+        service = indexer.embedding_service
+        
+        with patch.object(service.collection, 'get', side_effect=AssertionError("scan")):
+            stats = service.get_collection_stats()
+        
+        assert stats['total_chunks'] == 3
+        assert stats['chunk_types'] == {'country_summary': 1, 'daily': 1, 'monthly': 1}
+        assert stats['total_tokens'] > 0
+        assert stats['embedding_model'] == 'hashing:128'
+        assert stats['dimensions'] == 128
+        assert stats['build_version'] == 1
+    
+    def test_store_closes_connections(self, tmp_path):
+        """Every read and write closes its SQLite connection instead of leaking it"""
+        import sqlite3
+        from backend.services.collection_stats import CollectionStatsStore
+        
+        store = CollectionStatsStore(str(tmp_path))
+        connect, opened = sqlite3.connect, []
+        with patch('backend.services.collection_stats.sqlite3.connect',
+                   side_effect=lambda *args, **kwargs: opened.append(connect(*args, **kwargs)) or opened[-1]):
+            store.record_chunks('c', ['a'], ['text'], [{'type': 'daily'}])
+            store.set_info('c', embedding_model='hashing:128', bump_version=True)
+            assert store.count('c') == 1
+        
+        assert len(opened) == 3
+        for conn in opened:
+            with pytest.raises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+    
+    def test_stats_track_updates_and_deletes(self, indexer, sample_chunks):
+        """Re-runs adjust counts incrementally and bump the build version"""
+        indexer.run(sample_chunks)
+        indexer.run(sample_chunks[:2] + [dict(sample_chunks[0], chunk_id='daily_2020-03-16')])
+        
+        stats = indexer.embedding_service.get_collection_stats()
+        
+        assert stats['chunk_types'] == {'daily': 2, 'monthly': 1}
+        assert stats['build_version'] == 2
+    
+    def test_legacy_collection_is_reconciled(self, embedding_service, sample_chunks):
+        """Collections indexed before the sidecar are scanned once"""
+        embedding_service.initialize_chromadb()
+        embedding_service.collection.add(
+            ids=[c['chunk_id'] for c in sample_chunks],
+            embeddings=embedding_service.generate_embeddings_batch([c['text'] for c in sample_chunks]),
+            documents=[c['text'] for c in sample_chunks],
+            metadatas=[c['metadata'] for c in sample_chunks]
+        )
+        
+        stats = embedding_service.get_collection_stats()
+        
+        assert stats['total_chunks'] == 3
+        assert stats['dimensions'] == 128
+    
+    def test_dataset_version_changes_on_ingest(self, indexer, sample_chunks):
+        """Answer caches keyed on dataset_version are invalidated by re-ingestion"""
+        indexer.run(sample_chunks)
+        before = indexer.embedding_service.dataset_version()
+        indexer.run(sample_chunks[:2])
+        
+        assert indexer.embedding_service.dataset_version() != before
+    
+    def test_blue_green_versions_have_own_stats(self, indexer, sample_chunks):
+        """Each physical collection has its own stats and GC drops them"""
+        indexer.rebuild(sample_chunks)
+        indexer.rebuild(sample_chunks[:2], keep_versions=1)
+        store = indexer.embedding_service.stats_store
+        
+        assert indexer.embedding_service.get_collection_stats()['total_chunks'] == 2
+        assert store.get('sentiment_data_v1') is None
+
+
+class TestVectorIndex:
+    """Test the in-process exact NumPy index"""
+    
+    @pytest.fixture
+    def index(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(50, 16)).astype(np.float32)
+        metadatas = [
+            {'type': 'daily' if i % 2 else 'monthly', 'date_ord': 737000 + i}
+            for i in range(50)
+        ]
+        return VectorIndex(
+            [f"chunk_{i}" for i in range(50)], vectors,
+            [f"doc {i}" for i in range(50)], metadatas
+        )
+    
+    def test_exact_top_k(self, index):
+        """Results match brute-force cosine ranking"""
+        query = index.vectors[7] + 0.01
+        
+        results = index.query([query.tolist()], n_results=5)
+        
+        normalized = index.vectors / np.linalg.norm(index.vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+        assert results['ids'][0] == [f"chunk_{i}" for i in expected]
+        assert results['ids'][0][0] == 'chunk_7'
+        assert results['distances'][0] == sorted(results['distances'][0])
+        
+        with_vectors = index.query([query.tolist()], n_results=5, include_embeddings=True)
+        assert np.allclose(with_vectors['embeddings'][0], index.vectors[expected])
+    
+    def test_metadata_prefilter(self, index):
+        """Where clauses restrict the candidate set before scoring"""
+        where = {'$and': [{'type': 'daily'}, {'date_ord': {'$gte': 737010}}]}
+        
+        results = index.query([index.vectors[0].tolist()], n_results=50, where=where)
+        
+        assert len(results['ids'][0]) == 20
+        assert all(m['type'] == 'daily' and m['date_ord'] >= 737010 for m in results['metadatas'][0])
+    
+    def test_batch_queries(self, index):
+        """One call answers several queries, and an empty filter result is handled"""
+        results = index.query(index.vectors[:3].tolist(), n_results=2)
+        empty = index.query(index.vectors[:2].tolist(), n_results=2, where={'type': {'$in': ['weekly']}})
+        
+        assert [ids[0] for ids in results['ids']] == ['chunk_0', 'chunk_1', 'chunk_2']
+        assert empty['ids'] == [[], []]
+    
+    def test_numpy_backend_in_service(self, embedding_service, sample_chunks, tmp_path):
+        """EmbeddingService serves queries from the snapshot when configured"""
+        embedding_service.settings = embedding_service.settings.model_copy(update={
+            'vector_backend': 'numpy',
+            'vector_snapshot_path': str(tmp_path / "vectors")
+        })
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        embedding_service.export_vector_snapshot(dtype="int8")
+        embedding_service.load_vector_index()
+        
+        results = embedding_service.query_similar_chunks("Germany overall trend", top_k=1)
+        
+        assert embedding_service.vector_index is not None
+        assert results['ids'] == ['country_summary_Germany']
+        assert embedding_service.get_chunks_by_ids(['monthly_2020-03'])['ids'] == ['monthly_2020-03']
+    
+    def test_snapshot_of_other_collection_not_served(self, embedding_service, sample_chunks, tmp_path):
+        """After an alias flip, a snapshot of the previous collection is bypassed"""
+        embedding_service.settings = embedding_service.settings.model_copy(update={
+            'vector_backend': 'numpy',
+            'vector_snapshot_path': str(tmp_path / "vectors")
+        })
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        embedding_service.export_vector_snapshot()
+        embedding_service.load_vector_index()
+        embedding_service.vector_index.collection = 'sentiment_data_v0'
+        
+        with patch.object(embedding_service.vector_index, 'query', side_effect=AssertionError("stale snapshot")):
+            results = embedding_service.query_similar_chunks("Germany overall trend", top_k=1)
+        
+        assert results['ids'] == ['country_summary_Germany']
+
+
+
+class TestBM25Index:
+    """Test keyword search and its fusion with vector results"""
+    
+    @pytest.fixture
+    def index(self, sample_chunks):
+        return BM25Index.build(
+            [c['chunk_id'] for c in sample_chunks],
+            [c['text'] for c in sample_chunks],
+            [c['metadata'] for c in sample_chunks]
+        )
+    
+    def test_tokens_keep_dates_and_numbers(self):
+        """Dates and decimal readings stay whole tokens"""
+        assert tokenize("On 2020-03-15: Japan 5.12.") == ['on', '2020-03-15', 'japan', '5.12']
+    
+    def test_exact_tokens_ranked_first(self, index):
+        """A reading or date named in the query finds the chunk containing it"""
+        assert index.query("What was Japan at 5.12?", n_results=3)['ids'][0] == 'daily_2020-03-15'
+        assert index.query("2020-03 monthly mean", n_results=3)['ids'][0] == 'monthly_2020-03'
+        assert index.query("Brazil", n_results=3)['ids'] == []
+    
+    def test_where_filter(self, index):
+        """Metadata filters apply like in ChromaDB"""
+        results = index.query("Japan", n_results=3, where={'type': 'monthly'})
+        
+        assert results['ids'] == ['monthly_2020-03']
+    
+    def test_save_and_load(self, index, tmp_path):
+        """A saved index is memory-mapped back with identical scores"""
+        index.save(str(tmp_path / "bm25"))
+        loaded = BM25Index.load(str(tmp_path / "bm25"))
+        
+        assert isinstance(loaded.postings, np.memmap)
+        assert np.allclose(loaded.scores("Japan 5.12 trend"), index.scores("Japan 5.12 trend"))
+    
+    def test_saves_swap_atomically(self, index, sample_chunks, tmp_path):
+        """A reload never pairs postings from one save with records from another"""
+        directory = str(tmp_path / "bm25")
+        index.save(directory)
+        first = current_export(directory)
+        smaller = BM25Index.build(['monthly_2020-03'], [sample_chunks[1]['text']], [sample_chunks[1]['metadata']])
+        
+        with patch('backend.utils.vector_codec.os.rename', side_effect=OSError("interrupted")):
+            with pytest.raises(OSError):
+                smaller.save(directory)
+        assert current_export(directory) == first
+        assert len(BM25Index.load(directory)) == 3
+        
+        smaller.save(directory)
+        assert BM25Index.load(directory).query("Japan", n_results=3)['ids'] == ['monthly_2020-03']
+    
+    def test_reciprocal_rank_fusion(self):
+        """IDs ranked well in both lists beat IDs ranked first in only one"""
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd']], k=60)
+        
+        assert [chunk_id for chunk_id, _ in fused] == ['b', 'a', 'd', 'c']
+    
+    def test_hybrid_search_in_service(self, embedding_service, sample_chunks, tmp_path):
+        """Keyword hits are fused into vector results once the index is built"""
+        embedding_service.settings = embedding_service.settings.model_copy(update={
+            'bm25_index_path': str(tmp_path / "bm25")
+        })
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        embedding_service.export_bm25_index()
+        embedding_service.load_bm25_index()
+        
+        results = embedding_service.query_similar_chunks(
+            "Germany std 0.30", top_k=2, include_embeddings=True
+        )
+        
+        assert results['ids'][0] == 'country_summary_Germany'
+        assert results['distances'][0] == 0.0
+        assert len(results['embeddings']) == len(results['ids']) == 2
+        assert embedding_service.bm25_index.collection == embedding_service.collection_name
+    
+    def test_index_of_other_collection_not_fused(self, embedding_service, sample_chunks, tmp_path):
+        """Keyword hits from a collection that is no longer live are ignored"""
+        embedding_service.settings = embedding_service.settings.model_copy(update={
+            'bm25_index_path': str(tmp_path / "bm25")
+        })
+        embedding_service.initialize_chromadb()
+        embedding_service.add_chunks_to_db(sample_chunks)
+        embedding_service.export_bm25_index()
+        embedding_service.load_bm25_index()
+        embedding_service.bm25_index.collection = 'sentiment_data_v0'
+        
+        with patch.object(embedding_service, '_fuse_keyword_results', side_effect=AssertionError("stale index")):
+            results = embedding_service.query_similar_chunks("Germany std 0.30", top_k=2)
+        
+        assert len(results['ids']) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
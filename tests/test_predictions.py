@@ -6,6 +6,7 @@ import pandas as pd
 import numpy as np
 from unittest.mock import Mock, patch
 from backend.models.predictor import SentimentPredictor
+from backend.models.quant_snapshot import QuantSnapshot
 
 
 class TestSentimentPredictor:
@@ -134,6 +135,69 @@ class TestSentimentPredictor:
         assert all(tp['type'] in ['peak', 'trough'] for tp in turning_points)
 
 
+class TestQuantSnapshot:
+    """Test numeric snapshots used for chat routing"""
+    
+    @pytest.fixture
+    def snapshot(self):
+        """Rising US, falling UK mirror, flat Japan with one spike"""
+        rng = np.random.default_rng(0)
+        dates = pd.date_range('2020-01-01', periods=400)
+        trend = np.linspace(0, 2, 400)
+        japan = rng.normal(5.0, 0.05, 400)
+        japan[-10] = 8.0
+        df = pd.DataFrame({
+            'date': dates,
+            'United States': 5.0 + trend + rng.normal(0, 0.01, 400),
+            'United Kingdom': 7.0 - trend + rng.normal(0, 0.01, 400),
+            'Japan': japan
+        })
+        return QuantSnapshot(df)
+    
+    def test_snapshot_and_forecast(self, snapshot):
+        """Test trend detection and forecast direction"""
+        us = snapshot.snapshot('United States')
+        assert us['trend'] == 'rising'
+        assert us['latest_date'] == '2021-02-03'
+        assert us['percentile'] > 95
+        
+        forecast = snapshot.forecast('United Kingdom')
+        assert forecast['direction'] == 'down'
+        assert forecast['projected_change'] < 0
+        assert snapshot.forecast('United Kingdom') is forecast
+        assert snapshot.forecast('Atlantis') is None
+    
+    def test_anomalies_and_correlations(self, snapshot):
+        """Test anomaly detection and correlation ranking"""
+        anomalies = snapshot.anomalies('Japan')
+        assert anomalies[0]['date'] == '2021-01-25'
+        assert anomalies[0]['z_score'] > 2.5
+        
+        corrs = snapshot.correlations('United States')
+        assert corrs[0]['country'] == 'United Kingdom'
+        assert corrs[0]['correlation'] < -0.99
+        
+        pair = snapshot.strongest_pairs(n=1)[0]
+        assert {pair['country1'], pair['country2']} == {'United States', 'United Kingdom'}
+    
+    def test_build_context(self, snapshot):
+        """Test per-intent context sections"""
+        forecast = snapshot.build_context('forecast', ['United States'])
+        assert forecast[0][0] == 'United States'
+        assert 'Forecast (30d' in forecast[0][1]
+        
+        # A forecast needs a country; trends fall back to top movers
+        assert snapshot.build_context('forecast', []) == []
+        assert snapshot.build_context('trend', [])[0][0] == 'all'
+        
+        correlation = snapshot.build_context('correlation', ['United States', 'Japan'])
+        assert [subject for subject, _ in correlation] == ['United States', 'Japan', 'pairs']
+        
+        anomaly = snapshot.build_context('anomaly', [])
+        assert '2021-01-25 Japan' in anomaly[0][1]
+        assert snapshot.build_context('unknown', ['Japan']) == []
+
+
 class TestDataLoader:
     """Test data loader functionality"""
     